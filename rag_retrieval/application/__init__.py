@@ -1,8 +1,30 @@
 from flask import Flask
-from .routes import bp as rag_bp
+from .routes import bp as rag_bp, chat_options
+from .services import warm_up_chat_model
+from rag_retrieval.config.settings import Settings
+from rag_retrieval.db.weaviate_db import WeaviateConnection
+import atexit
 
 
 def create_app():
     app = Flask(__name__)
+
+    # Kết nối Weaviate dùng chung cho mọi request, đóng khi process kết thúc
+    weaviate_conn = WeaviateConnection(
+        host=Settings.WEAVIATE_HOST,
+        http_port=Settings.WEAVIATE_PORT,
+        health_check_interval=Settings.WEAVIATE_HEALTH_CHECK_S
+    )
+    app.extensions["weaviate"] = weaviate_conn
+    atexit.register(weaviate_conn.close)
+    try:
+        weaviate_conn.get()
+    except ConnectionError as e:
+        # Không chặn app khởi động; request đầu tiên sẽ thử kết nối lại
+        print(f"Cảnh báo: {e}")
+
+    if Settings.CHAT_WARMUP:
+        warm_up_chat_model((Settings.CHAT_PROVIDER, Settings.CHAT_MODEL), chat_options())
+
     app.register_blueprint(rag_bp)
     return app
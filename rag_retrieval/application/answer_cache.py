@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import itertools
+import threading
+import time
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời của pipeline theo độ tương đồng cosine giữa embedding của các câu hỏi.
+    Index trong bộ nhớ (ma trận numpy đã chuẩn hóa, tính dot product toàn bộ) cho từng namespace,
+    namespace gồm collection và các tham số ảnh hưởng tới câu trả lời.
+    Có LRU (`max_entries`), TTL (`ttl_s`) và bị xóa theo collection khi fingerprint của collection thay đổi.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_s: float = 3600.0, threshold: float = 0.95,
+                 fingerprint_interval_s: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.fingerprint_interval_s = fingerprint_interval_s
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._index: Dict[str, Tuple[List[int], Optional[np.ndarray]]] = {}
+        self._fingerprints: Dict[str, Tuple[Any, float]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def claim_fingerprint(self, collection: str) -> bool:
+        """
+        True nếu đã quá `fingerprint_interval_s` kể từ lần kiểm tra fingerprint cuối của collection, chỉ cho một caller:
+        thời điểm kiểm tra được ghi ngay nên các request đồng thời không tính lại mà dùng fingerprint hiện có.
+        """
+        with self._lock:
+            checked = self._fingerprints.get(collection)
+            now = time.monotonic()
+            if checked is not None and now - checked[1] <= self.fingerprint_interval_s:
+                return False
+            self._fingerprints[collection] = (checked[0] if checked is not None else None, now)
+            return True
+
+    def update_fingerprint(self, collection: str, fingerprint: Any):
+        """Ghi nhận fingerprint mới; nếu khác lần trước thì xóa mọi câu trả lời của collection đó."""
+        with self._lock:
+            previous = self._fingerprints.get(collection)
+            if previous is not None and previous[0] is not None and previous[0] != fingerprint:
+                print(f"Collection '{collection}' đã thay đổi, xóa cache câu trả lời.")
+                self._drop(lambda e: e["collection"] == collection)
+            self._fingerprints[collection] = (fingerprint, time.monotonic())
+
+    def invalidate(self, collection: Optional[str] = None) -> int:
+        """Xóa cache của một collection (hoặc toàn bộ nếu không truyền), trả về số entry đã xóa."""
+        with self._lock:
+            if collection is None:
+                self._fingerprints.clear()
+                return self._drop(lambda e: True)
+            self._fingerprints.pop(collection, None)
+            return self._drop(lambda e: e["collection"] == collection)
+
+    def lookup(self, namespace: str, vector: List[float]) -> Tuple[Optional[Dict[str, Any]], Optional[float], Optional[str]]:
+        """
+        Trả về (response đã cache, similarity, câu hỏi đã cache) của entry gần nhất trong namespace.
+        response là None nếu similarity dưới ngưỡng; cả ba là None nếu namespace chưa có entry.
+        """
+        query_vec = self._normalize(vector)
+        with self._lock:
+            self._drop(lambda e: time.monotonic() - e["created_at"] > self.ttl_s)
+            ids, matrix = self._matrix(namespace)
+            if not ids or matrix.shape[1] != query_vec.shape[0]:
+                return None, None, None
+
+            similarities = matrix @ query_vec
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            entry_id = ids[best]
+            entry = self._entries[entry_id]
+            if similarity < self.threshold:
+                return None, similarity, entry["query"]
+
+            self._entries.move_to_end(entry_id)
+            return copy.deepcopy(entry["response"]), similarity, entry["query"]
+
+    def put(self, namespace: str, collection: str, query: str, vector: List[float], response: Dict[str, Any]):
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "namespace": namespace,
+                "collection": collection,
+                "query": query,
+                "vector": self._normalize(vector),
+                "response": copy.deepcopy(response),
+                "created_at": time.monotonic(),
+            }
+            ids, _ = self._index.get(namespace, ([], None))
+            self._index[namespace] = (ids + [entry_id], None)
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+
+    def _matrix(self, namespace: str) -> Tuple[List[int], Optional[np.ndarray]]:
+        # Ma trận của namespace được dựng lại lười biếng sau mỗi lần thêm/xóa
+        ids, matrix = self._index.get(namespace, ([], None))
+        if ids and matrix is None:
+            matrix = np.stack([self._entries[i]["vector"] for i in ids])
+            self._index[namespace] = (ids, matrix)
+        return ids, matrix
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids, _ = self._index[entry["namespace"]]
+        ids = [i for i in ids if i != entry_id]
+        if ids:
+            self._index[entry["namespace"]] = (ids, None)
+        else:
+            del self._index[entry["namespace"]]
+
+    def _drop(self, predicate) -> int:
+        expired = [i for i, e in self._entries.items() if predicate(e)]
+        for entry_id in expired:
+            self._remove(entry_id)
+        return len(expired)
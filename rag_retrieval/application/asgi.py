@@ -0,0 +1,81 @@
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+import json
+from rag_retrieval.config.settings import Settings
+from rag_retrieval.db.weaviate_db import AsyncWeaviateConnection
+from . import services
+from .async_services import arag_pipeline, shutdown_rerank_executor
+from .routes import pipeline_kwargs, chat_options, admin_authorized
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Kết nối Weaviate async dùng chung cho mọi request trong vòng đời của app
+    weaviate_conn = AsyncWeaviateConnection(
+        host=Settings.WEAVIATE_HOST,
+        http_port=Settings.WEAVIATE_PORT,
+        health_check_interval=Settings.WEAVIATE_HEALTH_CHECK_S
+    )
+    app.state.weaviate = weaviate_conn
+    try:
+        await weaviate_conn.get()
+    except ConnectionError as e:
+        # Không chặn app khởi động; request đầu tiên sẽ thử kết nối lại
+        print(f"Cảnh báo: {e}")
+    if Settings.CHAT_WARMUP:
+        await asyncio.to_thread(
+            services.warm_up_chat_model, (Settings.CHAT_PROVIDER, Settings.CHAT_MODEL), chat_options()
+        )
+
+    yield
+
+    await weaviate_conn.close()
+    for model in (services._chat_model, services._embedder):
+        if hasattr(model, "aclose"):
+            await model.aclose()
+    shutdown_rerank_executor()
+
+
+def create_asgi_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+    @app.post("/query")
+    async def query(request: Request):
+        data = await request.json()
+
+        user_query = data.get("query")
+        if not user_query:
+            return JSONResponse({"error": "Missing 'query'"}, status_code=400)
+
+        print("/query")
+        try:
+            kwargs = pipeline_kwargs(data, request.app.state.weaviate)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        result = await arag_pipeline(user_query, retrieval_workers=Settings.RETRIEVAL_MAX_WORKERS,
+                                     rerank_workers=Settings.RERANK_WORKERS, **kwargs)
+
+        return JSONResponse(jsonable_encoder(result))
+
+    @app.post("/cache/invalidate")
+    async def invalidate_cache(request: Request):
+        # Gọi sau khi nạp lại dữ liệu; không truyền "collection" => xóa toàn bộ cache câu trả lời
+        if not admin_authorized(request.headers.get("X-Admin-Token")):
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+        body = await request.body()
+        try:
+            data = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+        answer_cache = services.get_answer_cache_instance()
+        removed = answer_cache.invalidate(data.get("collection")) if answer_cache is not None else 0
+        return JSONResponse({"invalidated": removed})
+
+    return app
@@ -0,0 +1,430 @@
+from typing import List, Dict, Any, Tuple, Optional, Callable
+from rag_retrieval.db.weaviate_db import WeaviateManager, AsyncWeaviateManager, AsyncWeaviateConnection
+from .fusion import fuse_rank_lists
+from .query_expansion import ExpansionCache, prf_variants
+from .context_packing import pack_context
+from .services import (
+    RERANK_PROPERTIES, SEARCH_PROPERTIES, MULTI_QUERY_SYSTEM_PROMPT,
+    get_chat_instance, get_reranker_instance, get_embedder_instance, get_answer_cache_instance,
+    get_expansion_cache_instance, resolve_expansion, store_expansion,
+    answer_cache_namespace, cached_answer_response, is_cacheable_answer,
+    build_multi_query_prompt, parse_multi_queries, clean_query_line, new_report,
+    build_rerank_documents, build_final_docs,
+    build_summarizer_prompt, build_grounding_prompt, apply_grounding_result, local_grounding_check, build_response
+)
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+import asyncio
+import time
+
+_rerank_executor = None
+
+
+def aweaviate_session(weav_conn: Optional[AsyncWeaviateConnection], weav_host: str, weav_port: int):
+    return weav_conn.session() if weav_conn is not None else AsyncWeaviateManager(host=weav_host, http_port=weav_port)
+
+def get_rerank_executor(max_workers: int) -> ThreadPoolExecutor:
+    # Reranker chạy CPU/GPU nặng => pool riêng để không chiếm thread mặc định của event loop
+    global _rerank_executor
+    if _rerank_executor is None:
+        _rerank_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+    return _rerank_executor
+
+def shutdown_rerank_executor():
+    global _rerank_executor
+    if _rerank_executor is not None:
+        _rerank_executor.shutdown(wait=False)
+        _rerank_executor = None
+
+
+async def agenerate_multi_queries(chat_model, user_query: str, n: int = 5) -> List[str]:
+    out = await chat_model.agenerate(build_multi_query_prompt(user_query, n), system_prompt=MULTI_QUERY_SYSTEM_PROMPT)
+    return parse_multi_queries(out, user_query, n)
+
+
+async def astream_multi_queries(chat_model, user_query: str, n: int, on_query: Callable[[str], None]) -> List[str]:
+    """Bản async của stream_multi_queries: gọi `on_query` ngay khi mỗi dòng hoàn chỉnh, ngắt stream khi đủ n-1 truy vấn."""
+    text, buffer, emitted = [], "", 0
+    if n > 1:
+        stream = chat_model.agenerate_stream(build_multi_query_prompt(user_query, n), system_prompt=MULTI_QUERY_SYSTEM_PROMPT)
+        # aclosing => đóng kết nối stream ngay khi ngắt sớm
+        async with aclosing(stream):
+            async for token in stream:
+                text.append(token)
+                buffer += token
+                while "\n" in buffer and emitted < n - 1:
+                    line, buffer = buffer.split("\n", 1)
+                    query = clean_query_line(line)
+                    if query and not query.startswith("Lỗi:"):
+                        on_query(query)
+                        emitted += 1
+                if emitted >= n - 1:
+                    break
+    return parse_multi_queries("".join(text), user_query, n)
+
+
+async def aexpand_queries(chat_model, user_query: str, n: int, mode: str = "llm",
+                          expansion_cache: Optional[ExpansionCache] = None,
+                          search_feedback=None, prf_terms: int = 10,
+                          on_query: Optional[Callable[[str], None]] = None) -> Tuple[List[str], bool]:
+    """Bản async của expand_queries; `search_feedback` là coroutine function, `on_query` là hàm thường."""
+    queries, key = resolve_expansion(user_query, n, mode, chat_model.model_name, expansion_cache)
+    from_cache = queries is not None and mode in ("llm", "prf")
+    if queries is None:
+        if mode == "llm" and on_query is not None:
+            queries = await astream_multi_queries(chat_model, user_query, n, on_query)
+        elif mode == "llm":
+            queries = await agenerate_multi_queries(chat_model, user_query, n)
+        else:
+            queries = prf_variants(user_query, await search_feedback(user_query), n, feedback_terms=prf_terms,
+                                   text_properties=SEARCH_PROPERTIES)
+        queries = store_expansion(user_query, n, queries, key, expansion_cache)
+
+    if on_query is not None:
+        for query in queries:
+            on_query(query)
+    return queries, from_cache
+
+
+async def _asearch_bm25(mgr: AsyncWeaviateManager, collection_name: str, query: str, limit: int,
+                        properties: List[str]) -> List[Dict[str, Any]]:
+    try:
+        return await mgr.search(collection_name, "bm25", limit, query_text=query, properties=properties)
+    except Exception:
+        return []
+
+async def _asearch_vector(mgr: AsyncWeaviateManager, collection_name: str, query_vector: List[float],
+                          limit: int) -> List[Dict[str, Any]]:
+    try:
+        return await mgr.search(collection_name, "vector", limit, query_vector=query_vector)
+    except Exception:
+        return []
+
+async def _asearch_hybrid_server(mgr: AsyncWeaviateManager, collection_name: str, query: str,
+                                 query_vector: Optional[List[float]], alpha: float, limit: int,
+                                 properties: List[str], fusion_type: str) -> List[Dict[str, Any]]:
+    try:
+        return await mgr.hybrid_search(
+            collection_name=collection_name,
+            query_text=query,
+            query_vector=query_vector,
+            # Không có vector thì chỉ còn BM25
+            alpha=alpha if query_vector else 0.0,
+            limit=limit,
+            properties=properties,
+            mode="server",
+            fusion_type=fusion_type,
+            return_properties=RERANK_PROPERTIES
+        )
+    except Exception:
+        return []
+
+async def aretrieve_candidates(mgr: AsyncWeaviateManager, embedder, queries: List[str], collection_name: str,
+                               alpha: float, limit: int = 50, max_concurrency: int = 8, timeout_s: float = 10.0,
+                               properties: List[str] = SEARCH_PROPERTIES,
+                               mode: str = "client", fusion_type: str = "ranked",
+                               query_vectors: Optional[Dict[str, List[float]]] = None,
+                               semaphore: Optional[asyncio.Semaphore] = None
+                               ) -> Tuple[Dict[str, List[Dict[str, Any]]], List[str]]:
+    """
+    Bản async của retrieve_candidates: cùng đầu vào/đầu ra, nhưng dùng coroutine thay cho thread pool.
+    `max_concurrency` giới hạn số lệnh Weaviate chạy cùng lúc trong một request; truyền `semaphore` để
+    nhiều lần gọi của cùng request (tìm kiếm từng truy vấn con) dùng chung giới hạn đó.
+    """
+    if mode not in ("client", "server"):
+        raise ValueError(f"Chế độ hybrid search '{mode}' không được hỗ trợ.")
+
+    semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+    deadline = time.monotonic() + timeout_s
+
+    async def limited(coro):
+        async with semaphore:
+            return await coro
+
+    bm25_tasks = {}
+    if mode == "client":
+        bm25_tasks = {
+            q: asyncio.ensure_future(limited(_asearch_bm25(mgr, collection_name, q, limit, properties)))
+            for q in queries
+        }
+
+    # Một request /api/embed cho tất cả truy vấn chưa có vector, chạy song song với BM25
+    q_vectors: Dict[str, List[float]] = dict(query_vectors or {})
+    to_embed = [q for q in queries if q not in q_vectors]
+    if to_embed:
+        try:
+            vectors = await asyncio.wait_for(embedder.aembed_many(to_embed), max(0.0, deadline - time.monotonic()))
+            q_vectors.update(zip(to_embed, vectors))
+        except asyncio.TimeoutError:
+            print(f"Bỏ qua vector search vì embedding vượt quá {timeout_s}s.")
+        except Exception as e:
+            print(f"Bỏ qua vector search vì không thể tạo embedding: {e}")
+
+    async def search_query(q: str):
+        if mode == "server":
+            return await limited(_asearch_hybrid_server(
+                mgr, collection_name, q, q_vectors.get(q), alpha, limit, properties, fusion_type
+            ))
+        hits_vec = []
+        if q in q_vectors:
+            hits_vec = await limited(_asearch_vector(mgr, collection_name, q_vectors[q], limit))
+        hits_bm25 = await bm25_tasks[q]
+        return WeaviateManager.fuse_hits(hits_bm25, hits_vec, alpha)
+
+    search_tasks = {q: asyncio.ensure_future(search_query(q)) for q in queries}
+    remaining = max(0.0, deadline - time.monotonic())
+    if search_tasks:
+        await asyncio.wait(search_tasks.values(), timeout=remaining)
+
+    hits_per_query: Dict[str, List[Dict[str, Any]]] = {}
+    timed_out: List[str] = []
+    for q, task in search_tasks.items():
+        if task.done():
+            hits_per_query[q] = task.result()
+        else:
+            task.cancel()
+            if q in bm25_tasks:
+                bm25_tasks[q].cancel()
+            print(f"Bỏ qua truy vấn '{q}' vì vượt quá {timeout_s}s.")
+            timed_out.append(q)
+
+    return hits_per_query, timed_out
+
+
+async def arag_pipeline(user_query: str, multi_n: int, top_k: int, alpha: float,
+                        weav_host: str, weav_port: int, weav_grpc: int,
+                        weav_collection: str,
+                        chat_conf: tuple, reranker_conf: tuple, embedder_conf: tuple,
+                        retrieval_workers: int = 8, retrieval_timeout_s: float = 10.0,
+                        weav_conn: Optional[AsyncWeaviateConnection] = None,
+                        hybrid_mode: str = "client", hybrid_fusion: str = "ranked",
+                        fusion_strategy: str = "rrf", rrf_k: int = 60, candidate_pool: int = 50,
+                        reranker_opts: Optional[Dict[str, Any]] = None,
+                        answer_cache_opts: Optional[Dict[str, Any]] = None,
+                        expansion: str = "llm", expansion_cache_opts: Optional[Dict[str, Any]] = None,
+                        prf_docs: int = 5, prf_terms: int = 10, speculative_retrieval: bool = False,
+                        validation: str = "llm", validation_opts: Optional[Dict[str, Any]] = None,
+                        chat_opts: Optional[Dict[str, Any]] = None, context_max_tokens: int = 0,
+                        rerank_workers: int = 1) -> Dict[str, Any]:
+    """
+    Bản async của rag_pipeline, trả về đúng cùng một response.
+    LLM, embedding và Weaviate được gọi bằng I/O async; rerank chạy trên executor riêng.
+    """
+    loop = asyncio.get_running_loop()
+    rerank_executor = get_rerank_executor(rerank_workers)
+
+    # --- 1. KHỞI TẠO BÁO CÁO VÀ BẮT ĐẦU ĐO THỜI GIAN ---
+    start_time = time.monotonic()
+    report = new_report(user_query, multi_n, top_k, alpha, hybrid_mode, fusion_strategy,
+                        candidate_pool, reranker_conf[1], expansion, validation)
+
+    chat = get_chat_instance(*chat_conf, **(chat_opts or {}))
+    embedder = get_embedder_instance(*embedder_conf)
+    # Lần đầu tải model reranker rất lâu => cũng đưa vào executor
+    reranker = await loop.run_in_executor(
+        rerank_executor, lambda: get_reranker_instance(*reranker_conf, **(reranker_opts or {}))
+    )
+
+    answer_cache = get_answer_cache_instance(**(answer_cache_opts or {}))
+    expansion_cache = get_expansion_cache_instance(**(expansion_cache_opts or {}))
+
+    # --- 1.5 TRA CACHE CÂU TRẢ LỜI THEO ĐỘ TƯƠNG ĐỒNG CỦA CÂU HỎI ---
+    report["cache_hit"] = False
+    query_vector = None
+    if answer_cache is not None:
+        cache_start = time.monotonic()
+        namespace = answer_cache_namespace(
+            weav_collection, multi_n=multi_n, expansion=expansion, validation=validation,
+            context_max_tokens=context_max_tokens, top_k=top_k, alpha=alpha, hybrid_mode=hybrid_mode,
+            hybrid_fusion=hybrid_fusion, fusion_strategy=fusion_strategy, rrf_k=rrf_k,
+            candidate_pool=candidate_pool, chat=chat_conf, reranker=reranker_conf, embedder=embedder_conf
+        )
+        cached, similarity = None, None
+        try:
+            query_vector = (await embedder.aembed_many([user_query]))[0]
+            if answer_cache.claim_fingerprint(weav_collection):
+                async with aweaviate_session(weav_conn, weav_host, weav_port) as mgr:
+                    answer_cache.update_fingerprint(weav_collection, await mgr.collection_fingerprint(weav_collection))
+            cached, similarity, matched_query = answer_cache.lookup(namespace, query_vector)
+        except Exception as e:
+            print(f"Bỏ qua cache câu trả lời: {e}")
+        report["cache_similarity"] = round(similarity, 4) if similarity is not None else None
+        report["timings_ms"]["answer_cache_lookup"] = round((time.monotonic() - cache_start) * 1000)
+
+        if cached is not None:
+            print(f"Cache hit (similarity={similarity:.4f}) với câu hỏi '{matched_query}'")
+            report["timings_ms"]["total_pipeline_duration"] = round((time.monotonic() - start_time) * 1000)
+            return cached_answer_response(report, cached, similarity, matched_query)
+
+    # --- 2. BƯỚC TẠO TRUY VẤN CON (QUERY GENERATION) ---
+    print("Generating quries...")
+    query_gen_start = time.monotonic()
+
+    async def search_feedback(query: str) -> List[Dict[str, Any]]:
+        async with aweaviate_session(weav_conn, weav_host, weav_port) as mgr:
+            return await _asearch_bm25(mgr, weav_collection, query, prf_docs, SEARCH_PROPERTIES)
+
+    async with aweaviate_session(weav_conn, weav_host, weav_port) as mgr:
+        # Mọi lần tìm kiếm của request dùng chung giới hạn retrieval_workers
+        semaphore = asyncio.Semaphore(retrieval_workers)
+
+        def retrieve(queries: List[str]):
+            return aretrieve_candidates(
+                mgr, embedder, queries,
+                collection_name=weav_collection,
+                alpha=alpha,
+                limit=50,
+                timeout_s=retrieval_timeout_s,
+                mode=hybrid_mode,
+                fusion_type=hybrid_fusion,
+                query_vectors={user_query: query_vector} if query_vector is not None else None,
+                semaphore=semaphore
+            )
+
+        # Tìm kiếm theo kiểu pipeline: câu hỏi gốc ngay lập tức, mỗi truy vấn con ngay khi dòng của nó được stream về;
+        # mỗi truy vấn có deadline riêng tính từ lúc bắt đầu tìm kiếm
+        speculative_tasks: Dict[str, asyncio.Future] = {}
+        submitted_at: Dict[str, float] = {}
+
+        def submit(query: str):
+            if query not in speculative_tasks:
+                submitted_at[query] = time.monotonic()
+                speculative_tasks[query] = asyncio.ensure_future(retrieve([query]))
+
+        if speculative_retrieval:
+            print("Start query (speculative)...")
+            submit(user_query)
+
+        multi_queries, expansion_cache_hit = await aexpand_queries(
+            chat, user_query, n=multi_n, mode=expansion, expansion_cache=expansion_cache,
+            search_feedback=search_feedback, prf_terms=prf_terms,
+            on_query=submit if speculative_retrieval else None
+        )
+        query_gen_end = time.monotonic()
+        report["timings_ms"]["query_generation"] = round((query_gen_end - query_gen_start) * 1000)
+        report["statistics"]["num_generated_queries"] = len(multi_queries)
+        report["statistics"]["expansion_cache_hit"] = expansion_cache_hit
+        report["intermediate_steps"]["generated_queries"] = multi_queries
+        print("Generate completed")
+
+        # --- 3. BƯỚC TRUY XUẤT ỨNG VIÊN (CANDIDATE RETRIEVAL) ---
+        retrieval_start = query_gen_start if speculative_retrieval else time.monotonic()
+        all_queries = list(dict.fromkeys([user_query] + multi_queries))
+        if not speculative_retrieval:
+            print("Start query...")
+            hits_per_query, timed_out = await retrieve(all_queries)
+        else:
+            for query in all_queries:
+                submit(query)
+            hits_per_query, timed_out = {}, []
+            for query_hits, query_timed_out in await asyncio.gather(*speculative_tasks.values()):
+                hits_per_query.update(query_hits)
+                timed_out.extend(query_timed_out)
+            # Thời điểm (ms, tính từ đầu bước 2) bắt đầu tìm kiếm từng truy vấn
+            report["intermediate_steps"]["search_start_offsets_ms"] = [
+                round((submitted_at[q] - retrieval_start) * 1000) for q in all_queries if q in submitted_at
+            ]
+
+    rank_lists = [hits_per_query[q] for q in all_queries if q in hits_per_query]
+    initial_candidate_count = sum(len(hits) for hits in rank_lists)
+    num_deduplicated = len({h["id"] for hits in rank_lists for h in hits})
+    top_candidates = fuse_rank_lists(
+        rank_lists,
+        strategy=fusion_strategy,
+        rrf_k=rrf_k,
+        candidate_pool=candidate_pool
+    )
+
+    retrieval_end = time.monotonic()
+    report["timings_ms"]["candidate_retrieval"] = round((retrieval_end - retrieval_start) * 1000)
+    report["timings_ms"]["retrieval_overlap"] = round(max(0.0, min(query_gen_end, retrieval_end) - retrieval_start) * 1000)
+    report["timings_ms"]["retrieval_after_generation"] = round(max(0.0, retrieval_end - max(query_gen_end, retrieval_start)) * 1000)
+    report["statistics"]["num_initial_candidates"] = initial_candidate_count
+    report["statistics"]["num_deduplicated_candidates"] = num_deduplicated
+    report["statistics"]["num_timed_out_queries"] = len(timed_out)
+    print("Query completed")
+
+    # --- 4. BƯỚC SẮP XẾP LẠI (RERANKING) ---
+    print("Start reranking")
+    docs_to_rerank = build_rerank_documents(top_candidates)
+    report["statistics"]["num_docs_sent_to_reranker"] = min(len(docs_to_rerank), reranker.max_candidates or len(docs_to_rerank))
+
+    rerank_start = time.monotonic()
+    reranked_results = await loop.run_in_executor(
+        rerank_executor,
+        lambda: reranker.rerank(user_query, docs_to_rerank, top_k=top_k, stats=report["statistics"])
+    )
+    rerank_end = time.monotonic()
+    report["timings_ms"]["reranking"] = round((rerank_end - rerank_start) * 1000)
+    print("Finished rerank")
+
+    # --- 5. TỔNG HỢP KẾT QUẢ CUỐI CÙNG ---
+    final_retrieved_docs = build_final_docs(reranked_results, top_candidates)
+    report["statistics"]["num_final_results"] = len(final_retrieved_docs)
+
+    #  6: SINH NỘI DUNG TÓM TẮT (GENERATION)
+    print("Generating summary...")
+    generation_start = time.monotonic()
+    generated_summary = ""
+    validation_opts = validation_opts or {}
+    grounding_task = None
+    if final_retrieved_docs:
+        context_string, packing_stats = pack_context(final_retrieved_docs, chat.count_tokens, context_max_tokens)
+        report["statistics"].update(packing_stats)
+        summarizer_prompt = build_summarizer_prompt(user_query, context_string)
+        if validation == "streamed":
+            summary_tokens = []
+            partial_chars = 0
+            async with aclosing(chat.agenerate_stream(summarizer_prompt)) as stream:
+                async for token in stream:
+                    summary_tokens.append(token)
+                    partial_chars += len(token)
+                    # Kiểm tra chủ đề trên phần tóm tắt đã có, chạy song song với phần còn lại
+                    if grounding_task is None and partial_chars >= validation_opts.get("stream_min_chars", 300):
+                        partial_summary = "".join(summary_tokens).strip().strip('"')
+                        grounding_task = asyncio.ensure_future(
+                            chat.agenerate(build_grounding_prompt(context_string, partial_summary))
+                        )
+            generated_summary = "".join(summary_tokens).strip().strip('"')
+        else:
+            generated_summary = await chat.agenerate(summarizer_prompt)
+
+    report['generated_summary'] = generated_summary
+    generation_end = time.monotonic()
+    report["timings_ms"]["summary_generation"] = round((generation_end - generation_start) * 1000)
+    print("Summary generated.")
+
+    # --- 6.2 KIỂM TRA TÍNH XÁC THỰC (GROUNDING VALIDATION) ---
+    if generated_summary and generated_summary.strip() and validation != "off":
+        print(f"Validating summary topic relevance ({validation})...")
+        grounding_validation_start = time.monotonic()
+        if validation in ("lexical", "embedding"):
+            grounding_result, score = await asyncio.to_thread(
+                local_grounding_check, validation, embedder, generated_summary, context_string, final_retrieved_docs,
+                validation_opts.get("lexical_threshold", 0.5), validation_opts.get("embedding_threshold", 0.5)
+            )
+            report["intermediate_steps"]["grounding_validation_score"] = round(score, 4)
+        elif grounding_task is not None:
+            # Chỉ còn chờ phần kiểm tra chưa xong khi bản tóm tắt đã sinh xong
+            grounding_result = (await grounding_task).strip().upper()
+        else:
+            grounding_result = (await chat.agenerate(build_grounding_prompt(context_string, generated_summary))).strip().upper()
+        report["intermediate_steps"]["grounding_validation_result"] = grounding_result
+        generated_summary = apply_grounding_result(grounding_result, generated_summary)
+        grounding_validation_end = time.monotonic()
+        report["timings_ms"]["grounding_validation"] = round((grounding_validation_end - grounding_validation_start) * 1000)
+    elif grounding_task is not None:
+        grounding_task.cancel()
+
+    final_answer = generated_summary
+    report["generated_answer"] = final_answer
+
+    # --- 7. HOÀN TẤT VÀ TRẢ VỀ RESPONSE CUỐI CÙNG ---
+    end_time = time.monotonic()
+    report["timings_ms"]["total_pipeline_duration"] = round((end_time - start_time) * 1000)
+
+    response = build_response(report, final_answer, final_retrieved_docs)
+    if answer_cache is not None and query_vector is not None and is_cacheable_answer(response, len(timed_out)):
+        answer_cache.put(namespace, weav_collection, user_query, query_vector,
+                         {"generated_answer": response["generated_answer"], "results": response["results"]})
+    return response
@@ -0,0 +1,80 @@
+from typing import Any, Callable, Dict, List, Tuple
+import re
+from rag_retrieval.model.score_cache import normalize_query
+
+
+# Ranh giới câu: sau dấu kết thúc câu (kể cả "…") hoặc xuống dòng
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text or "") if s and s.strip()]
+
+
+def pack_context(final_retrieved_docs: List[Dict[str, Any]], count_tokens: Callable[[str], int],
+                 max_tokens: int = 0) -> Tuple[str, Dict[str, int]]:
+    """
+    Dựng bối cảnh cho prompt tóm tắt trong giới hạn `max_tokens` (đếm bằng tokenizer của chat model, <= 0 => không giới hạn).
+    Tài liệu được lấy tham lam theo điểm reranker; nội dung mỗi tài liệu bị cắt ở ranh giới câu khi hết ngân sách,
+    các câu đã xuất hiện ở chunk trước (chunk chồng lấn) bị bỏ qua.
+    Trả về (context_string, thống kê cho report["statistics"]).
+    """
+    budget = max_tokens if max_tokens > 0 else float("inf")
+    docs = sorted(final_retrieved_docs, key=lambda d: d.get("reranker_score") or 0.0, reverse=True)
+
+    seen_sentences = set()
+    seen_text = ""
+    used = 0
+    sections = []
+    num_deduplicated = 0
+    num_truncated = 0
+
+    for doc in docs:
+        header = f"--- Nguồn tài liệu {len(sections) + 1}: {doc['title']} ---\n"
+        header_tokens = count_tokens(header)
+        if used + header_tokens >= budget:
+            break
+
+        doc_used = header_tokens
+        kept = []
+        sentences = split_sentences(doc.get("content") or "")
+        for sentence in sentences:
+            key = normalize_query(sentence)
+            # Câu trùng, hoặc là phần đầu/cuối bị cắt của một câu đã có ở chunk chồng lấn
+            if key in seen_sentences or (len(key) >= 20 and key in seen_text):
+                num_deduplicated += 1
+                continue
+            sentence_tokens = count_tokens(sentence + " ")
+            if used + doc_used + sentence_tokens > budget:
+                num_truncated += 1
+                break
+            kept.append(sentence)
+            seen_sentences.add(key)
+            seen_text += key + "\n"
+            doc_used += sentence_tokens
+
+        if not kept:
+            # Không còn chỗ (hoặc toàn bộ nội dung đã trùng) thì không đưa tài liệu vào bối cảnh
+            continue
+        section = header + " ".join(kept) + "\n"
+        for label, value in (("Từ khóa", doc.get("keywords")), ("Tóm tắt", doc.get("abstract"))):
+            if not value:
+                continue
+            if isinstance(value, list):
+                value = ", ".join(str(v) for v in value)
+            line = f"{label}: {value}\n"
+            line_tokens = count_tokens(line)
+            if used + doc_used + line_tokens <= budget:
+                section += line
+                doc_used += line_tokens
+        sections.append(section + "\n")
+        used += doc_used
+
+    context_string = "".join(sections)
+    return context_string, {
+        "context_tokens": count_tokens(context_string) if context_string else 0,
+        "context_token_budget": max_tokens,
+        "num_context_docs": len(sections),
+        "num_context_truncated_docs": num_truncated,
+        "num_context_deduplicated_sentences": num_deduplicated,
+    }
@@ -0,0 +1,87 @@
+from typing import List, Dict, Any, Callable
+
+
+# Mỗi danh sách kết quả là hits của một truy vấn con, đã sắp xếp theo combined_score giảm dần.
+RankList = List[Dict[str, Any]]
+
+
+def _min_max(hits: RankList) -> Dict[str, float]:
+    scores = [h.get("combined_score") or 0.0 for h in hits]
+    lo, hi = min(scores), max(scores)
+    if hi == lo:
+        return {h["id"]: 1.0 for h in hits}
+    return {h["id"]: ((h.get("combined_score") or 0.0) - lo) / (hi - lo) for h in hits}
+
+
+def rrf(rank_lists: List[RankList], k: int = 60) -> Dict[str, float]:
+    """Reciprocal Rank Fusion: chỉ dùng thứ hạng nên không phụ thuộc thang điểm của từng truy vấn."""
+    fused: Dict[str, float] = {}
+    for hits in rank_lists:
+        for rank, h in enumerate(hits, start=1):
+            fused[h["id"]] = fused.get(h["id"], 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def comb_sum(rank_lists: List[RankList], **kwargs) -> Dict[str, float]:
+    fused: Dict[str, float] = {}
+    for hits in rank_lists:
+        if not hits:
+            continue
+        for doc_id, score in _min_max(hits).items():
+            fused[doc_id] = fused.get(doc_id, 0.0) + score
+    return fused
+
+
+def comb_mnz(rank_lists: List[RankList], **kwargs) -> Dict[str, float]:
+    fused = comb_sum(rank_lists)
+    hit_counts: Dict[str, int] = {}
+    for hits in rank_lists:
+        for doc_id in {h["id"] for h in hits}:
+            hit_counts[doc_id] = hit_counts.get(doc_id, 0) + 1
+    return {doc_id: score * hit_counts[doc_id] for doc_id, score in fused.items()}
+
+
+def comb_max(rank_lists: List[RankList], **kwargs) -> Dict[str, float]:
+    """Giữ combined_score cao nhất của mỗi tài liệu (cách gộp cũ)."""
+    fused: Dict[str, float] = {}
+    for hits in rank_lists:
+        for h in hits:
+            score = h.get("combined_score") or 0.0
+            if h["id"] not in fused or score > fused[h["id"]]:
+                fused[h["id"]] = score
+    return fused
+
+
+FUSION_STRATEGIES: Dict[str, Callable[..., Dict[str, float]]] = {
+    "rrf": rrf,
+    "combsum": comb_sum,
+    "combmnz": comb_mnz,
+    "max": comb_max,
+}
+
+
+def fuse_rank_lists(rank_lists: List[RankList], strategy: str = "rrf", rrf_k: int = 60,
+                    candidate_pool: int = None) -> List[Dict[str, Any]]:
+    """
+    Gộp kết quả của các truy vấn con thành một danh sách ứng viên duy nhất.
+    `combined_score` của đầu ra là điểm sau khi fuse; danh sách bị cắt ở `candidate_pool` phần tử.
+    """
+    fuse = FUSION_STRATEGIES.get(strategy.lower())
+    if fuse is None:
+        raise ValueError(f"Chiến lược fusion '{strategy}' không được hỗ trợ.")
+
+    fused_scores = fuse(rank_lists, k=rrf_k)
+
+    properties: Dict[str, Dict[str, Any]] = {}
+    for hits in rank_lists:
+        for h in hits:
+            properties.setdefault(h["id"], h.get("properties", {}))
+
+    candidates = [
+        {"id": doc_id, "properties": properties[doc_id], "combined_score": score}
+        for doc_id, score in fused_scores.items()
+    ]
+    candidates.sort(key=lambda x: x["combined_score"], reverse=True)
+    if candidate_pool is not None:
+        candidates = candidates[:candidate_pool]
+    return candidates
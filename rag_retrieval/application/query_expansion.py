@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+import re
+import threading
+import time
+from rag_retrieval.model.score_cache import normalize_query
+
+
+# Các chế độ mở rộng truy vấn: "llm" gọi chat model, "prf"/"keywords" không cần LLM, "none" chỉ dùng câu hỏi gốc
+EXPANSION_MODES = ("llm", "prf", "keywords", "none")
+
+VIETNAMESE_STOPWORDS = {
+    "là", "gì", "của", "và", "các", "những", "có", "không", "được", "cho", "với", "trong", "khi",
+    "nào", "này", "đó", "thì", "mà", "để", "bao", "nhiêu", "như", "thế", "tôi", "bạn", "em", "anh",
+    "chị", "ạ", "à", "ơi", "nhé", "vậy", "sao", "ra", "làm", "cần", "muốn", "về", "theo", "từ",
+    "một", "đến", "bị", "hay", "hoặc", "nếu", "thể", "cũng", "đã", "sẽ", "đang", "rồi", "ở", "tại",
+    "the", "a", "an", "of", "to", "in", "for", "and", "or", "is", "are", "what", "how", "on", "with",
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def content_terms(text: str) -> List[str]:
+    return [t for t in tokenize(text) if t not in VIETNAMESE_STOPWORDS and not t.isdigit() and len(t) > 1]
+
+
+def finalize_queries(variants: List[str], user_query: str, n: int) -> List[str]:
+    """Giữ đúng quy ước của generate_multi_queries: tối đa n-1 biến thể, câu hỏi gốc luôn đứng cuối."""
+    if n <= 1:
+        return [user_query]
+    seen = {normalize_query(user_query)}
+    res = []
+    for v in variants:
+        key = normalize_query(v)
+        if key and key not in seen:
+            seen.add(key)
+            res.append(v)
+        if len(res) >= n - 1:
+            break
+    res.append(user_query)
+    return res
+
+
+def keyword_variants(user_query: str, n: int) -> List[str]:
+    """
+    Sinh biến thể chỉ bằng xử lý chuỗi: bản chỉ giữ từ khóa, rồi các cửa sổ liên tiếp ngắn dần của dãy từ khóa.
+    Giữ từ liền nhau vì tiếng Việt là nhiều âm tiết ("lãi suất"), bỏ một âm tiết lẻ sẽ làm hỏng từ.
+    """
+    terms = content_terms(user_query)
+    variants = []
+    if terms:
+        variants.append(" ".join(terms))
+    for size in range(len(terms) - 1, 1, -1):
+        variants.extend(" ".join(terms[i:i + size]) for i in range(len(terms) - size + 1))
+    return finalize_queries(variants, user_query, n)
+
+
+def prf_variants(user_query: str, hits: List[Dict[str, Any]], n: int,
+                 feedback_terms: int = 10, text_properties: Sequence[str] = ("title", "abstract", "keywords", "text")
+                 ) -> List[str]:
+    """
+    Pseudo-relevance feedback kiểu RM3 rút gọn: trọng số của từ = tổng theo tài liệu phản hồi của
+    P(từ | tài liệu) * điểm BM25 đã chuẩn hóa của tài liệu. Các từ nặng nhất (không nằm trong câu hỏi)
+    được chia thành n-1 nhóm, mỗi nhóm nối vào câu hỏi gốc thành một biến thể.
+    """
+    if n <= 1 or not hits:
+        return finalize_queries([], user_query, n)
+
+    scores = [h.get("score") or 0.0 for h in hits]
+    total = sum(scores) or float(len(hits))
+    query_terms = set(content_terms(user_query))
+
+    weights: Dict[str, float] = {}
+    for h, score in zip(hits, scores):
+        props = h.get("properties") or {}
+        parts = []
+        for name in text_properties:
+            value = props.get(name)
+            if isinstance(value, list):
+                parts.extend(str(v) for v in value)
+            elif value:
+                parts.append(str(value))
+        terms = content_terms(" ".join(parts))
+        if not terms:
+            continue
+        doc_weight = (score or 1.0) / total
+        counts: Dict[str, int] = {}
+        for t in terms:
+            counts[t] = counts.get(t, 0) + 1
+        for t, c in counts.items():
+            if t not in query_terms:
+                weights[t] = weights.get(t, 0.0) + doc_weight * c / len(terms)
+
+    expansion = [t for t, _ in sorted(weights.items(), key=lambda x: x[1], reverse=True)[:feedback_terms]]
+    if not expansion:
+        return finalize_queries([], user_query, n)
+
+    per_variant = max(1, math.ceil(len(expansion) / (n - 1)))
+    variants = [
+        f"{user_query} {' '.join(expansion[i:i + per_variant])}"
+        for i in range(0, len(expansion), per_variant)
+    ]
+    return finalize_queries(variants, user_query, n)
+
+
+class ExpansionCache:
+    """LRU + TTL cho kết quả mở rộng truy vấn, khóa = (chế độ, model, n, câu hỏi đã chuẩn hóa)."""
+
+    def __init__(self, max_entries: int = 1000, ttl_s: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Tuple, Tuple[List[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(mode: str, model_name: str, user_query: str, n: int) -> Tuple:
+        return (mode, model_name, n, normalize_query(user_query))
+
+    def get(self, key: Tuple) -> Optional[List[str]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            queries, created_at = item
+            if time.monotonic() - created_at > self.ttl_s:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return list(queries)
+
+    def put(self, key: Tuple, queries: List[str]):
+        with self._lock:
+            self._entries[key] = (list(queries), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
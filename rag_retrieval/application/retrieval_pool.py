@@ -0,0 +1,93 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable
+import threading
+
+
+class RetrievalRejected(RuntimeError):
+    """Pool từ chối nhận việc vì tác vụ quá hạn đang giữ chỗ của pool (backend đang bị treo)."""
+
+
+class _Task:
+    __slots__ = ("abandoned", "running", "orphan", "stuck")
+
+    def __init__(self):
+        self.abandoned = False
+        self.running = False
+        self.orphan = False
+        self.stuck = False
+
+
+class RetrievalPool:
+    """
+    Pool dùng chung cho embedding/BM25/vector search của mọi request.
+    Tối đa `max_workers` tác vụ chạy đồng thời. Future.cancel() không dừng được tác vụ đang chạy, nên khi request
+    bỏ (`abandon`) một tác vụ quá hạn đang chạy thì tác vụ đó thành "mồ côi": trả lại chỗ cho request khác và
+    chạy nốt trên một trong `max_orphans` thread dự phòng. Hết thread dự phòng thì tác vụ quá hạn tiếp tục giữ chỗ
+    tới khi xong; khi đó `submit` báo RetrievalRejected ngay thay vì để request mới xếp hàng sau các lệnh đang treo.
+    Tác vụ bị bỏ khi còn trong hàng đợi thì không bao giờ chạy.
+    """
+
+    def __init__(self, max_workers: int, max_orphans: int):
+        self.max_workers = max_workers
+        self.max_orphans = max_orphans
+        self.executor = ThreadPoolExecutor(max_workers=max_workers + max_orphans, thread_name_prefix="retrieval")
+        self.slots = threading.Semaphore(max_workers)
+        self.orphans = 0
+        # Tác vụ quá hạn vẫn giữ chỗ vì không còn thread dự phòng
+        self.stuck = 0
+        self._tasks: Dict[Future, _Task] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        with self._lock:
+            if self.stuck:
+                raise RetrievalRejected(f"{self.orphans + self.stuck} tác vụ truy xuất quá hạn vẫn đang chạy")
+        task = _Task()
+        future = self.executor.submit(self._run, task, fn, args, kwargs)
+        with self._lock:
+            if not future.done():
+                self._tasks[future] = task
+        future.add_done_callback(self._forget)
+        return future
+
+    def _run(self, task: _Task, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> Any:
+        self.slots.acquire()
+        with self._lock:
+            if task.abandoned:
+                self.slots.release()
+                return None
+            task.running = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                if task.orphan:
+                    self.orphans -= 1
+                else:
+                    self.stuck -= task.stuck
+                    self.slots.release()
+
+    def _forget(self, future: Future):
+        with self._lock:
+            self._tasks.pop(future, None)
+
+    def abandon(self, futures: Iterable[Future]):
+        """Request không chờ các future này nữa (quá hạn)."""
+        for future in futures:
+            if future.cancel():
+                continue
+            with self._lock:
+                task = self._tasks.get(future)
+                if task is None or task.abandoned:
+                    continue
+                task.abandoned = True
+                # Đang chạy: nhả chỗ cho request khác nếu còn thread dự phòng, nếu không thì giữ chỗ tới khi xong
+                if not task.running:
+                    continue
+                if self.orphans < self.max_orphans:
+                    task.orphan = True
+                    self.orphans += 1
+                    self.slots.release()
+                else:
+                    task.stuck = True
+                    self.stuck += 1
@@ -1,36 +1,160 @@
-from flask import Blueprint, request, jsonify
-from .services import rag_pipeline
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from .services import rag_pipeline, iter_rag_pipeline, get_answer_cache_instance
 from rag_retrieval.config.settings import Settings
+from .query_expansion import EXPANSION_MODES
+from .validation import VALIDATION_STRATEGIES
+from typing import Optional
+import hmac
+import json
 
 bp = Blueprint("rag", __name__)
 
-@bp.route("/query", methods=["POST"])
-def query():
-    data = request.get_json(force=True)
 
-    user_query = data.get("query")
-    if not user_query:
-        return jsonify({"error": "Missing 'query'"}), 400
+def chat_options() -> dict:
+    """Tham số khởi tạo chat model lấy từ Settings (0 => để Ollama dùng mặc định của model)."""
+    return {
+        "tokenizer_name": Settings.CHAT_TOKENIZER or None,
+        "keep_alive": Settings.CHAT_KEEP_ALIVE or None,
+        "num_ctx": Settings.CHAT_NUM_CTX or None,
+        "num_predict": Settings.CHAT_NUM_PREDICT or None,
+        "num_thread": Settings.CHAT_NUM_THREAD or None,
+        "pool_size": Settings.CHAT_POOL_SIZE
+    }
+
+
+def admin_authorized(token: Optional[str]) -> bool:
+    """Route vận hành chỉ bật khi có ADMIN_TOKEN và request gửi đúng token trong header X-Admin-Token."""
+    if not Settings.ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest((token or "").encode("utf-8"), Settings.ADMIN_TOKEN.encode("utf-8"))
+
 
+def pipeline_kwargs(data: dict, weav_conn) -> dict:
+    """Tham số chung cho /query và /query/stream (Flask và ASGI), lấy từ payload hoặc Settings."""
     multi_n = int(data["multi_n"]) if "multi_n" in data else Settings.MULTI_QUERY_N
     top_k = int(data["top_k"]) if "top_k" in data else Settings.RERANK_TOPK
     alpha = float(data["alpha"]) if "alpha" in data else Settings.HYBRID_ALPHA
-    print("/query")
+    # "llm" | "prf" | "keywords" | "none"; hai chế độ giữa không gọi LLM
+    expansion = data.get("expansion", Settings.QUERY_EXPANSION)
+    if expansion not in EXPANSION_MODES:
+        raise ValueError(f"'expansion' phải là một trong {list(EXPANSION_MODES)}")
+    # "llm" | "streamed" | "lexical" | "embedding" | "off"
+    validation = data.get("validation", Settings.VALIDATION_STRATEGY)
+    if validation not in VALIDATION_STRATEGIES:
+        raise ValueError(f"'validation' phải là một trong {list(VALIDATION_STRATEGIES)}")
     print(f"multi_n: {multi_n}")
+    print(f"expansion: {expansion}")
+    print(f"validation: {validation}")
     print(f"top_k: {top_k}")
     print(f"alpha: {alpha}")
 
-    result = rag_pipeline(
-        user_query,
+    return dict(
         multi_n=multi_n,
+        expansion=expansion,
         top_k=top_k,
         alpha=alpha,
         weav_host=Settings.WEAVIATE_HOST,
         weav_port=Settings.WEAVIATE_PORT,
         weav_grpc=Settings.WEAVIATE_GRPC,
         weav_collection=Settings.WEAVIATE_COLLECTION_NAME,
+        weav_conn=weav_conn,
         chat_conf=(Settings.CHAT_PROVIDER, Settings.CHAT_MODEL),
-        reranker_conf=(Settings.RERANKER_PROVIDER, Settings.RERANKER_MODEL)
+        chat_opts=chat_options(),
+        context_max_tokens=Settings.CONTEXT_MAX_TOKENS,
+        reranker_conf=(Settings.RERANKER_PROVIDER, Settings.RERANKER_MODEL),
+        embedder_conf=(Settings.EMBEDDER_PROVIDER, Settings.EMBED_MODEL),
+        retrieval_timeout_s=Settings.RETRIEVAL_TIMEOUT_S,
+        hybrid_mode=Settings.HYBRID_MODE,
+        hybrid_fusion=Settings.HYBRID_FUSION,
+        fusion_strategy=Settings.FUSION_STRATEGY,
+        rrf_k=Settings.RRF_K,
+        candidate_pool=Settings.CANDIDATE_POOL,
+        reranker_opts={
+            "max_candidates": Settings.CANDIDATE_POOL,
+            "batch_size": Settings.RERANK_BATCH_SIZE,
+            "max_length": Settings.RERANK_MAX_LENGTH,
+            "cache_size": Settings.RERANK_CACHE_SIZE,
+            "cache_path": Settings.RERANK_CACHE_PATH or None,
+            "cache_disk_size": Settings.RERANK_CACHE_DISK_SIZE,
+            "onnx_dir": Settings.ONNX_MODEL_DIR or None,
+            "quantize": Settings.ONNX_QUANTIZE,
+            "intra_op_threads": Settings.ONNX_INTRA_OP_THREADS,
+            "inter_op_threads": Settings.ONNX_INTER_OP_THREADS
+        },
+        answer_cache_opts={
+            "max_entries": Settings.ANSWER_CACHE_SIZE,
+            "ttl_s": Settings.ANSWER_CACHE_TTL_S,
+            "threshold": Settings.ANSWER_CACHE_THRESHOLD,
+            "fingerprint_interval_s": Settings.ANSWER_CACHE_FINGERPRINT_S
+        },
+        expansion_cache_opts={
+            "max_entries": Settings.EXPANSION_CACHE_SIZE,
+            "ttl_s": Settings.EXPANSION_CACHE_TTL_S
+        },
+        prf_docs=Settings.PRF_FEEDBACK_DOCS,
+        prf_terms=Settings.PRF_FEEDBACK_TERMS,
+        speculative_retrieval=Settings.SPECULATIVE_RETRIEVAL,
+        validation=validation,
+        validation_opts={
+            "lexical_threshold": Settings.VALIDATION_LEXICAL_THRESHOLD,
+            "embedding_threshold": Settings.VALIDATION_EMBEDDING_THRESHOLD,
+            "stream_min_chars": Settings.VALIDATION_STREAM_MIN_CHARS
+        }
     )
 
+
+@bp.route("/query", methods=["POST"])
+def query():
+    data = request.get_json(force=True)
+
+    user_query = data.get("query")
+    if not user_query:
+        return jsonify({"error": "Missing 'query'"}), 400
+
+    print("/query")
+    try:
+        kwargs = pipeline_kwargs(data, current_app.extensions["weaviate"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = rag_pipeline(user_query, **kwargs)
+
     return jsonify(result)
+
+
+@bp.route("/query/stream", methods=["POST"])
+def query_stream():
+    data = request.get_json(force=True)
+
+    user_query = data.get("query")
+    if not user_query:
+        return jsonify({"error": "Missing 'query'"}), 400
+
+    print("/query/stream")
+    try:
+        kwargs = pipeline_kwargs(data, current_app.extensions["weaviate"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def event_stream():
+        # Server-Sent Events: mỗi bước của pipeline là một event, tóm tắt được stream theo từng token
+        for event, payload in iter_rag_pipeline(user_query, stream_summary=True, **kwargs):
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@bp.route("/cache/invalidate", methods=["POST"])
+def invalidate_cache():
+    # Gọi sau khi nạp lại dữ liệu; không truyền "collection" => xóa toàn bộ cache câu trả lời
+    if not admin_authorized(request.headers.get("X-Admin-Token")):
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json(silent=True) if request.get_data() else {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON body"}), 400
+    answer_cache = get_answer_cache_instance()
+    removed = answer_cache.invalidate(data.get("collection")) if answer_cache is not None else 0
+    return jsonify({"invalidated": removed})
@@ -1,58 +1,119 @@
-from typing import List, Dict, Any
-from rag_retrieval.db.weaviate_db import WeaviateManager
-from rag_retrieval.model.model_factory import get_chat_model, get_reranker
+from typing import List, Dict, Any, Tuple, Optional, Iterator, Callable
+from rag_retrieval.db.weaviate_db import WeaviateManager, WeaviateConnection
+from rag_retrieval.model.model_factory import get_chat_model, get_reranker, get_embedder
+from rag_retrieval.config.settings import Settings
+from .fusion import fuse_rank_lists
+from .answer_cache import SemanticAnswerCache
+from .query_expansion import EXPANSION_MODES, ExpansionCache, keyword_variants, prf_variants
+from .context_packing import pack_context
+from .validation import lexical_overlap, embedding_similarity, verdict
+from .retrieval_pool import RetrievalPool, RetrievalRejected
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait, FIRST_COMPLETED
+import json
 import time
 import warnings
-import requests
 warnings.filterwarnings("ignore", message=".*XLMRobertaTokenizerFast.*")
 warnings.filterwarnings("ignore", message=".*swigvarlink.*")
 warnings.filterwarnings("ignore", message=".*torch_dtype.*deprecated.*")
 
-_chat_model, _reranker = None, None
+# Property chứa nội dung chunk khi nạp dữ liệu (run_add_products)
+BODY_PROPERTY = "text"
+# Các thuộc tính mà reranker và response cần, dùng để giới hạn payload trả về từ Weaviate
+RERANK_PROPERTIES = ["title", "abstract", "keywords", BODY_PROPERTY]
+# Các thuộc tính văn bản được đánh index BM25, dùng chung cho tìm kiếm và PRF
+SEARCH_PROPERTIES = ["title", "abstract", "keywords", BODY_PROPERTY]
 
+_chat_model, _reranker, _embedder = None, None, None
+_retrieval_executor = None
+_answer_cache = None
+_expansion_cache = None
+_validation_executor = None
 
-def get_chat_instance(provider, model):
+
+def get_chat_instance(provider, model, **kwargs):
     global _chat_model
     if _chat_model is None:
-        _chat_model = get_chat_model(provider=provider, model_name=model)
+        _chat_model = get_chat_model(provider=provider, model_name=model, **kwargs)
     return _chat_model
 
-def get_reranker_instance(provider, model):
+def warm_up_chat_model(chat_conf: tuple, chat_opts: Optional[Dict[str, Any]] = None):
+    # Nạp sẵn model lúc khởi động để request đầu tiên không phải chờ Ollama load model
+    try:
+        get_chat_instance(*chat_conf, **(chat_opts or {})).warm_up()
+    except ConnectionError as e:
+        # Không chặn app khởi động; request đầu tiên sẽ tự nạp model
+        print(f"Cảnh báo: {e}")
+
+def get_reranker_instance(provider, model, **kwargs):
     global _reranker
     if _reranker is None:
-        _reranker = get_reranker(provider=provider, model_name=model)
+        _reranker = get_reranker(provider=provider, model_name=model, **kwargs)
     return _reranker
 
-def get_embedding_ollama(text: str, model_name: str = "nomic-embed-text") -> List[float]:
-    try:
-        response = requests.post(
-            "http://10.1.1.237:11434/api/embeddings", # Thay bằng URL Ollama của bạn
-            json={"model": model_name, "prompt": text},
-        )
-        response.raise_for_status()
-        return response.json()["embedding"]
-    except Exception:
-        return []
-        
-def generate_multi_queries(chat_model, user_query: str, n: int = 5) -> List[str]:
-    system_prompt = (
-        "You are a query rewriting assistant. Given a user query, produce multiple alternative, "
-        "concise search queries that help retrieve diverse relevant documents. "
-        "Consider technical, practical, comparative, and conceptual perspectives."
-        "Output exactly one query per line with no additional text, only query."
-    )
-    user_prompt = f"User query: {user_query}\n\nGenerate {n} alternative queries:"
-    out = chat_model.generate(user_prompt, system_prompt=system_prompt)
-
+def get_retrieval_executor() -> RetrievalPool:
+    # Pool dùng chung cho mọi request => RETRIEVAL_MAX_WORKERS là giới hạn đồng thời toàn cục
+    global _retrieval_executor
+    if _retrieval_executor is None:
+        _retrieval_executor = RetrievalPool(Settings.RETRIEVAL_MAX_WORKERS, Settings.RETRIEVAL_MAX_ORPHANS)
+    return _retrieval_executor
+
+def get_embedder_instance(provider, model):
+    global _embedder
+    if _embedder is None:
+        _embedder = get_embedder(provider=provider, model_name=model)
+    return _embedder
+
+def get_answer_cache_instance(max_entries: int = 0, **kwargs) -> Optional[SemanticAnswerCache]:
+    # max_entries = 0 => tắt cache câu trả lời
+    global _answer_cache
+    if _answer_cache is None and max_entries > 0:
+        _answer_cache = SemanticAnswerCache(max_entries=max_entries, **kwargs)
+    return _answer_cache
+
+def get_expansion_cache_instance(max_entries: int = 0, **kwargs) -> Optional[ExpansionCache]:
+    # max_entries = 0 => không memo kết quả mở rộng truy vấn
+    global _expansion_cache
+    if _expansion_cache is None and max_entries > 0:
+        _expansion_cache = ExpansionCache(max_entries=max_entries, **kwargs)
+    return _expansion_cache
+
+def get_validation_executor() -> ThreadPoolExecutor:
+    # Chạy prompt kiểm tra chủ đề song song với phần tóm tắt còn lại (chiến lược "streamed")
+    global _validation_executor
+    if _validation_executor is None:
+        _validation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="validation")
+    return _validation_executor
+
+def weaviate_session(weav_conn: Optional[WeaviateConnection], weav_host: str, weav_port: int):
+    # Dùng lại kết nối của app nếu có, nếu không thì mở kết nối riêng cho lần gọi này
+    return weav_conn.session() if weav_conn is not None else WeaviateManager(host=weav_host, http_port=weav_port)
+
+MULTI_QUERY_SYSTEM_PROMPT = (
+    "You are a query rewriting assistant. Given a user query, produce multiple alternative, "
+    "concise search queries that help retrieve diverse relevant documents. "
+    "Consider technical, practical, comparative, and conceptual perspectives."
+    "Output exactly one query per line with no additional text, only query."
+)
+
+def build_multi_query_prompt(user_query: str, n: int) -> str:
+    return f"User query: {user_query}\n\nGenerate {n} alternative queries:"
+
+def clean_query_line(line: str) -> Optional[str]:
+    line = line.strip(" \t\n\r \"'-")
+    if not line:
+        return None
+    if line[0].isdigit() and len(line) > 1 and (line[1] in ['.', ')']):
+        line = line.split('.', 1)[-1].strip()
+    if line.startswith('- '):
+        line = line[2:].strip()
+    return line
+
+def parse_multi_queries(out: str, user_query: str, n: int) -> List[str]:
     lines = []
     for line in out.splitlines():
-        line = line.strip(" \t\n\r \"'-")
+        line = clean_query_line(line)
         if not line:
             continue
-        if line[0].isdigit() and (line[1] in ['.', ')']):
-            line = line.split('.', 1)[-1].strip()
-        if line.startswith('- '):
-            line = line[2:].strip()
         lines.append(line)
         if len(lines) >= n:
             break
@@ -67,96 +128,239 @@ def generate_multi_queries(chat_model, user_query: str, n: int = 5) -> List[str]
 
     return res
 
+def generate_multi_queries(chat_model, user_query: str, n: int = 5) -> List[str]:
+    out = chat_model.generate(build_multi_query_prompt(user_query, n), system_prompt=MULTI_QUERY_SYSTEM_PROMPT)
+    return parse_multi_queries(out, user_query, n)
 
-def rag_pipeline(user_query: str, multi_n: int, top_k: int, alpha: float,
-                 weav_host: str, weav_port: int, weav_grpc: int,
-                 weav_collection: str,
-                 chat_conf: tuple, reranker_conf: tuple) -> Dict[str, Any]:
 
-    # --- 1. KHỞI TẠO BÁO CÁO VÀ BẮT ĐẦU ĐO THỜI GIAN ---
-    start_time = time.monotonic()
-    report = {
+def stream_multi_queries(chat_model, user_query: str, n: int, on_query: Callable[[str], None]) -> List[str]:
+    """
+    Như generate_multi_queries nhưng đọc stream: gọi `on_query` ngay khi mỗi dòng hoàn chỉnh,
+    và ngắt stream khi đã đủ n-1 truy vấn con (phần sau không được dùng tới).
+    """
+    text, buffer, emitted = [], "", 0
+    if n > 1:
+        for token in chat_model.generate_stream(build_multi_query_prompt(user_query, n), system_prompt=MULTI_QUERY_SYSTEM_PROMPT):
+            text.append(token)
+            buffer += token
+            while "\n" in buffer and emitted < n - 1:
+                line, buffer = buffer.split("\n", 1)
+                query = clean_query_line(line)
+                if query and not query.startswith("Lỗi:"):
+                    on_query(query)
+                    emitted += 1
+            if emitted >= n - 1:
+                break
+    return parse_multi_queries("".join(text), user_query, n)
+
+def resolve_expansion(user_query: str, n: int, mode: str, model_name: str,
+                      expansion_cache: Optional[ExpansionCache]) -> Tuple[Optional[List[str]], Optional[Tuple]]:
+    """
+    Phần chung của expand_queries/aexpand_queries: trả về (truy vấn, None) nếu không cần gọi LLM/Weaviate
+    (chế độ rẻ hoặc cache hit), ngược lại (None, khóa cache) để hàm gọi tự sinh rồi ghi vào cache.
+    """
+    if mode not in EXPANSION_MODES:
+        raise ValueError(f"Chế độ mở rộng truy vấn '{mode}' không được hỗ trợ.")
+    if mode == "none":
+        return [user_query], None
+    if mode == "keywords":
+        return keyword_variants(user_query, n), None
+
+    key = ExpansionCache.make_key(mode, model_name, user_query, n)
+    cached = expansion_cache.get(key) if expansion_cache is not None else None
+    return cached, (None if cached is not None else key)
+
+def store_expansion(user_query: str, n: int, queries: List[str], key: Tuple,
+                    expansion_cache: Optional[ExpansionCache]) -> List[str]:
+    # LLM lỗi => dùng biến thể từ khóa và không cache kết quả lỗi
+    if any(q.startswith("Lỗi:") for q in queries):
+        print("Mở rộng truy vấn bằng LLM thất bại, chuyển sang biến thể từ khóa.")
+        return keyword_variants(user_query, n)
+    if expansion_cache is not None:
+        expansion_cache.put(key, queries)
+    return queries
+
+def expand_queries(chat_model, user_query: str, n: int, mode: str = "llm",
+                   expansion_cache: Optional[ExpansionCache] = None,
+                   search_feedback=None, prf_terms: int = 10,
+                   on_query: Optional[Callable[[str], None]] = None) -> Tuple[List[str], bool]:
+    """
+    Sinh truy vấn con theo `mode` ("llm", "prf", "keywords", "none"), memo theo (mode, model, n, câu hỏi).
+    `search_feedback(query)` trả về các hit BM25 dùng cho "prf". Nếu có `on_query`, mỗi truy vấn con được
+    báo ngay khi có (stream từ LLM), có thể bị gọi lại với cùng truy vấn.
+    Trả về (truy vấn, có lấy từ cache không).
+    """
+    queries, key = resolve_expansion(user_query, n, mode, chat_model.model_name, expansion_cache)
+    from_cache = queries is not None and mode in ("llm", "prf")
+    if queries is None:
+        if mode == "llm" and on_query is not None:
+            queries = stream_multi_queries(chat_model, user_query, n, on_query)
+        elif mode == "llm":
+            queries = generate_multi_queries(chat_model, user_query, n)
+        else:
+            queries = prf_variants(user_query, search_feedback(user_query), n, feedback_terms=prf_terms,
+                                   text_properties=SEARCH_PROPERTIES)
+        queries = store_expansion(user_query, n, queries, key, expansion_cache)
+
+    if on_query is not None:
+        for query in queries:
+            on_query(query)
+    return queries, from_cache
+
+
+def _search_bm25(mgr: WeaviateManager, collection_name: str, query: str, limit: int,
+                 properties: List[str]) -> List[Dict[str, Any]]:
+    try:
+        return mgr.search(collection_name, "bm25", limit, query_text=query, properties=properties)
+    except Exception:
+        return []
+
+def _search_vector(mgr: WeaviateManager, collection_name: str, query_vector: List[float],
+                   limit: int) -> List[Dict[str, Any]]:
+    try:
+        return mgr.search(collection_name, "vector", limit, query_vector=query_vector)
+    except Exception:
+        return []
+
+def _search_hybrid_server(mgr: WeaviateManager, collection_name: str, query: str,
+                          query_vector: Optional[List[float]], alpha: float, limit: int,
+                          properties: List[str], fusion_type: str) -> List[Dict[str, Any]]:
+    try:
+        return mgr.hybrid_search(
+            collection_name=collection_name,
+            query_text=query,
+            query_vector=query_vector,
+            # Không có vector thì chỉ còn BM25
+            alpha=alpha if query_vector else 0.0,
+            limit=limit,
+            properties=properties,
+            mode="server",
+            fusion_type=fusion_type,
+            return_properties=RERANK_PROPERTIES
+        )
+    except Exception:
+        return []
+
+def retrieve_candidates(mgr: WeaviateManager, embedder, queries: List[str], collection_name: str,
+                        alpha: float, limit: int = 50, timeout_s: float = 10.0,
+                        properties: List[str] = SEARCH_PROPERTIES,
+                        mode: str = "client", fusion_type: str = "ranked",
+                        query_vectors: Optional[Dict[str, List[float]]] = None
+                        ) -> Tuple[Dict[str, List[Dict[str, Any]]], List[str]]:
+    """
+    Embedding các truy vấn con (trừ những truy vấn đã có sẵn trong `query_vectors`) bằng một request
+    theo batch, rồi tìm kiếm song song trên pool giới hạn:
+    - mode="client": BM25 (chạy song song với embedding) + vector search riêng, fuse ở Python.
+    - mode="server": một lệnh hybrid của Weaviate cho mỗi truy vấn.
+    Mỗi truy vấn phải xong trước deadline `timeout_s` tính từ lúc bắt đầu; truy vấn quá hạn bị bỏ qua.
+    Pool từ chối nhận việc (backend đang treo) thì các truy vấn cũng được tính là quá hạn.
+    Trả về (hits đã fuse theo từng truy vấn, danh sách truy vấn bị quá hạn).
+    """
+    if mode not in ("client", "server"):
+        raise ValueError(f"Chế độ hybrid search '{mode}' không được hỗ trợ.")
+
+    executor = get_retrieval_executor()
+    deadline = time.monotonic() + timeout_s
+    submitted = []
+
+    def submit(fn, *args):
+        future = executor.submit(fn, *args)
+        submitted.append(future)
+        return future
+
+    try:
+        bm25_futures = {}
+        if mode == "client":
+            bm25_futures = {
+                q: submit(_search_bm25, mgr, collection_name, q, limit, properties)
+                for q in queries
+            }
+
+        # Một request /api/embed cho tất cả truy vấn chưa có vector
+        q_vectors: Dict[str, List[float]] = dict(query_vectors or {})
+        to_embed = [q for q in queries if q not in q_vectors]
+        if to_embed:
+            embed_future = submit(embedder.embed_many, to_embed)
+            try:
+                q_vectors.update(zip(to_embed, embed_future.result(timeout=max(0.0, deadline - time.monotonic()))))
+            except FuturesTimeoutError:
+                executor.abandon([embed_future])
+                print(f"Bỏ qua vector search vì embedding vượt quá {timeout_s}s.")
+            except Exception as e:
+                print(f"Bỏ qua vector search vì không thể tạo embedding: {e}")
+
+        search_futures = {}
+        for q in queries:
+            if mode == "server":
+                search_futures[q] = [submit(
+                    _search_hybrid_server, mgr, collection_name, q, q_vectors.get(q),
+                    alpha, limit, properties, fusion_type
+                )]
+            else:
+                search_futures[q] = [bm25_futures[q]]
+                if q in q_vectors:
+                    search_futures[q].append(
+                        submit(_search_vector, mgr, collection_name, q_vectors[q], limit)
+                    )
+
+        hits_per_query: Dict[str, List[Dict[str, Any]]] = {}
+        timed_out: List[str] = []
+        for q, futures in search_futures.items():
+            try:
+                results = [f.result(timeout=max(0.0, deadline - time.monotonic())) for f in futures]
+            except FuturesTimeoutError:
+                executor.abandon(futures)
+                print(f"Bỏ qua truy vấn '{q}' vì vượt quá {timeout_s}s.")
+                timed_out.append(q)
+                continue
+
+            if mode == "server":
+                hits_per_query[q] = results[0]
+            else:
+                hits_bm25 = results[0]
+                hits_vec = results[1] if len(results) > 1 else []
+                hits_per_query[q] = WeaviateManager.fuse_hits(hits_bm25, hits_vec, alpha)
+
+        return hits_per_query, timed_out
+    except RetrievalRejected as e:
+        # Không để các tác vụ đã gửi của request này tiếp tục giữ pool
+        executor.abandon(submitted)
+        print(f"Bỏ qua truy xuất: {e}")
+        return {}, list(queries)
+
+
+def new_report(user_query: str, multi_n: int, top_k: int, alpha: float, hybrid_mode: str,
+               fusion_strategy: str, candidate_pool: int, reranker_model: str,
+               expansion: str = "llm", validation: str = "llm") -> Dict[str, Any]:
+    return {
         "timings_ms": {},
         "statistics": {},
         "parameters": {
             "user_query": user_query,
             "multi_n": multi_n,
+            "expansion": expansion,
+            "validation": validation,
             "top_k": top_k,
             "alpha": alpha,
-            "reranker_model": reranker_conf[1] # Lưu lại URL/tên model reranker
+            "hybrid_mode": hybrid_mode,
+            "fusion_strategy": fusion_strategy,
+            "candidate_pool": candidate_pool,
+            "reranker_model": reranker_model # Lưu lại URL/tên model reranker
         },
         "intermediate_steps": {}
     }
 
-    chat = get_chat_instance(*chat_conf)
-    reranker = get_reranker_instance(*reranker_conf)
-
-    # --- 2. BƯỚC TẠO TRUY VẤN CON (QUERY GENERATION) ---
-    print("Generating quries...")
-    query_gen_start = time.monotonic()
-    multi_queries = generate_multi_queries(chat, user_query, n=multi_n)
-    query_gen_end = time.monotonic()
-    report["timings_ms"]["query_generation"] = round((query_gen_end - query_gen_start) * 1000)
-    report["statistics"]["num_generated_queries"] = len(multi_queries)
-    report["intermediate_steps"]["generated_queries"] = multi_queries
-    print("Generate completed")
-
-    # --- 3. BƯỚC TRUY XUẤT ỨNG VIÊN (CANDIDATE RETRIEVAL) ---
-    print("Start query...")
-    retrieval_start = time.monotonic()
-    candidates: Dict[str, Dict[str, Any]] = {}
-    initial_candidate_count = 0
-    with WeaviateManager(host=weav_host, http_port=weav_port) as mgr:
-        all_queries = [user_query] + multi_queries
-        for q in list(set(all_queries)): 
-            # 1. EMBEDDING TRUY VẤN TRƯỚC KHI TÌM KIẾM
-            q_vector = get_embedding_ollama(q)
-            if not q_vector:
-                print(f"Bỏ qua truy vấn '{q}' vì không thể tạo embedding.")
-                continue
-
-            # 2. GỌI hybrid_search VỚI CẢ TEXT VÀ VECTOR
-            hits = mgr.hybrid_search(
-                collection_name=weav_collection, 
-                query_text=q, # Dùng cho BM25
-                query_vector=q_vector, # Dùng cho vector search
-                alpha=alpha, 
-                limit=50
-            )
-            
-            initial_candidate_count += len(hits)
-            for h in hits:
-                # ... (phần còn lại giữ nguyên)
-                doc_id = h["id"]
-                if doc_id not in candidates or h["combined_score"] > candidates[doc_id]["combined_score"]:
-                    props = h.get("properties", {})
-                    candidates[doc_id] = { "id": h["id"], "properties": props, "combined_score": h["combined_score"] }
-
-    retrieval_end = time.monotonic()
-    report["timings_ms"]["candidate_retrieval"] = round((retrieval_end - retrieval_start) * 1000)
-    report["statistics"]["num_initial_candidates"] = initial_candidate_count
-    report["statistics"]["num_deduplicated_candidates"] = len(candidates)
-    
-    top_candidates = sorted(candidates.values(), key=lambda x: x["combined_score"], reverse=True)
-    print("Query completed")
-
-    # --- 4. BƯỚC SẮP XẾP LẠI (RERANKING) ---
-    print("Start reranking")
+def build_rerank_documents(top_candidates: List[Dict[str, Any]]) -> List[str]:
     docs_to_rerank = []
     for doc in top_candidates:
         props = doc["properties"]
-        parts = [props.get("title") or "", props.get("abstract") or "", (props.get("content") or "")[:4000]]
+        # Không cắt theo ký tự nữa, reranker tự cắt theo token ở max_length
+        parts = [props.get("title") or "", props.get("abstract") or "", props.get(BODY_PROPERTY) or ""]
         docs_to_rerank.append("\n\n".join(p for p in parts if p.strip()))
-    
-    report["statistics"]["num_docs_sent_to_reranker"] = len(docs_to_rerank)
-    
-    rerank_start = time.monotonic()
-    reranked_results = reranker.rerank(user_query, docs_to_rerank, top_k=top_k)
-    rerank_end = time.monotonic()
-    report["timings_ms"]["reranking"] = round((rerank_end - rerank_start) * 1000)
-    print("Finished rerank")
+    return docs_to_rerank
 
-    # --- 5. TỔNG HỢP KẾT QUẢ CUỐI CÙNG ---
+def build_final_docs(reranked_results: List[Tuple[int, float, str]],
+                     top_candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     final_retrieved_docs = []
     for original_index, score, text in reranked_results:
         meta = top_candidates[original_index]
@@ -166,37 +370,17 @@ def rag_pipeline(user_query: str, multi_n: int, top_k: int, alpha: float,
             "title": props.get("title"),
             "abstract": props.get("abstract"),
             "keywords": props.get("keywords"),
+            "ingestion_date": props.get("ingestion_date"),
             "combined_score": meta.get("combined_score"),
             "reranker_score": score,
             "snippet": text[:500] + "..." if len(text) > 500 else text,
             "content": text
         })
-    
-    report["statistics"]["num_final_results"] = len(final_retrieved_docs)
-
-    end_time = time.monotonic()
-    report["timings_ms"]["total_pipeline_duration"] = round((end_time - start_time) * 1000)
+    return final_retrieved_docs
 
-    #  6: SINH NỘI DUNG TÓM TẮT (GENERATION)
-    print("Generating summary...")
-    generation_start = time.monotonic()
-    generated_summary = ""
-
-    # Chỉ sinh tóm tắt nếu có tài liệu liên quan được tìm thấy
-    if not final_retrieved_docs:
-        generated_summary = ""
-    else:
-        # 1. Chuẩn bị bối cảnh (Context)
-        context_string = ""
-        for i, doc in enumerate(final_retrieved_docs):
-            context_string += f"--- Nguồn tài liệu {i+1}: {doc['title']} ---\n"
-            context_string += doc['content']
-            context_string += f"Từ khóa: {doc['keywords']}"
-            context_string += f"Tóm tắt: {doc['abstract']}"
-            context_string += "\n\n"
-        
-        # 2. PROMPT TÓM TẮT PHIÊN BẢN GẮT GAO
-        summarizer_prompt = f"""Bạn là một robot xử lý dữ liệu.
+# PROMPT TÓM TẮT PHIÊN BẢN GẮT GAO
+def build_summarizer_prompt(user_query: str, context_string: str) -> str:
+    return f"""Bạn là một robot xử lý dữ liệu.
 
     ### QUY TẮC TỐI THƯỢNG:
     **SỰ TRUNG THỰC TUYỆT ĐỐI:** 100% nội dung bạn tạo ra phải bắt nguồn trực tiếp từ [Kiến thức] được cung cấp. **CẤM TUYỆT ĐỐI** việc sử dụng kiến thức bên ngoài, suy luận ngoài phạm vi, hoặc bổ sung bất kỳ chi tiết nào không được nêu rõ trong văn bản. Mọi vi phạm quy tắc này sẽ làm cho kết quả bị coi là hoàn toàn sai.
@@ -219,27 +403,10 @@ def rag_pipeline(user_query: str, multi_n: int, top_k: int, alpha: float,
     [Kiến thức]
     {context_string}
     """
-        
-        # 3. Gọi LLM để sinh nội dung tóm tắt
-        if summarizer_prompt:
-            generated_summary = chat.generate(summarizer_prompt)
-        else:
-            generated_summary = "Lỗi: Không thể tải được prompt. Vui lòng kiểm tra lại file cấu hình."
-
-    report['generated_summary'] = generated_summary
-    generation_end = time.monotonic()
-    report["timings_ms"]["summary_generation"] = round((generation_end - generation_start) * 1000)
-    print("Summary generated.")
 
-
-    # --- BƯỚC MỚI: 6.2 KIỂM TRA TÍNH XÁC THỰC (GROUNDING VALIDATION) ---
-    # Kiểm tra xem nội dung tóm tắt có bịa đặt thông tin không có trong kiến thức gốc không
-    if generated_summary and generated_summary.strip():
-        print("Validating summary topic relevance (loosest criteria)...")
-        grounding_validation_start = time.monotonic()
-        
-        # PROMPT MỚI, NỚI LỎNG NHẤT
-        grounding_validator_prompt = f"""Bạn là một AI chuyên gia đánh giá sự tương đồng về chủ đề.
+# PROMPT KIỂM TRA CHỦ ĐỀ, NỚI LỎNG NHẤT
+def build_grounding_prompt(context_string: str, generated_summary: str) -> str:
+    return f"""Bạn là một AI chuyên gia đánh giá sự tương đồng về chủ đề.
     Nhiệm vụ của bạn là xác định xem [Nội dung tóm tắt] và [Văn bản gốc] có cùng nói về một chủ đề chính hay không.
 
     Hãy trả lời bằng MỘT TỪ DUY NHẤT:
@@ -254,16 +421,431 @@ def rag_pipeline(user_query: str, multi_n: int, top_k: int, alpha: float,
     [Nội dung tóm tắt]:
     {generated_summary}
     """
+
+def apply_grounding_result(grounding_result: str, generated_summary: str) -> str:
+    # CẬP NHẬT LOGIC: KIỂM TRA TỪ "LẠC ĐỀ"
+    if "LẠC ĐỀ" in grounding_result:
+        print("Validation result: OFF-TOPIC. Overwriting summary.")
+        return "Lỗi: Nội dung được tạo ra không liên quan đến chủ đề của kiến thức cung cấp."
+    print("Validation result: ON-TOPIC.")
+    return generated_summary
+
+def local_grounding_check(validation: str, embedder, generated_summary: str, context_string: str,
+                          final_retrieved_docs: List[Dict[str, Any]], lexical_threshold: float = 0.5,
+                          embedding_threshold: float = 0.5) -> Tuple[str, float]:
+    """Kiểm tra chủ đề không cần LLM ("lexical" hoặc "embedding"), trả về (kết quả như prompt LLM, điểm)."""
+    if validation == "lexical":
+        score = lexical_overlap(generated_summary, context_string)
+        return verdict(score, lexical_threshold), score
+    score = embedding_similarity(embedder, generated_summary, [doc["content"] for doc in final_retrieved_docs])
+    return verdict(score, embedding_threshold), score
+
+def build_response(report: Dict[str, Any], final_answer: str,
+                   final_retrieved_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    final_docs_for_response = []
+    for doc in final_retrieved_docs:
+        full_text = doc.get("content") or ""
+        final_docs_for_response.append({
+            "id": doc["id"],
+            "title": doc["title"],
+            "abstract": doc["abstract"],
+            "keywords": doc["keywords"],
+            "ingestion_date": doc.get("ingestion_date"),
+            "combined_score": doc["combined_score"],
+            "reranker_score": doc["reranker_score"],
+            "content": full_text[:500] + "..." if len(full_text) > 500 else full_text,
+        })
+
+    # Đóng gói mọi thứ vào một response duy nhất
+    return {
+        "report": report,
+        "generated_answer": final_answer, 
+        "results":final_docs_for_response 
+    }
+
+
+class SpeculativeRetrieval:
+    """
+    Truy xuất theo kiểu pipeline: mỗi truy vấn được tìm kiếm ngay khi `submit` (không chờ đủ danh sách),
+    embedding riêng từng truy vấn trên cùng pool với retrieve_candidates.
+    Mỗi truy vấn có deadline `timeout_s` tính từ lúc submit; `iter_results` trả về kết quả theo thứ tự hoàn thành.
+    """
+
+    def __init__(self, mgr: WeaviateManager, embedder, collection_name: str, alpha: float,
+                 limit: int = 50, timeout_s: float = 10.0,
+                 properties: List[str] = SEARCH_PROPERTIES,
+                 mode: str = "client", fusion_type: str = "ranked"):
+        if mode not in ("client", "server"):
+            raise ValueError(f"Chế độ hybrid search '{mode}' không được hỗ trợ.")
+        self.mgr = mgr
+        self.embedder = embedder
+        self.collection_name = collection_name
+        self.alpha = alpha
+        self.limit = limit
+        self.timeout_s = timeout_s
+        self.properties = properties
+        self.mode = mode
+        self.fusion_type = fusion_type
+        self.executor = get_retrieval_executor()
+        self.submitted_at: Dict[str, float] = {}
+        self._pending: Dict[str, Tuple[List[Any], float]] = {}
+
+    def submit(self, query: str, query_vector: Optional[List[float]] = None):
+        """Bắt đầu tìm kiếm `query` (bỏ qua nếu đã submit)."""
+        if query in self.submitted_at:
+            return
+        now = time.monotonic()
+        self.submitted_at[query] = now
+        futures = []
+        try:
+            if self.mode == "server":
+                futures.append(self.executor.submit(self._hybrid_server, query, query_vector))
+            else:
+                futures.append(self.executor.submit(
+                    _search_bm25, self.mgr, self.collection_name, query, self.limit, self.properties
+                ))
+                futures.append(self.executor.submit(self._vector, query, query_vector))
+        except RetrievalRejected as e:
+            # Báo quá hạn ngay ở iter_results
+            self.executor.abandon(futures)
+            print(f"Bỏ qua truy vấn '{query}': {e}")
+            futures = []
+        self._pending[query] = (futures, now + self.timeout_s)
+
+    def _embed(self, query: str, query_vector: Optional[List[float]]) -> Optional[List[float]]:
+        if query_vector is not None:
+            return query_vector
+        try:
+            return self.embedder.embed(query)
+        except Exception as e:
+            print(f"Bỏ qua vector search cho '{query}' vì không thể tạo embedding: {e}")
+            return None
+
+    def _vector(self, query: str, query_vector: Optional[List[float]]) -> List[Dict[str, Any]]:
+        query_vector = self._embed(query, query_vector)
+        if query_vector is None:
+            return []
+        return _search_vector(self.mgr, self.collection_name, query_vector, self.limit)
+
+    def _hybrid_server(self, query: str, query_vector: Optional[List[float]]) -> List[Dict[str, Any]]:
+        return _search_hybrid_server(
+            self.mgr, self.collection_name, query, self._embed(query, query_vector),
+            self.alpha, self.limit, self.properties, self.fusion_type
+        )
+
+    def _hits(self, futures: List[Any]) -> List[Dict[str, Any]]:
+        if self.mode == "server":
+            return futures[0].result()
+        return WeaviateManager.fuse_hits(futures[0].result(), futures[1].result(), self.alpha)
+
+    def iter_results(self) -> Iterator[Tuple[str, Optional[List[Dict[str, Any]]]]]:
+        """Phát ra (truy vấn, hits) theo thứ tự hoàn thành; hits là None nếu truy vấn bị quá hạn."""
+        pending = dict(self._pending)
+        self._pending.clear()
+        while pending:
+            now = time.monotonic()
+            progressed = False
+            for query, (futures, deadline) in list(pending.items()):
+                if not futures:
+                    del pending[query]
+                    progressed = True
+                    yield query, None
+                elif all(f.done() for f in futures):
+                    del pending[query]
+                    progressed = True
+                    yield query, self._hits(futures)
+                elif deadline <= now:
+                    self.executor.abandon(futures)
+                    del pending[query]
+                    progressed = True
+                    print(f"Bỏ qua truy vấn '{query}' vì vượt quá {self.timeout_s}s.")
+                    yield query, None
+            if pending and not progressed:
+                not_done = [f for futures, _ in pending.values() for f in futures if not f.done()]
+                next_deadline = min(deadline for _, deadline in pending.values())
+                wait(not_done, timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+
+
+def answer_cache_namespace(weav_collection: str, **params) -> str:
+    # Chỉ dùng lại câu trả lời được tạo với cùng collection và cùng tham số pipeline
+    return json.dumps({"collection": weav_collection, **params}, sort_keys=True, default=str)
+
+def cached_answer_response(report: Dict[str, Any], cached: Dict[str, Any],
+                           similarity: float, matched_query: str) -> Dict[str, Any]:
+    report["cache_hit"] = True
+    report["cache_similarity"] = round(similarity, 4)
+    report["intermediate_steps"]["cached_query"] = matched_query
+    report["generated_answer"] = cached["generated_answer"]
+    return {
+        "report": report,
+        "generated_answer": cached["generated_answer"],
+        "results": cached["results"]
+    }
+
+def is_cacheable_answer(response: Dict[str, Any], num_timed_out: int) -> bool:
+    # Không cache kết quả thiếu (truy vấn quá hạn), rỗng hoặc lỗi
+    answer = response["generated_answer"] or ""
+    return num_timed_out == 0 and bool(response["results"]) and bool(answer.strip()) and not answer.startswith("Lỗi")
+
+
+def iter_rag_pipeline(user_query: str, multi_n: int, top_k: int, alpha: float,
+                 weav_host: str, weav_port: int, weav_grpc: int,
+                 weav_collection: str,
+                 chat_conf: tuple, reranker_conf: tuple, embedder_conf: tuple,
+                 retrieval_timeout_s: float = 10.0,
+                 weav_conn: Optional[WeaviateConnection] = None,
+                 hybrid_mode: str = "client", hybrid_fusion: str = "ranked",
+                 fusion_strategy: str = "rrf", rrf_k: int = 60, candidate_pool: int = 50,
+                 reranker_opts: Optional[Dict[str, Any]] = None,
+                 answer_cache_opts: Optional[Dict[str, Any]] = None,
+                 expansion: str = "llm", expansion_cache_opts: Optional[Dict[str, Any]] = None,
+                 prf_docs: int = 5, prf_terms: int = 10, speculative_retrieval: bool = False,
+                 validation: str = "llm", validation_opts: Optional[Dict[str, Any]] = None,
+                 chat_opts: Optional[Dict[str, Any]] = None, context_max_tokens: int = 0,
+                 stream_summary: bool = False) -> Iterator[Tuple[str, Any]]:
+    """
+    Chạy pipeline và phát ra (tên sự kiện, dữ liệu) sau mỗi bước:
+    "queries", "candidates", "reranked", "summary_token" (chỉ khi stream_summary) và cuối cùng "result".
+    """
+
+    # --- 1. KHỞI TẠO BÁO CÁO VÀ BẮT ĐẦU ĐO THỜI GIAN ---
+    start_time = time.monotonic()
+    report = new_report(user_query, multi_n, top_k, alpha, hybrid_mode, fusion_strategy,
+                        candidate_pool, reranker_conf[1], expansion, validation)
+
+    chat = get_chat_instance(*chat_conf, **(chat_opts or {}))
+    reranker = get_reranker_instance(*reranker_conf, **(reranker_opts or {}))
+    embedder = get_embedder_instance(*embedder_conf)
+    answer_cache = get_answer_cache_instance(**(answer_cache_opts or {}))
+    expansion_cache = get_expansion_cache_instance(**(expansion_cache_opts or {}))
+
+    # --- 1.5 TRA CACHE CÂU TRẢ LỜI THEO ĐỘ TƯƠNG ĐỒNG CỦA CÂU HỎI ---
+    report["cache_hit"] = False
+    query_vector = None
+    if answer_cache is not None:
+        cache_start = time.monotonic()
+        namespace = answer_cache_namespace(
+            weav_collection, multi_n=multi_n, expansion=expansion, validation=validation,
+            context_max_tokens=context_max_tokens, top_k=top_k, alpha=alpha, hybrid_mode=hybrid_mode,
+            hybrid_fusion=hybrid_fusion, fusion_strategy=fusion_strategy, rrf_k=rrf_k,
+            candidate_pool=candidate_pool, chat=chat_conf, reranker=reranker_conf, embedder=embedder_conf
+        )
+        cached, similarity = None, None
+        try:
+            query_vector = embedder.embed(user_query)
+            if answer_cache.claim_fingerprint(weav_collection):
+                with weaviate_session(weav_conn, weav_host, weav_port) as mgr:
+                    answer_cache.update_fingerprint(weav_collection, mgr.collection_fingerprint(weav_collection))
+            cached, similarity, matched_query = answer_cache.lookup(namespace, query_vector)
+        except Exception as e:
+            print(f"Bỏ qua cache câu trả lời: {e}")
+        report["cache_similarity"] = round(similarity, 4) if similarity is not None else None
+        report["timings_ms"]["answer_cache_lookup"] = round((time.monotonic() - cache_start) * 1000)
+
+        if cached is not None:
+            print(f"Cache hit (similarity={similarity:.4f}) với câu hỏi '{matched_query}'")
+            report["timings_ms"]["total_pipeline_duration"] = round((time.monotonic() - start_time) * 1000)
+            yield "result", cached_answer_response(report, cached, similarity, matched_query)
+            return
+
+    # --- 2. BƯỚC TẠO TRUY VẤN CON (QUERY GENERATION) ---
+    print("Generating quries...")
+    query_gen_start = time.monotonic()
+
+    def search_feedback(query: str) -> List[Dict[str, Any]]:
+        with weaviate_session(weav_conn, weav_host, weav_port) as mgr:
+            return _search_bm25(mgr, weav_collection, query, prf_docs, SEARCH_PROPERTIES)
+
+    def queries_generated(multi_queries: List[str], expansion_cache_hit: bool) -> Dict[str, Any]:
+        report["timings_ms"]["query_generation"] = round((query_gen_end - query_gen_start) * 1000)
+        report["statistics"]["num_generated_queries"] = len(multi_queries)
+        report["statistics"]["expansion_cache_hit"] = expansion_cache_hit
+        report["intermediate_steps"]["generated_queries"] = multi_queries
+        print("Generate completed")
+        return {"generated_queries": multi_queries}
+
+    # Vector của câu hỏi gốc đã có từ bước tra cache thì không embedding lại
+    if speculative_retrieval:
+        # --- 2 + 3. TRUY XUẤT CHẠY CHỒNG LÊN BƯỚC TẠO TRUY VẤN CON ---
+        # Câu hỏi gốc được tìm kiếm ngay; mỗi truy vấn con được tìm kiếm ngay khi dòng của nó được stream về
+        print("Start query (speculative)...")
+        retrieval_start = query_gen_start
+        hits_per_query, timed_out = {}, []
+        with weaviate_session(weav_conn, weav_host, weav_port) as mgr:
+            retrieval = SpeculativeRetrieval(
+                mgr, embedder, weav_collection,
+                alpha=alpha,
+                limit=50,
+                timeout_s=retrieval_timeout_s,
+                mode=hybrid_mode,
+                fusion_type=hybrid_fusion
+            )
+            retrieval.submit(user_query, query_vector)
+            multi_queries, expansion_cache_hit = expand_queries(
+                chat, user_query, n=multi_n, mode=expansion, expansion_cache=expansion_cache,
+                search_feedback=search_feedback, prf_terms=prf_terms, on_query=retrieval.submit
+            )
+            query_gen_end = time.monotonic()
+            yield "queries", queries_generated(multi_queries, expansion_cache_hit)
+
+            for query, hits in retrieval.iter_results():
+                if hits is None:
+                    timed_out.append(query)
+                else:
+                    hits_per_query[query] = hits
+        all_queries = list(dict.fromkeys([user_query] + multi_queries))
+        # Thời điểm (ms, tính từ đầu bước 2) bắt đầu tìm kiếm từng truy vấn
+        report["intermediate_steps"]["search_start_offsets_ms"] = [
+            round((retrieval.submitted_at[q] - retrieval_start) * 1000) for q in all_queries if q in retrieval.submitted_at
+        ]
+    else:
+        multi_queries, expansion_cache_hit = expand_queries(
+            chat, user_query, n=multi_n, mode=expansion, expansion_cache=expansion_cache,
+            search_feedback=search_feedback, prf_terms=prf_terms
+        )
+        query_gen_end = time.monotonic()
+        yield "queries", queries_generated(multi_queries, expansion_cache_hit)
+
+        # --- 3. BƯỚC TRUY XUẤT ỨNG VIÊN (CANDIDATE RETRIEVAL) ---
+        print("Start query...")
+        retrieval_start = time.monotonic()
+        all_queries = list(dict.fromkeys([user_query] + multi_queries))
+        with weaviate_session(weav_conn, weav_host, weav_port) as mgr:
+            hits_per_query, timed_out = retrieve_candidates(
+                mgr, embedder, all_queries,
+                collection_name=weav_collection,
+                alpha=alpha,
+                limit=50,
+                timeout_s=retrieval_timeout_s,
+                mode=hybrid_mode,
+                fusion_type=hybrid_fusion,
+                query_vectors={user_query: query_vector} if query_vector is not None else None
+            )
+
+    rank_lists = [hits_per_query[q] for q in all_queries if q in hits_per_query]
+    initial_candidate_count = sum(len(hits) for hits in rank_lists)
+    num_deduplicated = len({h["id"] for hits in rank_lists for h in hits})
+    # Gộp các danh sách theo thứ hạng rồi chỉ giữ CANDIDATE_POOL ứng viên tốt nhất cho reranker
+    top_candidates = fuse_rank_lists(
+        rank_lists,
+        strategy=fusion_strategy,
+        rrf_k=rrf_k,
+        candidate_pool=candidate_pool
+    )
+
+    retrieval_end = time.monotonic()
+    report["timings_ms"]["candidate_retrieval"] = round((retrieval_end - retrieval_start) * 1000)
+    # Thời gian truy xuất chạy song song với bước tạo truy vấn con, và phần còn lại sau khi tạo xong
+    report["timings_ms"]["retrieval_overlap"] = round(max(0.0, min(query_gen_end, retrieval_end) - retrieval_start) * 1000)
+    report["timings_ms"]["retrieval_after_generation"] = round(max(0.0, retrieval_end - max(query_gen_end, retrieval_start)) * 1000)
+    report["statistics"]["num_initial_candidates"] = initial_candidate_count
+    report["statistics"]["num_deduplicated_candidates"] = num_deduplicated
+    report["statistics"]["num_timed_out_queries"] = len(timed_out)
+    print("Query completed")
+    yield "candidates", {
+        "num_candidates": len(top_candidates),
+        "candidates": [
+            {"id": c["id"], "title": c["properties"].get("title"), "combined_score": c["combined_score"]}
+            for c in top_candidates
+        ]
+    }
+
+    # --- 4. BƯỚC SẮP XẾP LẠI (RERANKING) ---
+    print("Start reranking")
+    docs_to_rerank = build_rerank_documents(top_candidates)
+    
+    report["statistics"]["num_docs_sent_to_reranker"] = min(len(docs_to_rerank), reranker.max_candidates or len(docs_to_rerank))
+    
+    rerank_start = time.monotonic()
+    reranked_results = reranker.rerank(user_query, docs_to_rerank, top_k=top_k, stats=report["statistics"])
+    rerank_end = time.monotonic()
+    report["timings_ms"]["reranking"] = round((rerank_end - rerank_start) * 1000)
+    print("Finished rerank")
+
+    # --- 5. TỔNG HỢP KẾT QUẢ CUỐI CÙNG ---
+    final_retrieved_docs = build_final_docs(reranked_results, top_candidates)
+    
+    report["statistics"]["num_final_results"] = len(final_retrieved_docs)
+    yield "reranked", {
+        "results": [
+            {k: doc[k] for k in ("id", "title", "combined_score", "reranker_score", "snippet")}
+            for doc in final_retrieved_docs
+        ]
+    }
+
+    end_time = time.monotonic()
+    report["timings_ms"]["total_pipeline_duration"] = round((end_time - start_time) * 1000)
+
+    #  6: SINH NỘI DUNG TÓM TẮT (GENERATION)
+    print("Generating summary...")
+    generation_start = time.monotonic()
+    generated_summary = ""
+    validation_opts = validation_opts or {}
+    grounding_future = None
+
+    # Chỉ sinh tóm tắt nếu có tài liệu liên quan được tìm thấy
+    if not final_retrieved_docs:
+        generated_summary = ""
+    else:
+        # 1. Chuẩn bị bối cảnh (Context)
+        context_string, packing_stats = pack_context(final_retrieved_docs, chat.count_tokens, context_max_tokens)
+        report["statistics"].update(packing_stats)
         
-        grounding_result = chat.generate(grounding_validator_prompt).strip().upper()
-        report["intermediate_steps"]["grounding_validation_result"] = grounding_result
+        # 2. PROMPT TÓM TẮT PHIÊN BẢN GẮT GAO
+        summarizer_prompt = build_summarizer_prompt(user_query, context_string)
+        
+        # 3. Gọi LLM để sinh nội dung tóm tắt
+        if summarizer_prompt and (stream_summary or validation == "streamed"):
+            summary_tokens = []
+            partial_chars = 0
+            for token in chat.generate_stream(summarizer_prompt):
+                summary_tokens.append(token)
+                partial_chars += len(token)
+                # "streamed": kiểm tra chủ đề trên phần tóm tắt đã có, chạy song song với phần còn lại
+                if (validation == "streamed" and grounding_future is None
+                        and partial_chars >= validation_opts.get("stream_min_chars", 300)):
+                    partial_summary = "".join(summary_tokens).strip().strip('"')
+                    grounding_future = get_validation_executor().submit(
+                        chat.generate, build_grounding_prompt(context_string, partial_summary)
+                    )
+                if stream_summary:
+                    yield "summary_token", {"token": token}
+            generated_summary = "".join(summary_tokens).strip().strip('"')
+        elif summarizer_prompt:
+            generated_summary = chat.generate(summarizer_prompt)
+        else:
+            generated_summary = "Lỗi: Không thể tải được prompt. Vui lòng kiểm tra lại file cấu hình."
+
+    report['generated_summary'] = generated_summary
+    generation_end = time.monotonic()
+    report["timings_ms"]["summary_generation"] = round((generation_end - generation_start) * 1000)
+    print("Summary generated.")
+
 
-        # CẬP NHẬT LOGIC: KIỂM TRA TỪ "LẠC ĐỀ"
-        if "LẠC ĐỀ" in grounding_result:
-            generated_summary = "Lỗi: Nội dung được tạo ra không liên quan đến chủ đề của kiến thức cung cấp."
-            print("Validation result: OFF-TOPIC. Overwriting summary.")
+    # --- BƯỚC MỚI: 6.2 KIỂM TRA TÍNH XÁC THỰC (GROUNDING VALIDATION) ---
+    # Kiểm tra xem nội dung tóm tắt có bịa đặt thông tin không có trong kiến thức gốc không
+    if generated_summary and generated_summary.strip() and validation != "off":
+        print(f"Validating summary topic relevance ({validation})...")
+        grounding_validation_start = time.monotonic()
+        
+        if validation in ("lexical", "embedding"):
+            grounding_result, score = local_grounding_check(
+                validation, embedder, generated_summary, context_string, final_retrieved_docs,
+                lexical_threshold=validation_opts.get("lexical_threshold", 0.5),
+                embedding_threshold=validation_opts.get("embedding_threshold", 0.5)
+            )
+            report["intermediate_steps"]["grounding_validation_score"] = round(score, 4)
+        elif grounding_future is not None:
+            # Chỉ còn chờ phần kiểm tra chưa xong khi bản tóm tắt đã sinh xong
+            grounding_result = grounding_future.result().strip().upper()
         else:
-            print("Validation result: ON-TOPIC.")
+            # PROMPT MỚI, NỚI LỎNG NHẤT
+            grounding_validator_prompt = build_grounding_prompt(context_string, generated_summary)
+            
+            grounding_result = chat.generate(grounding_validator_prompt).strip().upper()
+        report["intermediate_steps"]["grounding_validation_result"] = grounding_result
+
+        generated_summary = apply_grounding_result(grounding_result, generated_summary)
         
         grounding_validation_end = time.monotonic()
         report["timings_ms"]["grounding_validation"] = round((grounding_validation_end - grounding_validation_start) * 1000)
@@ -309,23 +891,16 @@ def rag_pipeline(user_query: str, multi_n: int, top_k: int, alpha: float,
     end_time = time.monotonic()
     report["timings_ms"]["total_pipeline_duration"] = round((end_time - start_time) * 1000)
 
-    final_docs_for_response = []
-    for doc in final_retrieved_docs:
-        full_text = doc.get("content") or ""
-        final_docs_for_response.append({
-            "id": doc["id"],
-            "title": doc["title"],
-            "abstract": doc["abstract"],
-            "keywords": doc["keywords"],
-            "ingestion_date": props.get("ingestion_date"), # <-- ĐÃ THÊM VÀO ĐÂY
-            "combined_score": doc["combined_score"],
-            "reranker_score": doc["reranker_score"],
-            "content": full_text[:500] + "..." if len(full_text) > 500 else full_text,
-        })
-
     # Đóng gói mọi thứ vào một response duy nhất
-    return {
-        "report": report,
-        "generated_answer": final_answer, 
-        "results":final_docs_for_response 
-    }
\ No newline at end of file
+    response = build_response(report, final_answer, final_retrieved_docs)
+    if answer_cache is not None and query_vector is not None and is_cacheable_answer(response, len(timed_out)):
+        answer_cache.put(namespace, weav_collection, user_query, query_vector,
+                         {"generated_answer": response["generated_answer"], "results": response["results"]})
+    yield "result", response
+
+
+def rag_pipeline(*args, **kwargs) -> Dict[str, Any]:
+    """Chạy toàn bộ pipeline và chỉ trả về kết quả cuối cùng (dùng cho /query)."""
+    for event, data in iter_rag_pipeline(*args, **kwargs):
+        if event == "result":
+            return data
\ No newline at end of file
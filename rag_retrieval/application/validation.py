@@ -0,0 +1,37 @@
+from typing import List
+import numpy as np
+from .query_expansion import content_terms
+
+
+# "llm": gọi LLM kiểm tra sau khi có bản tóm tắt (cách cũ); "streamed": gọi LLM kiểm tra song song trên phần
+# tóm tắt đã stream được; "lexical"/"embedding": kiểm tra cục bộ không cần LLM; "off": bỏ qua bước kiểm tra
+VALIDATION_STRATEGIES = ("llm", "streamed", "lexical", "embedding", "off")
+
+ON_TOPIC = "CÓ LIÊN QUAN"
+OFF_TOPIC = "LẠC ĐỀ"
+
+
+def lexical_overlap(summary: str, context_string: str) -> float:
+    """Tỉ lệ từ khóa (không tính stopword) của bản tóm tắt xuất hiện trong bối cảnh."""
+    summary_terms = set(content_terms(summary))
+    if not summary_terms:
+        return 1.0
+    context_terms = set(content_terms(context_string))
+    return len(summary_terms & context_terms) / len(summary_terms)
+
+
+def embedding_similarity(embedder, summary: str, documents: List[str]) -> float:
+    """Cosine lớn nhất giữa embedding của bản tóm tắt và từng tài liệu, một request embed_many."""
+    documents = [d for d in documents if d and d.strip()]
+    if not documents:
+        return 0.0
+    vectors = np.asarray(embedder.embed_many([summary] + documents), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms[:, None]
+    return float(np.max(vectors[1:] @ vectors[0]))
+
+
+def verdict(score: float, threshold: float) -> str:
+    """Chuyển điểm kiểm tra cục bộ về cùng định dạng kết quả với prompt kiểm tra bằng LLM."""
+    return ON_TOPIC if score >= threshold else OFF_TOPIC
@@ -9,21 +9,100 @@ class Settings:
     WEAVIATE_PORT = int(os.getenv("WEAVIATE_PORT", 8080))
     WEAVIATE_GRPC = int(os.getenv("WEAVIATE_GRPC_PORT", 50051))
     WEAVIATE_COLLECTION_NAME = os.getenv("WEAVIATE_COLLECTION_NAME", "DemoCollection")
+    WEAVIATE_HEALTH_CHECK_S = float(os.getenv("WEAVIATE_HEALTH_CHECK_S", 30))
 
     # Ollama
+    EMBEDDER_PROVIDER = os.getenv("EMBEDDER_PROVIDER", "ollama")
+    EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
     CHAT_PROVIDER = os.getenv("CHAT_PROVIDER", "ollama")
     CHAT_MODEL = os.getenv("CHAT_MODEL", "llama3.2:3b")
+    # Tokenizer HF tương ứng với CHAT_MODEL để đếm token của bối cảnh (rỗng => ước lượng theo số ký tự)
+    CHAT_TOKENIZER = os.getenv("CHAT_TOKENIZER", "")
+    # Ngân sách token cho bối cảnh trong prompt tóm tắt (0 => không giới hạn)
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 1500))
+    # Ollama: thời gian giữ model trong bộ nhớ và các option sinh (0 => dùng mặc định của model)
+    CHAT_KEEP_ALIVE = os.getenv("CHAT_KEEP_ALIVE", "30m")
+    CHAT_NUM_CTX = int(os.getenv("CHAT_NUM_CTX", 4096))
+    CHAT_NUM_PREDICT = int(os.getenv("CHAT_NUM_PREDICT", 0))
+    CHAT_NUM_THREAD = int(os.getenv("CHAT_NUM_THREAD", 0))
+    CHAT_POOL_SIZE = int(os.getenv("CHAT_POOL_SIZE", 8))
+    # Nạp sẵn chat model khi app khởi động
+    CHAT_WARMUP = os.getenv("CHAT_WARMUP", "True").lower() in ("1", "true", "yes")
 
     # Reranker
     RERANKER_PROVIDER = os.getenv("RERANKER_PROVIDER", "bge")
     RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 16))
+    RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 512))
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 10000))
+    RERANK_CACHE_PATH = os.getenv("RERANK_CACHE_PATH", "")  # để trống => chỉ cache trong bộ nhớ
+    RERANK_CACHE_DISK_SIZE = int(os.getenv("RERANK_CACHE_DISK_SIZE", 1000000))  # số điểm tối đa trong file SQLite
+    RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", 1))  # số thread rerank của app ASGI
+
+    # Reranker ONNX (RERANKER_PROVIDER=onnx)
+    ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "")  # để trống => onnx_models/<tên model>
+    ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "True").lower() in ("1", "true", "yes")
+    ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))
+    ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", 0))
 
     # Hyperparams
     MULTI_QUERY_N = int(os.getenv("MULTI_QUERY_N", 5))
     HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", 0.6))
-    CANDIDATE_POOL = int(os.getenv("CANDIDATE_POOL", 200))
+    HYBRID_MODE = os.getenv("HYBRID_MODE", "client")  # client | server
+    HYBRID_FUSION = os.getenv("HYBRID_FUSION", "ranked")  # ranked | relative_score
+    FUSION_STRATEGY = os.getenv("FUSION_STRATEGY", "rrf")  # rrf | combsum | combmnz | max
+    RRF_K = int(os.getenv("RRF_K", 60))
+    CANDIDATE_POOL = int(os.getenv("CANDIDATE_POOL", 50))
     RERANK_TOPK = int(os.getenv("RERANK_TOPK", 5))
 
+    # Query expansion
+    QUERY_EXPANSION = os.getenv("QUERY_EXPANSION", "llm")  # llm | prf | keywords | none
+    EXPANSION_CACHE_SIZE = int(os.getenv("EXPANSION_CACHE_SIZE", 1000))  # 0 => tắt
+    EXPANSION_CACHE_TTL_S = float(os.getenv("EXPANSION_CACHE_TTL_S", 3600))
+    PRF_FEEDBACK_DOCS = int(os.getenv("PRF_FEEDBACK_DOCS", 5))
+    PRF_FEEDBACK_TERMS = int(os.getenv("PRF_FEEDBACK_TERMS", 10))
+
+    # Grounding validation
+    VALIDATION_STRATEGY = os.getenv("VALIDATION_STRATEGY", "llm")  # llm | streamed | lexical | embedding | off
+    VALIDATION_LEXICAL_THRESHOLD = float(os.getenv("VALIDATION_LEXICAL_THRESHOLD", 0.5))
+    VALIDATION_EMBEDDING_THRESHOLD = float(os.getenv("VALIDATION_EMBEDDING_THRESHOLD", 0.5))
+    VALIDATION_STREAM_MIN_CHARS = int(os.getenv("VALIDATION_STREAM_MIN_CHARS", 300))
+
+    # Semantic answer cache
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1000))  # 0 => tắt
+    ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", 3600))
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+    ANSWER_CACHE_FINGERPRINT_S = float(os.getenv("ANSWER_CACHE_FINGERPRINT_S", 30))
+
+    # Retrieval
+    RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", 8))
+    RETRIEVAL_TIMEOUT_S = float(os.getenv("RETRIEVAL_TIMEOUT_S", 10))
+    # Số tác vụ quá hạn (không dừng được) được chạy nốt trên thread dự phòng; vượt quá => từ chối truy xuất mới
+    RETRIEVAL_MAX_ORPHANS = int(os.getenv("RETRIEVAL_MAX_ORPHANS", 8))
+    # Tìm kiếm câu hỏi gốc (và từng truy vấn con ngay khi được stream về) trong lúc LLM đang sinh truy vấn con
+    SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "True").lower() in ("1", "true", "yes")
+
+    # Ingestion (run_add_products.py)
+    INGEST_MODE = os.getenv("INGEST_MODE", "incremental")  # incremental | full
+    LOAD_MAX_WORKERS = int(os.getenv("LOAD_MAX_WORKERS", 0))  # process parse PDF/DOCX (0 => số CPU)
+    # Trường=hậu tố của file đi kèm file .md chính; abstract_text (nếu có) thay cho abstract sinh bằng LLM
+    MERGE_COMPANION_SUFFIXES = os.getenv("MERGE_COMPANION_SUFFIXES", "kw_text=_kw.md")
+    INGEST_FILE_WORKERS = int(os.getenv("INGEST_FILE_WORKERS", 4))
+    INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 2))
+    INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 64))
+    INGEST_WRITE_BATCH_SIZE = int(os.getenv("INGEST_WRITE_BATCH_SIZE", 200))
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 1000))
+    INGEST_SUMMARIZE = os.getenv("INGEST_SUMMARIZE", "True").lower() in ("1", "true", "yes")
+    # Endpoint xóa cache câu trả lời của app sau khi nạp xong (rỗng => không gọi)
+    ANSWER_CACHE_INVALIDATE_URL = os.getenv("ANSWER_CACHE_INVALIDATE_URL", "http://localhost:5000/cache/invalidate")
+
     # Flask
     RAG_FLASK_PORT = int(os.getenv("RAG_FLASK_PORT", 5000))
-    RAG_FLASK_DEBUG = bool(os.getenv("RAG_FLASK_DEBUG", False))
\ No newline at end of file
+    RAG_FLASK_DEBUG = bool(os.getenv("RAG_FLASK_DEBUG", False))
+
+    # Route vận hành (/cache/invalidate) yêu cầu header X-Admin-Token bằng giá trị này (rỗng => tắt route)
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+    # ASGI
+    RAG_ASGI_PORT = int(os.getenv("RAG_ASGI_PORT", 8000))
+    RAG_ASGI_WORKERS = int(os.getenv("RAG_ASGI_WORKERS", 1))
\ No newline at end of file
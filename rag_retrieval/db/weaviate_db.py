@@ -1,10 +1,28 @@
 import weaviate
 import weaviate.classes as wvc
 from weaviate.classes.config import Configure, Property, DataType
-from weaviate.classes.query import MetadataQuery
+from weaviate.classes.query import MetadataQuery, HybridFusion, Filter, Sort
 from weaviate.classes.init import AdditionalConfig
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from datetime import datetime
+from contextlib import contextmanager, asynccontextmanager
+import threading
+import asyncio
+import time
+
+
+# Object cập nhật gần nhất của collection (chỉ lấy metadata)
+_LATEST_UPDATE_QUERY = dict(
+    limit=1, sort=Sort.by_update_time(ascending=False), return_properties=[],
+    return_metadata=MetadataQuery(last_update_time=True)
+)
+
+
+def _fingerprint(total_count, latest_objects) -> str:
+    # Thêm hoặc cập nhật object làm tăng thời điểm cập nhật gần nhất, xóa object làm giảm số object
+    updated = latest_objects[0].metadata.last_update_time if latest_objects and latest_objects[0].metadata else None
+    return f"{total_count}:{updated.timestamp() if updated else ''}"
+
 
 class WeaviateManager:
     def __init__(self, host="10.1.1.237", http_port=3000):
@@ -12,7 +30,7 @@ class WeaviateManager:
         self.http_port = http_port
         self.client = None
 
-    def __enter__(self):
+    def connect(self):
         try:
             # ✅ Kết nối REST-only, bỏ toàn bộ gRPC
             self.client = weaviate.connect_to_local(
@@ -25,9 +43,22 @@ class WeaviateManager:
         except Exception as e:
             raise ConnectionError(f"Không thể kết nối tới Weaviate: {e}")
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    def close(self):
         if self.client:
             self.client.close()
+            self.client = None
+
+    def is_ready(self) -> bool:
+        try:
+            return self.client is not None and self.client.is_ready()
+        except Exception:
+            return False
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def create_collection(self, name: str, properties: List[Property], force_recreate: bool = False):
         if force_recreate and self.client.collections.exists(name):
@@ -46,6 +77,35 @@ class WeaviateManager:
                 )
             )
 
+    def ensure_properties(self, name: str, properties: List[Property]):
+        """Thêm các property còn thiếu vào collection đã có (ví dụ collection tạo trước khi có hash nội dung)."""
+        collection = self.client.collections.get(name)
+        existing = {p.name for p in collection.config.get().properties}
+        for prop in properties:
+            if prop.name not in existing:
+                collection.config.add_property(prop)
+
+    def collection_fingerprint(self, collection_name: str) -> str:
+        """
+        (số object, thời điểm cập nhật gần nhất) của collection, dùng để phát hiện collection đã bị nạp lại/thay đổi
+        nội dung kể cả khi số object không đổi. Chỉ gồm một aggregate và một query 1 object, không duyệt collection.
+        """
+        collection = self.client.collections.get(collection_name)
+        total_count = collection.aggregate.over_all(total_count=True).total_count
+        return _fingerprint(total_count, collection.query.fetch_objects(**_LATEST_UPDATE_QUERY).objects)
+
+    def source_index(self, collection_name: str) -> Dict[str, Dict[str, Any]]:
+        """title -> {"source_hashes": các hash file nguồn, "uuids": uuid các chunk} của toàn bộ object đã có."""
+        index: Dict[str, Dict[str, Any]] = {}
+        if not self.client.collections.exists(collection_name):
+            return index
+        collection = self.client.collections.get(collection_name)
+        for obj in collection.iterator(return_properties=["title", "source_hash"]):
+            entry = index.setdefault(obj.properties.get("title"), {"source_hashes": set(), "uuids": []})
+            entry["source_hashes"].add(obj.properties.get("source_hash"))
+            entry["uuids"].append(str(obj.uuid))
+        return index
+
     # def add(self, collection_name: str, properties: Dict[str, Any]):
     #     collection = self.client.collections.get(collection_name)
     #     collection.data.insert(properties=properties)
@@ -54,6 +114,31 @@ class WeaviateManager:
         # Gửi cả properties và vector (nếu có)
         collection.data.insert(properties=properties, vector=vector)
 
+    def add_many(self, collection_name: str,
+                 objects: List[Tuple[Dict[str, Any], Optional[List[float]], Optional[str]]]) -> int:
+        """Ghi nhiều (properties, vector, uuid) trong một request insert_many, trả về số object bị lỗi."""
+        collection = self.client.collections.get(collection_name)
+        result = collection.data.insert_many([
+            wvc.data.DataObject(properties=properties, vector=vector, uuid=uuid) for properties, vector, uuid in objects
+        ])
+        for index, error in result.errors.items():
+            print(f"   ❌ Lỗi object {index}: {error.message}")
+        return len(result.errors)
+
+    def update_properties(self, collection_name: str, uuid: str, properties: Dict[str, Any]):
+        # Chỉ cập nhật properties, giữ nguyên vector
+        collection = self.client.collections.get(collection_name)
+        collection.data.update(uuid=uuid, properties=properties)
+
+    def delete_many(self, collection_name: str, uuids: List[str], batch_size: int = 1000) -> int:
+        """Xóa các object theo uuid (mỗi request tối đa `batch_size` uuid), trả về số object đã xóa."""
+        collection = self.client.collections.get(collection_name)
+        deleted = 0
+        for i in range(0, len(uuids), batch_size):
+            result = collection.data.delete_many(where=Filter.by_id().contains_any(uuids[i : i + batch_size]))
+            deleted += result.successful
+        return deleted
+
     # def search(self, collection_name: str, query: str, search_type: str, limit: int = 5, properties: List[str] = None) -> List[Dict]:
     #     collection = self.client.collections.get(collection_name)
         
@@ -97,12 +182,7 @@ class WeaviateManager:
                 limit=limit, 
                 return_metadata=["distance"]
             )
-            results = []
-            for obj in response.objects:
-                distance = getattr(obj.metadata, "distance", None)
-                score = 1 - distance if distance is not None else None
-                results.append({"uuid": str(obj.uuid), "properties": obj.properties, "score": score, "distance": distance})
-            return results
+            return self._vector_hits(response)
 
         elif search_type == "bm25":
             if not query_text:
@@ -111,7 +191,7 @@ class WeaviateManager:
             response = collection.query.bm25(
                 query=query_text, query_properties=properties, limit=limit, return_metadata=MetadataQuery(score=True)
             )
-            return [{"uuid": str(obj.uuid), "properties": obj.properties, "score": getattr(obj.metadata, "score", None)} for obj in response.objects]
+            return self._bm25_hits(response)
         else:
             raise ValueError(f"Loại tìm kiếm '{search_type}' không được hỗ trợ.")
 
@@ -123,8 +203,24 @@ class WeaviateManager:
         query_vector: List[float],
         alpha: float,
         limit: int = 50,
-        properties: List[str] = ["title", "abstract", "keywords", "text"]
+        properties: List[str] = ["title", "abstract", "keywords", "text"],
+        mode: str = "client",
+        fusion_type: str = "ranked",
+        return_properties: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
+        """
+        mode="client": chạy BM25 và near_vector riêng rồi fuse điểm ở Python (fuse_hits).
+        mode="server": một lệnh query.hybrid duy nhất, Weaviate tự fuse theo `fusion_type`
+        ("ranked" hoặc "relative_score") và chỉ trả về `return_properties`.
+        """
+        if mode == "server":
+            return self._server_hybrid_search(
+                collection_name, query_text, query_vector, alpha, limit,
+                properties, fusion_type, return_properties
+            )
+        elif mode != "client":
+            raise ValueError(f"Chế độ hybrid search '{mode}' không được hỗ trợ.")
+
         try:
             hits_bm25 = self.search(collection_name, "bm25", limit, query_text=query_text, properties=properties)
         except Exception:
@@ -145,6 +241,73 @@ class WeaviateManager:
         # except Exception:
         #     hits_vec = []
 
+        return self.fuse_hits(hits_bm25, hits_vec, alpha)
+
+    def _server_hybrid_search(
+        self,
+        collection_name: str,
+        query_text: str,
+        query_vector: List[float],
+        alpha: float,
+        limit: int,
+        properties: List[str],
+        fusion_type: str,
+        return_properties: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        collection = self.client.collections.get(collection_name)
+        response = collection.query.hybrid(
+            query=query_text,
+            vector=query_vector or None,
+            alpha=alpha,
+            query_properties=properties,
+            fusion_type=self._hybrid_fusion(fusion_type),
+            limit=limit,
+            return_properties=return_properties,
+            return_metadata=MetadataQuery(score=True)
+        )
+        return self._hybrid_hits(response)
+
+    @staticmethod
+    def _hybrid_fusion(fusion_type: str) -> HybridFusion:
+        fusion = {
+            "ranked": HybridFusion.RANKED,
+            "relative_score": HybridFusion.RELATIVE_SCORE,
+        }.get(fusion_type)
+        if fusion is None:
+            raise ValueError(f"Kiểu fusion '{fusion_type}' không được hỗ trợ.")
+        return fusion
+
+    @staticmethod
+    def _vector_hits(response) -> List[Dict[str, Any]]:
+        results = []
+        for obj in response.objects:
+            distance = getattr(obj.metadata, "distance", None)
+            score = 1 - distance if distance is not None else None
+            results.append({"uuid": str(obj.uuid), "properties": obj.properties, "score": score, "distance": distance})
+        return results
+
+    @staticmethod
+    def _bm25_hits(response) -> List[Dict[str, Any]]:
+        return [{"uuid": str(obj.uuid), "properties": obj.properties, "score": getattr(obj.metadata, "score", None)} for obj in response.objects]
+
+    @staticmethod
+    def _hybrid_hits(response) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": str(obj.uuid),
+                "properties": obj.properties,
+                "combined_score": getattr(obj.metadata, "score", None) or 0.0,
+            }
+            for obj in response.objects
+        ]
+
+    @staticmethod
+    def fuse_hits(
+        hits_bm25: List[Dict[str, Any]],
+        hits_vec: List[Dict[str, Any]],
+        alpha: float
+    ) -> List[Dict[str, Any]]:
+        """Kết hợp kết quả BM25 và vector search của cùng một truy vấn thành combined_score."""
         candidates: Dict[str, Dict[str, Any]] = {}
         for h in hits_bm25 + hits_vec:
             doc_id = h.get("uuid")
@@ -193,6 +356,209 @@ class WeaviateManager:
 
 
 
+class WeaviateConnection:
+    """
+    Giữ một WeaviateManager đã kết nối sẵn trong suốt vòng đời của app để các request dùng lại,
+    thay vì connect/close ở mỗi request. Kết nối được health-check định kỳ và tự kết nối lại khi hỏng.
+    """
+
+    def __init__(self, host: str, http_port: int, health_check_interval: float = 30.0):
+        self.host = host
+        self.http_port = http_port
+        self.health_check_interval = health_check_interval
+        self._manager: Optional[WeaviateManager] = None
+        self._last_health_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> WeaviateManager:
+        with self._lock:
+            now = time.monotonic()
+            if self._manager is None:
+                self._connect()
+            elif now - self._last_health_check > self.health_check_interval:
+                if not self._manager.is_ready():
+                    print("Kết nối Weaviate không còn hoạt động, đang kết nối lại...")
+                    self._manager.close()
+                    self._connect()
+                self._last_health_check = now
+            return self._manager
+
+    def _connect(self):
+        self._manager = WeaviateManager(host=self.host, http_port=self.http_port).connect()
+        self._last_health_check = time.monotonic()
+
+    @contextmanager
+    def session(self):
+        """Dùng thay cho `with WeaviateManager(...)`, nhưng không đóng kết nối khi thoát."""
+        yield self.get()
+
+    def close(self):
+        with self._lock:
+            if self._manager is not None:
+                self._manager.close()
+                self._manager = None
+
+
+class AsyncWeaviateManager:
+    """
+    Bản async của WeaviateManager (WeaviateAsyncClient, REST-only) cho app ASGI.
+    Chỉ hỗ trợ các thao tác đọc mà pipeline truy vấn cần; kết quả có cùng định dạng với bản đồng bộ.
+    """
+
+    def __init__(self, host="10.1.1.237", http_port=3000):
+        self.host = host
+        self.http_port = http_port
+        self.client = None
+
+    async def connect(self):
+        try:
+            self.client = weaviate.use_async_with_local(
+                host=self.host,
+                port=self.http_port,
+                skip_init_checks=True,  # bỏ health-check gRPC
+                additional_config=AdditionalConfig(timeout=(10, 60)),
+            )
+            await self.client.connect()
+            return self
+        except Exception as e:
+            raise ConnectionError(f"Không thể kết nối tới Weaviate: {e}")
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
+            self.client = None
+
+    async def is_ready(self) -> bool:
+        try:
+            return self.client is not None and await self.client.is_ready()
+        except Exception:
+            return False
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def collection_fingerprint(self, collection_name: str) -> str:
+        collection = self.client.collections.get(collection_name)
+        aggregate, latest = await asyncio.gather(
+            collection.aggregate.over_all(total_count=True),
+            collection.query.fetch_objects(**_LATEST_UPDATE_QUERY),
+        )
+        return _fingerprint(aggregate.total_count, latest.objects)
+
+    async def search(
+        self,
+        collection_name: str,
+        search_type: str,
+        limit: int = 5,
+        query_text: str = None,
+        query_vector: List[float] = None,
+        properties: List[str] = None
+    ) -> List[Dict]:
+        collection = self.client.collections.get(collection_name)
+
+        if search_type == "vector":
+            if not query_vector:
+                raise ValueError("Tìm kiếm vector yêu cầu một 'query_vector'.")
+            response = await collection.query.near_vector(
+                near_vector=query_vector,
+                limit=limit,
+                return_metadata=["distance"]
+            )
+            return WeaviateManager._vector_hits(response)
+
+        elif search_type == "bm25":
+            if not query_text:
+                raise ValueError("Tìm kiếm BM25 yêu cầu một 'query_text'.")
+            response = await collection.query.bm25(
+                query=query_text, query_properties=properties, limit=limit, return_metadata=MetadataQuery(score=True)
+            )
+            return WeaviateManager._bm25_hits(response)
+        else:
+            raise ValueError(f"Loại tìm kiếm '{search_type}' không được hỗ trợ.")
+
+    async def hybrid_search(
+        self,
+        collection_name: str,
+        query_text: str,
+        query_vector: List[float],
+        alpha: float,
+        limit: int = 50,
+        properties: List[str] = ["title", "abstract", "keywords", "text"],
+        mode: str = "client",
+        fusion_type: str = "ranked",
+        return_properties: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Giống WeaviateManager.hybrid_search; ở mode="client" BM25 và near_vector chạy song song."""
+        if mode == "server":
+            collection = self.client.collections.get(collection_name)
+            response = await collection.query.hybrid(
+                query=query_text,
+                vector=query_vector or None,
+                alpha=alpha,
+                query_properties=properties,
+                fusion_type=WeaviateManager._hybrid_fusion(fusion_type),
+                limit=limit,
+                return_properties=return_properties,
+                return_metadata=MetadataQuery(score=True)
+            )
+            return WeaviateManager._hybrid_hits(response)
+        elif mode != "client":
+            raise ValueError(f"Chế độ hybrid search '{mode}' không được hỗ trợ.")
+
+        hits_bm25, hits_vec = await asyncio.gather(
+            self.search(collection_name, "bm25", limit, query_text=query_text, properties=properties),
+            self.search(collection_name, "vector", limit, query_vector=query_vector),
+            return_exceptions=True
+        )
+        if isinstance(hits_bm25, Exception):
+            hits_bm25 = []
+        if isinstance(hits_vec, Exception):
+            hits_vec = []
+        return WeaviateManager.fuse_hits(hits_bm25, hits_vec, alpha)
+
+
+class AsyncWeaviateConnection:
+    """Tương tự WeaviateConnection nhưng giữ một AsyncWeaviateManager, dùng asyncio.Lock."""
+
+    def __init__(self, host: str, http_port: int, health_check_interval: float = 30.0):
+        self.host = host
+        self.http_port = http_port
+        self.health_check_interval = health_check_interval
+        self._manager: Optional[AsyncWeaviateManager] = None
+        self._last_health_check = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> AsyncWeaviateManager:
+        async with self._lock:
+            now = time.monotonic()
+            if self._manager is None:
+                await self._connect()
+            elif now - self._last_health_check > self.health_check_interval:
+                if not await self._manager.is_ready():
+                    print("Kết nối Weaviate không còn hoạt động, đang kết nối lại...")
+                    await self._manager.close()
+                    await self._connect()
+                self._last_health_check = now
+            return self._manager
+
+    async def _connect(self):
+        self._manager = await AsyncWeaviateManager(host=self.host, http_port=self.http_port).connect()
+        self._last_health_check = time.monotonic()
+
+    @asynccontextmanager
+    async def session(self):
+        """Dùng thay cho `async with AsyncWeaviateManager(...)`, nhưng không đóng kết nối khi thoát."""
+        yield await self.get()
+
+    async def close(self):
+        async with self._lock:
+            if self._manager is not None:
+                await self._manager.close()
+                self._manager = None
+
 
 def gen():
     """
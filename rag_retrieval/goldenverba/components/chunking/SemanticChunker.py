@@ -1,13 +1,8 @@
-import contextlib
-
 from wasabi import msg
 
-with contextlib.suppress(Exception):
-    from sklearn.metrics.pairwise import cosine_similarity
-
 from goldenverba.components.chunk import Chunk
 from goldenverba.components.interfaces import Chunker
-from goldenverba.components.document import Document
+from goldenverba.components.document import Document, parse_documents
 from goldenverba.components.types import InputConfig
 from goldenverba.components.interfaces import Embedding
 
@@ -22,7 +17,6 @@ class SemanticChunker(Chunker):
     def __init__(self):
         super().__init__()
         self.name = "Semantic"
-        self.requires_library = ["sklearn"]
         self.description = (
             "Split documents based on semantic similarity or max sentences"
         )
@@ -55,6 +49,9 @@ class SemanticChunker(Chunker):
         )
         max_sentences = int(config["Max Sentences Per Chunk"].value)
 
+        # Parse all pending documents in one nlp.pipe pass per language
+        parse_documents([document for document in documents if len(document.chunks) == 0])
+
         for document in documents:
 
             # Skip if document already contains chunks
@@ -172,24 +169,19 @@ class SemanticChunker(Chunker):
         return sentences
 
     def calculate_cosine_distances(self, sentences):
-        distances = []
-        for i in range(len(sentences) - 1):
-            embedding_current = sentences[i]["combined_sentence_embedding"]
-            embedding_next = sentences[i + 1]["combined_sentence_embedding"]
-
-            # Calculate cosine similarity
-            similarity = cosine_similarity([embedding_current], [embedding_next])[0][0]
-
-            # Convert to cosine distance
-            distance = 1 - similarity
-
-            # Append cosine distance to the list
-            distances.append(distance)
-
-            # Store distance in the dictionary
-            sentences[i]["distance_to_next"] = distance
-
-        # Optionally handle the last sentence
-        # sentences[-1]['distance_to_next'] = None  # or a default value
+        # Cosine distance of every adjacent pair as one row-wise dot product of the normalised embeddings
+        embeddings = np.asarray(
+            [sentence["combined_sentence_embedding"] for sentence in sentences],
+            dtype=np.float32,
+        )
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings = embeddings / norms
+        similarities = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+        distances = (1 - similarities).tolist()
+
+        # Store distance in the dictionary
+        for sentence, distance in zip(sentences, distances):
+            sentence["distance_to_next"] = distance
 
         return distances, sentences
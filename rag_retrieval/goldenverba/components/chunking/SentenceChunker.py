@@ -2,7 +2,7 @@ from wasabi import msg
 
 from goldenverba.components.chunk import Chunk
 from goldenverba.components.interfaces import Chunker
-from goldenverba.components.document import Document
+from goldenverba.components.document import Document, parse_documents
 from goldenverba.components.types import InputConfig
 from goldenverba.components.interfaces import Embedding
 
@@ -42,14 +42,17 @@ class SentenceChunker(Chunker):
         units = int(config["Sentences"].value)
         overlap = int(config["Overlap"].value)
 
-        for document in documents:
+        # Parse all pending documents in one nlp.pipe pass per language
+        parse_documents([document for document in documents if len(document.chunks) == 0])
 
-            doc = document.spacy_doc
+        for document in documents:
 
             # Skip if document already contains chunks
             if len(document.chunks) > 0:
                 continue
 
+            doc = document.spacy_doc
+
             sentences = [sent.text for sent in doc.sents]
 
             # If Split Size is higher than actual Token Count or if Split Size is Zero
@@ -4,36 +4,54 @@ from spacy.tokens import Doc
 from spacy.language import Language
 import spacy
 import json
+import os
+import threading
 
 from langdetect import detect
 
 
-def load_nlp_for_language(language: str):
-    """Load SpaCy models based on language"""
-    if language == "en":
-        nlp = spacy.blank("en")
-    elif language == "zh":
-        nlp = spacy.blank("zh")
-    elif language == "zh-hant":
-        nlp = spacy.blank("zh-hant")
-    elif language == "fr":
-        nlp = spacy.blank("fr")
-    elif language == "de":
-        nlp = spacy.blank("de")
-    elif language == "nl":
-        nlp = spacy.blank("nl")
-    else:
-        nlp = spacy.blank("en")
-
-    nlp.add_pipe("sentencizer")
+SUPPORTED_LANGUAGES = ("en", "zh", "zh-hant", "fr", "de", "nl")
 
+# Texts longer than this are split and parsed through nlp.pipe
+MAX_BATCH_SIZE = 500000
+# Language detection only looks at a bounded sample of the content
+LANGUAGE_SAMPLE_SIZE = 5000
+# Worker processes for nlp.pipe on large parses
+SPACY_N_PROCESS = int(os.getenv("SPACY_N_PROCESS", 1))
+
+_nlp_cache: dict[str, Language] = {}
+_nlp_lock = threading.Lock()
+
+
+def load_nlp_for_language(language: str) -> Language:
+    """Load SpaCy models based on language, cached per language"""
+    if language not in SUPPORTED_LANGUAGES:
+        language = "en"
+
+    with _nlp_lock:
+        nlp = _nlp_cache.get(language)
+        if nlp is None:
+            nlp = spacy.blank(language)
+            nlp.add_pipe("sentencizer")
+            _nlp_cache[language] = nlp
     return nlp
 
 
+def language_sample(text: str, sample_size: int = LANGUAGE_SAMPLE_SIZE) -> str:
+    """Take the start, middle and end of long texts so detection stays cheap but representative"""
+    if len(text) <= sample_size:
+        return text
+    part = sample_size // 3
+    middle = len(text) // 2
+    return " ".join(
+        [text[:part], text[middle - part // 2 : middle + part // 2], text[-part:]]
+    )
+
+
 def detect_language(text: str) -> str:
     """Automatically detect language"""
     try:
-        detected_lang = detect(text)
+        detected_lang = detect(language_sample(text))
         if detected_lang == "zh-cn":
             return "zh"
         elif detected_lang == "zh-tw" or detected_lang == "zh-hk":
@@ -43,6 +61,40 @@ def detect_language(text: str) -> str:
         return "unknown"
 
 
+def parse_content(content: str, n_process: int = SPACY_N_PROCESS) -> Doc:
+    """Parse content with the cached pipeline of its detected language"""
+    nlp = load_nlp_for_language(detect_language(content))
+
+    if len(content) > MAX_BATCH_SIZE:
+        # Process content in batches, merged back into a single Doc
+        batches = [
+            content[i : i + MAX_BATCH_SIZE]
+            for i in range(0, len(content), MAX_BATCH_SIZE)
+        ]
+        return Doc.from_docs(list(nlp.pipe(batches, n_process=n_process, batch_size=1)))
+
+    return nlp(content)
+
+
+def parse_documents(documents: list["Document"], n_process: int = SPACY_N_PROCESS):
+    """Parse every document that has not been parsed yet, batching them per language through nlp.pipe"""
+    by_language: dict[str, list[Document]] = {}
+    for document in documents:
+        if document._spacy_doc is not None:
+            continue
+        if len(document.content) > MAX_BATCH_SIZE:
+            document._spacy_doc = parse_content(document.content, n_process)
+            continue
+        language = detect_language(document.content)
+        by_language.setdefault(language, []).append(document)
+
+    for language, group in by_language.items():
+        nlp = load_nlp_for_language(language)
+        texts = (document.content for document in group)
+        for document, doc in zip(group, nlp.pipe(texts, n_process=n_process)):
+            document._spacy_doc = doc
+
+
 class Document:
     def __init__(
         self,
@@ -65,26 +117,18 @@ class Document:
         self.metadata = metadata
         self.chunks: list[Chunk] = []
 
-        MAX_BATCH_SIZE = 500000
-
-        if len(content) > MAX_BATCH_SIZE:
-            # Process content in batches
-            docs = []
-            detected_language = detect_language(content[0:MAX_BATCH_SIZE])
-            nlp = load_nlp_for_language(detected_language)
+        # Parsed on first access, most chunkers never need it
+        self._spacy_doc: Doc | None = None
 
-            for i in range(0, len(content), MAX_BATCH_SIZE):
-                docs.append(nlp(content[i : i + MAX_BATCH_SIZE]))
-
-            # Merged all processed docs
-            doc = Doc.from_docs(docs)
-        else:
-            # Process smaller content, directly based on language
-            detected_language = detect_language(content)
-            nlp = load_nlp_for_language(detected_language)
-            doc = nlp(content)
+    @property
+    def spacy_doc(self) -> Doc:
+        if self._spacy_doc is None:
+            self._spacy_doc = parse_content(self.content)
+        return self._spacy_doc
 
-        self.spacy_doc = doc
+    @spacy_doc.setter
+    def spacy_doc(self, doc: Doc):
+        self._spacy_doc = doc
 
     @staticmethod
     def to_json(document) -> dict:
@@ -1,7 +1,6 @@
 import os
 import requests
 from wasabi import msg
-import aiohttp
 from urllib.parse import urljoin
 
 from goldenverba.components.interfaces import Embedding
@@ -33,12 +32,12 @@ class OllamaEmbedder(Embedding):
 
         data = {"model": model, "input": content}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(urljoin(self.url, "/api/embed"), json=data) as response:
-                response.raise_for_status()
-                data = await response.json()
-                embeddings = data.get("embeddings", [])
-                return embeddings
+        session = self.get_session()
+        async with session.post(urljoin(self.url, "/api/embed"), json=data) as response:
+            response.raise_for_status()
+            data = await response.json()
+            embeddings = data.get("embeddings", [])
+            return embeddings
 
 
 def get_models(url: str):
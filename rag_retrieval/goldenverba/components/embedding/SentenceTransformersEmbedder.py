@@ -1,12 +1,74 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from wasabi import msg
+
 from goldenverba.components.interfaces import Embedding
 from goldenverba.components.types import InputConfig
 
 try:
     from sentence_transformers import SentenceTransformer
+    import numpy as np
 except Exception as e:
     pass
 
 
+class SentenceTransformerRegistry:
+    """
+    Loads each SentenceTransformer model once per process and encodes on a
+    dedicated single-thread executor per model, so encodes of the same model
+    are queued instead of competing for it and never block the event loop.
+    """
+
+    def __init__(self):
+        self.models: dict[str, "SentenceTransformer"] = {}
+        self.executors: dict[str, ThreadPoolExecutor] = {}
+        self.lock = threading.Lock()
+
+    def get_executor(self, model_name: str) -> ThreadPoolExecutor:
+        with self.lock:
+            if model_name not in self.executors:
+                self.executors[model_name] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"encode-{model_name}"
+                )
+            return self.executors[model_name]
+
+    def get_model(self, model_name: str) -> "SentenceTransformer":
+        # Only called from the model's own executor thread, so a model is never loaded twice
+        if model_name not in self.models:
+            msg.info(f"Loading SentenceTransformer model {model_name}")
+            self.models[model_name] = SentenceTransformer(model_name)
+        return self.models[model_name]
+
+    def encode(
+        self, model_name: str, content: list[str], batch_size: int, normalize: bool
+    ) -> list[list[float]]:
+        embeddings = self.get_model(model_name).encode(
+            content,
+            batch_size=batch_size,
+            normalize_embeddings=normalize,
+            convert_to_numpy=True,
+        )
+        return embeddings.astype(np.float32).tolist()
+
+    async def aencode(
+        self, model_name: str, content: list[str], batch_size: int, normalize: bool
+    ) -> list[list[float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.get_executor(model_name),
+            self.encode,
+            model_name,
+            content,
+            batch_size,
+            normalize,
+        )
+
+
+registry = SentenceTransformerRegistry()
+
+
 class SentenceTransformersEmbedder(Embedding):
     """
     SentenceTransformersEmbedder base class for Verba.
@@ -31,13 +93,28 @@ class SentenceTransformersEmbedder(Embedding):
                     "paraphrase-MiniLM-L6-v2",
                 ],
             ),
+            "Batch Size": InputConfig(
+                type="number",
+                value=32,
+                description="Number of texts encoded per forward pass",
+                values=[],
+            ),
+            "Normalize": InputConfig(
+                type="bool",
+                value=False,
+                description="Return unit-length (L2 normalised) embeddings",
+                values=[],
+            ),
         }
 
     async def vectorize(self, config: dict, content: list[str]) -> list[float]:
         try:
             model_name = config.get("Model").value
-            model = SentenceTransformer(model_name)
-            embeddings = model.encode(content).tolist()
-            return embeddings
+            # Configs saved before these options existed fall back to the defaults
+            batch_size = config.get("Batch Size", self.config["Batch Size"]).value
+            normalize = config.get("Normalize", self.config["Normalize"]).value
+            return await registry.aencode(
+                model_name, content, int(batch_size), bool(normalize)
+            )
         except Exception as e:
             raise Exception(f"Failed to vectorize chunks: {str(e)}")
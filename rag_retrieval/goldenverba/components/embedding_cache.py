@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from wasabi import msg
+
+
+# Config entries that do not change the produced vectors
+OUTPUT_INDEPENDENT_CONFIG = {"Batch Size"}
+
+
+def embedding_settings(embedder, config: dict) -> str:
+    """
+    Every non-secret config value that can change the vectors (model, URL, normalisation ...),
+    with the embedder's defaults for entries missing from older saved configs, and its endpoint
+    """
+    entries = {**embedder.config, **config}
+    settings = {
+        name: entry.value
+        for name, entry in entries.items()
+        if name not in OUTPUT_INDEPENDENT_CONFIG and entry.type != "password"
+    }
+    if getattr(embedder, "url", None):
+        settings["Endpoint"] = embedder.url
+    return json.dumps(settings, sort_keys=True, default=str)
+
+
+def make_embedding_key(embedder: str, settings: str, text: str) -> str:
+    """Content address of an embedding: embedder, its output-affecting settings and the exact embedded text"""
+    raw = f"{embedder}\x1f{settings}\x1f{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-embedding cache stored in SQLite as float32 blobs.
+    Entries are evicted least-recently-used first once the stored vectors exceed max_bytes.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    QUERY_BATCH = 500
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, size INTEGER, last_used REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self.db.commit()
+        self.total_bytes = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache | None":
+        """Configured by VERBA_EMBEDDING_CACHE_MB (0 disables) and VERBA_EMBEDDING_CACHE_PATH"""
+        max_mb = float(os.getenv("VERBA_EMBEDDING_CACHE_MB", 512))
+        if max_mb <= 0:
+            return None
+        path = os.getenv(
+            "VERBA_EMBEDDING_CACHE_PATH",
+            os.path.join(os.path.expanduser("~"), ".verba", "embedding_cache.sqlite"),
+        )
+        try:
+            return cls(path, int(max_mb * 1024 * 1024))
+        except sqlite3.Error as e:
+            msg.warn(f"Embedding cache disabled, could not open {path}: {str(e)}")
+            return None
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), self.QUERY_BATCH):
+                batch = keys[i : i + self.QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self.db.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time()] + [key for key, _ in rows],
+                    )
+            self.db.commit()
+        return found
+
+    def put_many(self, items: list[tuple[str, list[float]]]):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        # The same text can appear several times in one import
+        for key, vector in dict(items).items():
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self.lock:
+            keys = [row[0] for row in rows]
+            for i in range(0, len(keys), self.QUERY_BATCH):
+                batch = keys[i : i + self.QUERY_BATCH]
+                self.total_bytes -= self.db.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchone()[0]
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self.total_bytes += sum(row[2] for row in rows)
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        # Drop the least recently used entries until the cache is back under 90% of max_bytes
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        rows = self.db.execute(
+            "SELECT key, size FROM embeddings ORDER BY last_used ASC"
+        )
+        expired = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            expired.append((key,))
+            self.total_bytes -= size
+        self.db.executemany("DELETE FROM embeddings WHERE key = ?", expired)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
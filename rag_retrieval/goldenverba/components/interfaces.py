@@ -1,4 +1,7 @@
 import os
+import asyncio
+
+import aiohttp
 
 from goldenverba.components.document import Document
 from goldenverba.server.types import FileConfig
@@ -80,6 +83,25 @@ class Embedding(VerbaComponent):
     def __init__(self):
         super().__init__()
         self.max_batch_size = 128
+        # Estimated tokens per batch (about 4 characters per token), keeps long chunks from oversizing a request
+        self.max_batch_tokens = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", 32000))
+        # Batches of one document sent to the embedder at the same time
+        self.max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session of this embedder, recreated if the event loop changed"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session_loop = loop
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def vectorize(self, config: dict, content: list[str]) -> list[float]:
         """Embed verba documents and its chunks to Weaviate
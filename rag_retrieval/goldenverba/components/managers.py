@@ -10,14 +10,23 @@ from weaviate.classes.init import AdditionalConfig, Timeout
 
 import os
 import asyncio
+import aiohttp
 import json
+import random
 import re
 from datetime import datetime
 
+import numpy as np
 from sklearn.decomposition import PCA
 
 
 from goldenverba.components.document import Document
+from goldenverba.components.embedding_cache import (
+    EmbeddingCache,
+    embedding_settings,
+    make_embedding_key,
+)
+from goldenverba.components.projection import ProjectionStore
 from goldenverba.components.interfaces import (
     Reader,
     Chunker,
@@ -164,6 +173,7 @@ class WeaviateManager:
         self.config_collection_name = "VERBA_CONFIGURATION"
         self.suggestion_collection_name = "VERBA_SUGGESTIONS"
         self.embedding_table = {}
+        self.projections = ProjectionStore.from_env()
 
     ### Connection Handling
 
@@ -445,6 +455,12 @@ class WeaviateManager:
                     await self.delete_document(client, doc_uuid)
                 raise Exception(f"Chunk import failed with : {str(e)}")
 
+            await asyncio.to_thread(
+                self.projections.update,
+                self.embedding_table[embedder],
+                [chunk.vector for chunk in document.chunks],
+            )
+
     ### Document CRUD
 
     async def exist_document_name(self, client: WeaviateAsyncClient, name: str) -> str:
@@ -502,6 +518,7 @@ class WeaviateManager:
         for collection in collection_payload["collections"]:
             if "VERBA" in collection["name"]:
                 await client.collections.delete(collection["name"])
+                self.projections.drop(collection["name"])
 
     async def get_documents(
         self,
@@ -690,7 +707,7 @@ class WeaviateManager:
                     "groups": [{"name": document["title"], "chunks": chunks}],
                 }
 
-            # Generate PCA for all embeddings
+            # Project all embeddings with the collection's persisted IncrementalPCA
             else:
                 vector_map = {}
                 vector_list, vector_ids, vector_chunk_uuids, vector_chunk_ids = (
@@ -720,11 +737,18 @@ class WeaviateManager:
                     vector_chunk_ids.append(item.properties["chunk_id"])
 
                 if len(vector_ids) > 3:
-                    pca = PCA(n_components=3)
-                    generated_pca_embeddings = pca.fit_transform(vector_list)
-                    pca_embeddings = [
-                        pca_.tolist() for pca_ in generated_pca_embeddings
-                    ]
+                    collection_name = self.embedding_table[embedder]
+                    pca_embeddings = await asyncio.to_thread(
+                        self.projections.transform, collection_name, vector_list
+                    )
+                    if pca_embeddings is None:
+                        # First request for this collection, fit once over the whole corpus
+                        await asyncio.to_thread(
+                            self.projections.fit, collection_name, vector_list
+                        )
+                        pca_embeddings = await asyncio.to_thread(
+                            self.projections.transform, collection_name, vector_list
+                        )
 
                     for pca_embedding, _uuid, _chunk_uuid, _chunk_id in zip(
                         pca_embeddings,
@@ -1060,6 +1084,13 @@ class EmbeddingManager:
         self.embedders: dict[str, Embedding] = {
             embedder.name: embedder for embedder in embedders
         }
+        self.semaphores: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = {}
+        self.max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", 3))
+        self.retry_backoff = float(os.getenv("EMBEDDING_RETRY_BACKOFF", 1.0))
+        # Re-imported chunks reuse their stored vectors instead of being embedded again
+        self.embedding_cache = EmbeddingCache.from_env()
+        # Per-document PCA of the chunk vectors: "randomized", "full" or "off"
+        self.chunk_pca = os.getenv("VERBA_CHUNK_PCA", "randomized").lower()
 
     async def vectorize(
         self,
@@ -1085,12 +1116,10 @@ class EmbeddingManager:
                     ]
                     embeddings = await self.batch_vectorize(embedder, config, content)
 
-                    if len(embeddings) >= 3:
-                        pca = PCA(n_components=3)
-                        generated_pca_embeddings = pca.fit_transform(embeddings)
-                        pca_embeddings = [
-                            pca_.tolist() for pca_ in generated_pca_embeddings
-                        ]
+                    if len(embeddings) >= 3 and self.chunk_pca != "off":
+                        pca_embeddings = await asyncio.to_thread(
+                            self.project_chunks, embeddings
+                        )
                     else:
                         pca_embeddings = [embedding[0:3] for embedding in embeddings]
 
@@ -1122,18 +1151,108 @@ class EmbeddingManager:
         except Exception as e:
             raise e
 
+    def project_chunks(self, embeddings: list[list[float]]) -> list[list[float]]:
+        solver = "full" if self.chunk_pca == "full" else "randomized"
+        pca = PCA(n_components=3, svd_solver=solver, random_state=0)
+        return pca.fit_transform(np.asarray(embeddings, dtype=np.float32)).tolist()
+
+    async def close(self):
+        """Close the shared HTTP sessions of all embedders"""
+        for embedder in self.embedders.values():
+            await embedder.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+
+    @staticmethod
+    def make_batches(
+        content: list[str], max_batch_size: int, max_batch_tokens: int
+    ) -> list[list[str]]:
+        """Split content into batches bounded by item count and estimated token count"""
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for text in content:
+            tokens = len(text) // 4 + 1
+            if batch and (
+                len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens
+            ):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def get_semaphore(self, embedder: str) -> asyncio.Semaphore:
+        # Semaphores are bound to the event loop they are first used in
+        loop = asyncio.get_running_loop()
+        if embedder not in self.semaphores or self.semaphores[embedder][0] is not loop:
+            self.semaphores[embedder] = (
+                loop,
+                asyncio.Semaphore(self.embedders[embedder].max_concurrency),
+            )
+        return self.semaphores[embedder][1]
+
+    async def vectorize_batch(
+        self, embedder: str, config: dict, batch: list[str]
+    ) -> list[list[float]]:
+        """Vectorize one batch, retrying only this batch with jittered exponential backoff"""
+        async with self.get_semaphore(embedder):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self.embedders[embedder].vectorize(config, batch)
+                except Exception as e:
+                    # Client errors other than rate limiting will not succeed on retry
+                    if (
+                        isinstance(e, aiohttp.ClientResponseError)
+                        and 400 <= e.status < 500
+                        and e.status != 429
+                    ) or attempt == self.max_retries:
+                        raise
+                    delay = self.retry_backoff * (2**attempt) * random.uniform(0.5, 1.5)
+                    msg.warn(
+                        f"Vectorizing batch of {len(batch)} failed ({str(e)}), retrying in {delay:.1f}s"
+                    )
+                    await asyncio.sleep(delay)
+
     async def batch_vectorize(
         self, embedder: str, config: dict, content: list[str]
+    ) -> list[list[float]]:
+        """Vectorize content, only sending texts missing from the embedding cache to the embedder"""
+        if self.embedding_cache is None:
+            return await self.vectorize_batches(embedder, config, content)
+
+        settings = embedding_settings(self.embedders[embedder], config)
+        keys = [make_embedding_key(embedder, settings, text) for text in content]
+        cached = await asyncio.to_thread(self.embedding_cache.get_many, keys)
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+        msg.info(f"Embedding cache: {len(content) - len(misses)} hits, {len(misses)} misses")
+
+        if misses:
+            vectors = await self.vectorize_batches(
+                embedder, config, [content[i] for i in misses]
+            )
+            new_items = [(keys[i], vector) for i, vector in zip(misses, vectors)]
+            await asyncio.to_thread(self.embedding_cache.put_many, new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    async def vectorize_batches(
+        self, embedder: str, config: dict, content: list[str]
     ) -> list[list[float]]:
         """Vectorize content in batches"""
         try:
-            batches = [
-                content[i : i + self.embedders[embedder].max_batch_size]
-                for i in range(0, len(content), self.embedders[embedder].max_batch_size)
-            ]
+            batches = self.make_batches(
+                content,
+                self.embedders[embedder].max_batch_size,
+                self.embedders[embedder].max_batch_tokens,
+            )
             msg.info(f"Vectorizing {len(content)} chunks in {len(batches)} batches")
             tasks = [
-                self.embedders[embedder].vectorize(config, batch) for batch in batches
+                self.vectorize_batch(embedder, config, batch) for batch in batches
             ]
             results = await asyncio.gather(*tasks, return_exceptions=True)
 
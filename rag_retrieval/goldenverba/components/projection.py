@@ -0,0 +1,114 @@
+import os
+import pickle
+import threading
+
+import numpy as np
+from wasabi import msg
+
+from sklearn.decomposition import IncrementalPCA
+
+
+class ProjectionStore:
+    """
+    Persistent 3D projections of the embedding collections used by the vector view.
+    Each collection keeps an IncrementalPCA that is fitted once over the existing corpus
+    and then updated with the chunks of every imported document.
+    """
+
+    N_COMPONENTS = 3
+    FIT_BATCH_SIZE = 1000
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.models: dict[str, IncrementalPCA] = {}
+        # Imported vectors waiting until there are enough samples for a partial_fit
+        self.pending: dict[str, list[list[float]]] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ProjectionStore":
+        """Stored in VERBA_PROJECTION_PATH (default ~/.verba/projections)"""
+        directory = os.getenv(
+            "VERBA_PROJECTION_PATH",
+            os.path.join(os.path.expanduser("~"), ".verba", "projections"),
+        )
+        return cls(directory)
+
+    def path(self, collection: str) -> str:
+        return os.path.join(self.directory, f"{collection}.pkl")
+
+    def load(self, collection: str) -> IncrementalPCA | None:
+        if collection not in self.models:
+            try:
+                with open(self.path(collection), "rb") as f:
+                    self.models[collection] = pickle.load(f)
+            except FileNotFoundError:
+                return None
+            except Exception as e:
+                msg.warn(f"Discarding projection of {collection}: {str(e)}")
+                return None
+        return self.models[collection]
+
+    def save(self, collection: str, model: IncrementalPCA):
+        self.models[collection] = model
+        tmp_path = self.path(collection) + ".tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(model, f)
+            os.replace(tmp_path, self.path(collection))
+        except OSError as e:
+            # Still usable for this process, it is refitted after a restart
+            msg.warn(f"Could not persist projection of {collection}: {str(e)}")
+
+    def fit(self, collection: str, vectors: list[list[float]]) -> IncrementalPCA:
+        """Fit the projection of a collection over its whole corpus, in batches"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        model = IncrementalPCA(n_components=self.N_COMPONENTS)
+        for batch in self.batches(vectors):
+            model.partial_fit(batch)
+        with self.lock:
+            self.pending.pop(collection, None)
+            self.save(collection, model)
+        return model
+
+    def update(self, collection: str, vectors: list[list[float]]):
+        """Add newly imported vectors to an already fitted projection"""
+        with self.lock:
+            model = self.load(collection)
+            # Not fitted yet, the first request of the vector view includes these vectors
+            if model is None or not vectors:
+                return
+            if model.n_features_in_ != len(vectors[0]):
+                return
+            pending = self.pending.setdefault(collection, [])
+            pending.extend(vectors)
+            if len(pending) < self.N_COMPONENTS:
+                return
+            model.partial_fit(np.asarray(pending, dtype=np.float32))
+            self.pending[collection] = []
+            self.save(collection, model)
+
+    def transform(self, collection: str, vectors: list[list[float]]) -> list[list[float]] | None:
+        """3D coordinates of vectors, None if the collection has no projection matching their dimensions"""
+        with self.lock:
+            model = self.load(collection)
+            if model is None or not vectors or model.n_features_in_ != len(vectors[0]):
+                return None
+            return model.transform(np.asarray(vectors, dtype=np.float32)).tolist()
+
+    def drop(self, collection: str):
+        with self.lock:
+            self.models.pop(collection, None)
+            self.pending.pop(collection, None)
+            if os.path.exists(self.path(collection)):
+                os.remove(self.path(collection))
+
+    def batches(self, vectors: np.ndarray):
+        # Every partial_fit needs at least n_components samples, a short tail joins the previous batch
+        starts = list(range(0, len(vectors), self.FIT_BATCH_SIZE))
+        if len(starts) > 1 and len(vectors) - starts[-1] < self.N_COMPONENTS:
+            starts.pop()
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(vectors)
+            yield vectors[start:end]
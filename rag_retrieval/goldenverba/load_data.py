@@ -1,5 +1,10 @@
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+PATTERNS = ["*.md", "*.txt", "*.pdf", "*.docx"]
+# Định dạng parse tốn CPU, được đưa sang process pool
+HEAVY_EXTENSIONS = {".pdf", ".docx"}
 
 def read_txt_md(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -8,12 +13,9 @@ def read_txt_md(path):
 def read_pdf(path):
     try:
         import PyPDF2
-        text = ""
         with open(path, "rb") as f:
             reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text() or ""
-        return text
+            return "".join(page.extract_text() or "" for page in reader.pages)
     except ImportError:
         return "[Cần cài PyPDF2 để đọc PDF]"
 
@@ -36,17 +38,53 @@ def read_file_by_type(path):
     else:
         return "[Không hỗ trợ định dạng này]"
 
-def load_files(folder):
-    patterns = ["*.md", "*.txt", "*.pdf", "*.docx"]
-    files = []
+def iter_paths(folder, patterns=PATTERNS):
     for pat in patterns:
-        files.extend(glob.glob(os.path.join(folder, pat)))
-    data = []
-    for file_path in files:
-        content = read_file_by_type(file_path)
-        data.append({
-            "filename": os.path.basename(file_path),
-            "ext": os.path.splitext(file_path)[1].lower(),
-            "text": content
-        })
-    return data
+        yield from glob.iglob(os.path.join(folder, pat))
+
+def _record(file_path, content):
+    return {
+        "filename": os.path.basename(file_path),
+        "ext": os.path.splitext(file_path)[1].lower(),
+        "text": content
+    }
+
+def iter_load_files(folder, max_workers=None, patterns=PATTERNS):
+    """
+    Trả về từng file ngay khi đọc xong thay vì cả thư mục một lần.
+    .md/.txt đọc trực tiếp; .pdf/.docx parse trong process pool `max_workers` process (0 => đọc tuần tự),
+    tối đa 2 * max_workers file đang parse cùng lúc để bộ nhớ không tăng theo kích thước thư mục.
+    Thứ tự file trả về có thể khác thứ tự glob.
+    """
+    if max_workers == 0:
+        for file_path in iter_paths(folder, patterns):
+            yield _record(file_path, read_file_by_type(file_path))
+        return
+
+    max_in_flight = 2 * (max_workers or os.cpu_count() or 1)
+    pool = None
+    pending = {}
+    try:
+        for file_path in iter_paths(folder, patterns):
+            if os.path.splitext(file_path)[1].lower() not in HEAVY_EXTENSIONS:
+                yield _record(file_path, read_file_by_type(file_path))
+                continue
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=max_workers)
+            pending[pool.submit(read_file_by_type, file_path)] = file_path
+            if len(pending) >= max_in_flight:
+                yield from _collect(pending)
+        while pending:
+            yield from _collect(pending)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def _collect(pending):
+    # Chờ ít nhất một file parse xong và trả về các file đã xong
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        yield _record(pending.pop(future), future.result())
+
+def load_files(folder, max_workers=None):
+    return list(iter_load_files(folder, max_workers=max_workers))
@@ -63,6 +63,7 @@ client_manager = verba_manager.ClientManager()
 async def lifespan(app: FastAPI):
     yield
     await client_manager.disconnect()
+    await manager.embedder_manager.close()
 
 
 # FastAPI App
@@ -0,0 +1,106 @@
+import pytest
+from goldenverba.components import embedding_cache
+from goldenverba.components.embedding_cache import (
+    EmbeddingCache,
+    embedding_settings,
+    make_embedding_key,
+)
+from goldenverba.components.types import InputConfig
+
+
+class FakeEmbedder:
+    def __init__(self, url=None, **config):
+        self.url = url
+        self.config = config
+
+
+def entry(value, type="text"):
+    return InputConfig(type=type, value=value, description="", values=[])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Deterministic last_used timestamps"""
+    now = iter(range(1, 1000))
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(now)))
+
+
+def test_cache_round_trip(tmp_path):
+    """Test stored vectors are returned as float32 values and unknown keys are missing"""
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=1024)
+    cache.put_many([("a", [0.5, 1.0]), ("b", [2.0, 3.0])])
+
+    assert cache.get_many(["a", "b", "c"]) == {"a": [0.5, 1.0], "b": [2.0, 3.0]}
+    assert cache.total_bytes == 16
+    cache.close()
+
+
+def test_cache_replaces_duplicate_keys(tmp_path):
+    """Test re-inserting a key does not count its size twice"""
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=1024)
+    cache.put_many([("a", [1.0]), ("a", [2.0])])
+    cache.put_many([("a", [3.0])])
+
+    assert cache.get_many(["a"]) == {"a": [3.0]}
+    assert cache.total_bytes == 4
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path, clock):
+    """Test eviction drops the least recently used entries down to 90% of max_bytes"""
+    # 16 bytes per vector, room for three
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=48)
+    for key in "abc":
+        cache.put_many([(key, [1.0, 2.0, 3.0, 4.0])])
+    cache.get_many(["a"])
+    cache.put_many([("d", [1.0, 2.0, 3.0, 4.0])])
+
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "d"}
+    assert cache.total_bytes == 32
+    cache.close()
+
+
+def test_cache_size_survives_reopen(tmp_path):
+    """Test the stored size is restored when the cache is reopened"""
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path, max_bytes=1024)
+    cache.put_many([("a", [1.0, 2.0])])
+    cache.close()
+
+    cache = EmbeddingCache(path, max_bytes=1024)
+    assert cache.total_bytes == 8
+    assert cache.get_many(["a"]) == {"a": [1.0, 2.0]}
+    cache.close()
+
+
+def test_from_env_disabled(monkeypatch):
+    """Test VERBA_EMBEDDING_CACHE_MB=0 disables the cache"""
+    monkeypatch.setenv("VERBA_EMBEDDING_CACHE_MB", "0")
+
+    assert EmbeddingCache.from_env() is None
+
+
+def test_embedding_settings_ignore_secrets_and_batch_size():
+    """Test API keys and Batch Size do not change the cache key, model and URL do"""
+    embedder = FakeEmbedder(
+        url="http://localhost:11434",
+        Model=entry("nomic-embed-text"),
+        **{"API Key": entry("secret", type="password"), "Batch Size": entry(32, type="number")},
+    )
+    settings = embedding_settings(embedder, {})
+
+    assert "secret" not in settings
+    assert embedding_settings(embedder, {"Batch Size": entry(8, type="number")}) == settings
+    assert embedding_settings(embedder, {"API Key": entry("other", type="password")}) == settings
+    assert embedding_settings(embedder, {"Model": entry("bge-m3")}) != settings
+    assert embedding_settings(FakeEmbedder(url="http://other:11434", **embedder.config), {}) != settings
+
+
+def test_make_embedding_key():
+    """Test keys depend on the embedder, its settings and the exact text"""
+    key = make_embedding_key("Ollama", "{}", "text")
+
+    assert key == make_embedding_key("Ollama", "{}", "text")
+    assert key != make_embedding_key("OpenAI", "{}", "text")
+    assert key != make_embedding_key("Ollama", '{"Model": "m"}', "text")
+    assert key != make_embedding_key("Ollama", "{}", "text ")
@@ -0,0 +1,78 @@
+import asyncio
+
+from goldenverba.components.embedding_cache import EmbeddingCache
+from goldenverba.components.managers import EmbeddingManager
+from goldenverba.components.types import InputConfig
+
+
+class FakeEmbedder:
+    url = "http://localhost:11434"
+    config = {
+        "Model": InputConfig(type="text", value="fake", description="", values=[])
+    }
+
+
+def test_make_batches_respects_item_count():
+    """Test batches are split at max_batch_size items"""
+    content = [f"chunk {i}" for i in range(5)]
+
+    batches = EmbeddingManager.make_batches(content, 2, 10_000)
+
+    assert batches == [content[0:2], content[2:4], content[4:5]]
+
+
+def test_make_batches_respects_token_estimate():
+    """Test batches are split before exceeding the estimated token budget"""
+    # len(text) // 4 + 1 estimated tokens each => 26 tokens
+    content = ["x" * 100] * 4
+
+    batches = EmbeddingManager.make_batches(content, 100, 60)
+
+    assert [len(batch) for batch in batches] == [2, 2]
+
+
+def test_make_batches_oversized_text():
+    """Test a text larger than the token budget still gets its own batch"""
+    content = ["short", "x" * 1000, "short"]
+
+    batches = EmbeddingManager.make_batches(content, 100, 50)
+
+    assert batches == [["short"], ["x" * 1000], ["short"]]
+
+
+def test_make_batches_keeps_order():
+    """Test batching preserves the order of the content"""
+    content = [str(i) * (i % 7 + 1) for i in range(50)]
+
+    batches = EmbeddingManager.make_batches(content, 8, 12)
+
+    assert [text for batch in batches for text in batch] == content
+    assert all(0 < len(batch) <= 8 for batch in batches)
+
+
+def test_make_batches_empty():
+    """Test empty content produces no batches"""
+    assert EmbeddingManager.make_batches([], 8, 100) == []
+
+
+def test_batch_vectorize_only_embeds_cache_misses(tmp_path, monkeypatch):
+    """Test cached texts are served from the embedding cache and only misses reach the embedder"""
+    monkeypatch.setenv("VERBA_EMBEDDING_CACHE_MB", "0")
+    manager = EmbeddingManager()
+    manager.embedders = {"Fake": FakeEmbedder()}
+    manager.embedding_cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), 1024)
+    sent = []
+
+    async def vectorize_batches(embedder, config, content):
+        sent.append(list(content))
+        return [[float(len(text))] for text in content]
+
+    manager.vectorize_batches = vectorize_batches
+
+    first = asyncio.run(manager.batch_vectorize("Fake", {}, ["a", "bb"]))
+    second = asyncio.run(manager.batch_vectorize("Fake", {}, ["bb", "ccc", "a"]))
+
+    assert first == [[1.0], [2.0]]
+    assert second == [[2.0], [3.0], [1.0]]
+    assert sent == [["a", "bb"], ["ccc"]]
+    manager.embedding_cache.close()
@@ -1,5 +1,19 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Tuple
+import asyncio
+import math
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from .score_cache import RerankScoreCache, make_key
+
+
+async def close_on_loop_exit(session):
+    """
+    Task nền giữ tới khi event loop kết thúc rồi đóng session (aiohttp) đã tạo trên loop đó.
+    asyncio.run hủy mọi task còn lại trước khi đóng loop, nên session không bị bỏ lại với connector còn mở.
+    """
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await session.close()
 
 
 class BaseLLMModel(ABC):
@@ -11,12 +25,118 @@ class BaseLLMModel(ABC):
     def generate(self, user_prompt: str, system_prompt: Optional[str] = None) -> str:
         pass
 
+    def generate_stream(self, user_prompt: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        # Mặc định: model không hỗ trợ stream thì trả về toàn bộ câu trả lời một lần
+        yield self.generate(user_prompt, system_prompt=system_prompt)
+
+    async def agenerate(self, user_prompt: str, system_prompt: Optional[str] = None) -> str:
+        # Mặc định: chạy generate đồng bộ trong thread để không chặn event loop
+        return await asyncio.to_thread(self.generate, user_prompt, system_prompt)
+
+    async def agenerate_stream(self, user_prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        # Mặc định: model không hỗ trợ stream async thì trả về toàn bộ câu trả lời một lần
+        yield await self.agenerate(user_prompt, system_prompt=system_prompt)
+
+    def warm_up(self):
+        # Mặc định: không cần nạp trước model
+        pass
+
+    def count_tokens(self, text: str) -> int:
+        # Mặc định khi không có tokenizer của model: ước lượng dư ~3 ký tự/token (tiếng Việt tốn token hơn tiếng Anh)
+        return math.ceil(len(text) / 3)
+
 
 class BaseReranker(ABC):
-    def __init__(self, model_name: str, **kwargs):
+    # Kiểu tensor mà tokenizer.pad trả về cho _score_batch ("pt" cho torch, "np" cho ONNX Runtime)
+    tensor_type = "pt"
+
+    def __init__(self, model_name: str, max_candidates: Optional[int] = None, batch_size: int = 16,
+                 max_length: int = 512, cache_size: int = 0, cache_path: Optional[str] = None,
+                 cache_disk_size: int = 1000000, **kwargs):
         self.model_name = model_name
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.max_length = max_length
+        # cache_size = 0 => tắt cache điểm
+        self.score_cache = RerankScoreCache(cache_size, cache_path, cache_disk_size) if cache_size > 0 else None
+        # Lớp con gán tokenizer (HF) sau khi tải model
+        self.tokenizer = None
         print(f"Khởi tạo Reranker: {self.__class__.__name__} với model '{self.model_name}'")
 
     @abstractmethod
-    def rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Tuple[int, float, str]]:
-        pass
\ No newline at end of file
+    def _score_batch(self, batch) -> List[float]:
+        """Chấm điểm một micro-batch các cặp (query, doc) đã được tokenizer.pad thành tensor."""
+        pass
+
+    def compute_scores(self, query: str, documents: List[str]) -> List[float]:
+        # Tokenize từng cặp không pad, cắt theo số token (không theo ký tự) ở max_length
+        features = self.tokenizer(
+            [query] * len(documents),
+            documents,
+            truncation=True,
+            max_length=self.max_length
+        )
+        encoded = [{k: features[k][i] for k in features.keys()} for i in range(len(documents))]
+
+        # Sắp xếp theo độ dài để mỗi micro-batch gần như không phải pad
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]["input_ids"]))
+        scores = [0.0] * len(documents)
+        for start in range(0, len(order), self.batch_size):
+            batch_idx = order[start : start + self.batch_size]
+            batch = self.tokenizer.pad([encoded[i] for i in batch_idx], return_tensors=self.tensor_type)
+            for i, score in zip(batch_idx, self._score_batch(batch)):
+                scores[i] = float(score)
+        return scores
+
+    def cached_scores(self, query: str, documents: List[str],
+                      stats: Optional[Dict[str, int]] = None) -> List[float]:
+        """Như compute_scores, nhưng chỉ gửi các cặp chưa có trong cache tới cross-encoder."""
+        if self.score_cache is None:
+            return self.compute_scores(query, documents)
+
+        keys = [make_key(self.model_name, query, doc) for doc in documents]
+        cached = self.score_cache.get_many(keys)
+        miss_idx = [i for i, key in enumerate(keys) if key not in cached]
+        miss_scores = self.compute_scores(query, [documents[i] for i in miss_idx]) if miss_idx else []
+        self.score_cache.put_many([(keys[i], score) for i, score in zip(miss_idx, miss_scores)])
+
+        if stats is not None:
+            stats["rerank_cache_hits"] = len(documents) - len(miss_idx)
+            stats["rerank_cache_misses"] = len(miss_idx)
+
+        scores = [cached.get(key) for key in keys]
+        for i, score in zip(miss_idx, miss_scores):
+            scores[i] = score
+        return scores
+
+    def rerank(self, query: str, documents: List[str], top_k: int = 5,
+               stats: Optional[Dict[str, int]] = None) -> List[Tuple[int, float, str]]:
+        """
+        Trả về danh sách (index, score, text) sắp xếp theo độ liên quan giảm dần.
+        Nếu truyền `stats`, số hit/miss của cache điểm trong lần gọi này được ghi vào đó.
+        """
+        if not documents:
+            return []
+        if self.max_candidates is not None:
+            documents = documents[: self.max_candidates]
+
+        scores = self.cached_scores(query, documents, stats)
+        ranked = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [(i, scores[i], documents[i]) for i in ranked[:top_k]]
+
+
+class BaseEmbedder(ABC):
+    def __init__(self, model_name: str, **kwargs):
+        self.model_name = model_name
+        print(f"Khởi tạo Embedder: {self.__class__.__name__} với model '{self.model_name}'")
+
+    @abstractmethod
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        pass
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0]
+
+    async def aembed_many(self, texts: List[str]) -> List[List[float]]:
+        # Mặc định: chạy embed_many đồng bộ trong thread để không chặn event loop
+        return await asyncio.to_thread(self.embed_many, texts)
@@ -3,19 +3,31 @@ from .wrapper.llm_ollama import OllamaChatModel
 from .base_models import BaseReranker
 from .wrapper.reranker_bge import BGEReranker
 from .wrapper.reranker_jina import JinaReranker
+from .wrapper.reranker_onnx import OnnxReranker
+from .base_models import BaseEmbedder
+from .wrapper.embedder_ollama import OllamaEmbedder
 
 
-def get_chat_model(provider: str, model_name: str) -> BaseLLMModel:
+def get_chat_model(provider: str, model_name: str, **kwargs) -> BaseLLMModel:
     if provider.lower() == "ollama":
-        return OllamaChatModel(model_name=model_name)
+        return OllamaChatModel(model_name=model_name, **kwargs)
     else:
         raise ValueError(f"Nhà cung cấp chat model '{provider}' không được hỗ trợ.")
 
 
-def get_reranker(provider: str, model_name: str) -> BaseReranker:
+def get_reranker(provider: str, model_name: str, **kwargs) -> BaseReranker:
     if provider.lower() == "bge":
-        return BGEReranker(model_name=model_name)
+        return BGEReranker(model_name=model_name, **kwargs)
     elif provider.lower() == "jina":
-        return JinaReranker(model_name=model_name)
+        return JinaReranker(model_name=model_name, **kwargs)
+    elif provider.lower() == "onnx":
+        return OnnxReranker(model_name=model_name, **kwargs)
     else:
-        raise ValueError(f"Nhà cung cấp reranker '{provider}' không được hỗ trợ.")
\ No newline at end of file
+        raise ValueError(f"Nhà cung cấp reranker '{provider}' không được hỗ trợ.")
+
+
+def get_embedder(provider: str, model_name: str) -> BaseEmbedder:
+    if provider.lower() == "ollama":
+        return OllamaEmbedder(model_name=model_name)
+    else:
+        raise ValueError(f"Nhà cung cấp embedder '{provider}' không được hỗ trợ.")
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def make_key(model_name: str, query: str, document: str) -> str:
+    """Khóa cache = (model, query đã chuẩn hóa, hash nội dung tài liệu)."""
+    doc_hash = hashlib.sha1(document.encode("utf-8")).hexdigest()
+    raw = f"{model_name}\x1f{normalize_query(query)}\x1f{doc_hash}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """
+    Cache điểm cross-encoder: LRU trong bộ nhớ, thêm tầng SQLite trên đĩa nếu có `sqlite_path`.
+    Tầng SQLite giữ tối đa `max_disk_entries` điểm, vượt quá thì xóa các điểm lâu không dùng nhất (theo lần đọc
+    từ đĩa / ghi gần nhất) xuống còn 90%. Thread-safe, đếm số hit/miss tích lũy.
+    """
+
+    # SQLite giới hạn số tham số trong một câu lệnh
+    QUERY_BATCH = 500
+
+    def __init__(self, max_entries: int = 10000, sqlite_path: Optional[str] = None, max_disk_entries: int = 1000000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        self._disk_entries = 0
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS rerank_scores (key TEXT PRIMARY KEY, score REAL, last_used REAL)")
+            # File cache tạo trước khi có eviction chưa có cột last_used
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(rerank_scores)")}
+            if "last_used" not in columns:
+                self._db.execute("ALTER TABLE rerank_scores ADD COLUMN last_used REAL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS rerank_scores_last_used ON rerank_scores (last_used)")
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+            self._evict_disk()
+            self._db.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        keys = list(keys)
+        found: Dict[str, float] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+            if self._db is not None and missing:
+                for i in range(0, len(missing), self.QUERY_BATCH):
+                    batch = missing[i : i + self.QUERY_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, score FROM rerank_scores WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    for key, score in rows:
+                        found[key] = score
+                        self._put_memory(key, score)
+                    if rows:
+                        self._db.execute(
+                            f"UPDATE rerank_scores SET last_used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                            [time.time()] + [key for key, _ in rows],
+                        )
+                self._db.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: List[Tuple[str, float]]):
+        with self._lock:
+            for key, score in items:
+                self._put_memory(key, score)
+            if self._db is not None and items:
+                rows = dict(items)
+                keys = list(rows)
+                for i in range(0, len(keys), self.QUERY_BATCH):
+                    batch = keys[i : i + self.QUERY_BATCH]
+                    self._disk_entries -= self._db.execute(
+                        f"SELECT COUNT(*) FROM rerank_scores WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchone()[0]
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO rerank_scores (key, score, last_used) VALUES (?, ?, ?)",
+                    [(key, score, now) for key, score in rows.items()],
+                )
+                self._disk_entries += len(rows)
+                self._evict_disk()
+                self._db.commit()
+
+    def _put_memory(self, key: str, score: float):
+        self._memory[key] = score
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Xóa các điểm lâu không dùng nhất cho tới khi tầng SQLite còn 90% max_disk_entries
+        if self._disk_entries <= self.max_disk_entries:
+            return
+        excess = self._disk_entries - int(self.max_disk_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM rerank_scores WHERE key IN (SELECT key FROM rerank_scores ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self._disk_entries -= excess
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
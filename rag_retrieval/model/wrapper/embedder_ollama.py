@@ -0,0 +1,118 @@
+from ..base_models import BaseEmbedder, close_on_loop_exit
+import requests
+import aiohttp
+import asyncio
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Optional
+
+
+class OllamaEmbedder(BaseEmbedder):
+
+    def __init__(self, model_name: str = "nomic-embed-text", ollama_base_url: str = "http://10.1.1.237:11434",
+                 batch_size: int = 64, max_retries: int = 3, backoff_factor: float = 0.5,
+                 pool_size: int = 8, timeout: float = 60.0):
+        super().__init__(model_name=model_name)
+        self.base_url = ollama_base_url
+        self.embed_url = f"{self.base_url}/api/embed"
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        # aiohttp session gắn với event loop nên chỉ được tạo khi gọi aembed_many
+        self._async_session: Optional[aiohttp.ClientSession] = None
+        self._async_loop = None
+        self._async_closer: Optional[asyncio.Task] = None
+
+        # Session giữ kết nối keep-alive; Retry tự backoff khi gặp lỗi mạng / 429 / 5xx
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["POST"]),
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embedding danh sách text bằng /api/embed, mỗi request gửi tối đa `batch_size` text."""
+        embeddings: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i : i + self.batch_size]
+            try:
+                response = self.session.post(
+                    self.embed_url,
+                    json={"model": self.model_name, "input": batch},
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                raise ConnectionError(f"Không thể tạo embedding từ Ollama tại {self.base_url}: {e}")
+
+            batch_embeddings = response.json().get("embeddings", [])
+            if len(batch_embeddings) != len(batch):
+                raise ValueError(
+                    f"Ollama trả về {len(batch_embeddings)} embedding cho {len(batch)} text."
+                )
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._async_session
+        if session is None or session.closed or self._async_loop is not loop:
+            # Loop cũ vẫn chạy ở thread khác: hủy closer để nó đóng session trên chính loop đó
+            if session is not None and not session.closed and self._async_loop.is_running():
+                self._async_loop.call_soon_threadsafe(self._async_closer.cancel)
+            self._async_loop = loop
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._async_closer = loop.create_task(close_on_loop_exit(self._async_session))
+        return self._async_session
+
+    async def _apost_batch(self, batch: List[str]) -> List[List[float]]:
+        session = self._get_async_session()
+        payload = {"model": self.model_name, "input": batch}
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.post(self.embed_url, json=payload) as response:
+                    if response.status in (429, 500, 502, 503, 504) and attempt < self.max_retries:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status
+                        )
+                    response.raise_for_status()
+                    data = await response.json()
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Lỗi 4xx (trừ 429) là lỗi của request, thử lại cũng không thành công
+                client_error = isinstance(e, aiohttp.ClientResponseError) and 400 <= e.status < 500 and e.status != 429
+                if client_error or attempt >= self.max_retries:
+                    raise ConnectionError(f"Không thể tạo embedding từ Ollama tại {self.base_url}: {e}")
+                # Backoff giống urllib3 Retry: backoff_factor * 2^attempt
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+        batch_embeddings = data.get("embeddings", [])
+        if len(batch_embeddings) != len(batch):
+            raise ValueError(
+                f"Ollama trả về {len(batch_embeddings)} embedding cho {len(batch)} text."
+            )
+        return batch_embeddings
+
+    async def aembed_many(self, texts: List[str]) -> List[List[float]]:
+        """Bản async của embed_many: các batch được gửi song song trên cùng một session."""
+        batches = [texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._apost_batch(batch) for batch in batches))
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+    async def aclose(self):
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+        if self._async_closer is not None:
+            self._async_closer.cancel()
+        self._async_session = None
+        self._async_closer = None
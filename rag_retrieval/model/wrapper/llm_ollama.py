@@ -1,23 +1,70 @@
-from ..base_models import BaseLLMModel
+from ..base_models import BaseLLMModel, close_on_loop_exit
 import requests
-from typing import Optional
+import aiohttp
+import asyncio
+import json
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, Iterator, Optional, Union
 
 
 class OllamaChatModel(BaseLLMModel):
 
-    def __init__(self, model_name: str, ollama_base_url: str = "http://10.1.1.237:11434"):
+    def __init__(self, model_name: str, ollama_base_url: str = "http://10.1.1.237:11434",
+                 tokenizer_name: Optional[str] = None, keep_alive: Union[str, int, None] = "30m",
+                 num_ctx: Optional[int] = None, num_predict: Optional[int] = None, num_thread: Optional[int] = None,
+                 pool_size: int = 8, timeout: float = 300.0):
         super().__init__(model_name=model_name)
         self.base_url = ollama_base_url
+        # keep_alive giữ model trong bộ nhớ của Ollama giữa các request (None => mặc định 5 phút của Ollama)
+        self.keep_alive = keep_alive
+        # Chỉ gửi các option được cấu hình, còn lại để Ollama dùng giá trị trong Modelfile
+        self.options = {
+            k: v for k, v in (("num_ctx", num_ctx), ("num_predict", num_predict), ("num_thread", num_thread))
+            if v is not None
+        }
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # Ollama không có API tokenize, nên đếm token bằng tokenizer HF tương ứng của model (nếu được cấu hình)
+        self.tokenizer = self._load_tokenizer(tokenizer_name) if tokenizer_name else None
         self.chat_url = f"{self.base_url}/api/chat"
-        self._check_server()
+        # aiohttp session gắn với event loop nên chỉ được tạo khi gọi agenerate
+        self._async_session: Optional[aiohttp.ClientSession] = None
+        self._async_loop = None
+        self._async_closer: Optional[asyncio.Task] = None
+
+        # Session giữ kết nối keep-alive tới Ollama, dùng chung cho mọi request (kể cả từ nhiều thread)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def _check_server(self):
+    def warm_up(self):
+        """Nạp model vào bộ nhớ của Ollama (messages rỗng => chỉ load model, không sinh token)."""
+        payload = {"model": self.model_name, "messages": [], "stream": False}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
         try:
-            requests.get(self.base_url)
-        except requests.exceptions.RequestException:
-            raise ConnectionError(f"Không thể kết nối tới Ollama tại {self.base_url}")
+            response = self.session.post(self.chat_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"Không thể nạp model {self.model_name} trên Ollama tại {self.base_url}: {e}")
+        print(f"Đã nạp sẵn chat model '{self.model_name}' trên Ollama.")
 
-    def generate(self, user_prompt: str, system_prompt: Optional[str] = None) -> str:
+    @staticmethod
+    def _load_tokenizer(tokenizer_name: str):
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(tokenizer_name)
+        except Exception as e:
+            print(f"Không tải được tokenizer '{tokenizer_name}', dùng ước lượng số token: {e}")
+            return None
+
+    def count_tokens(self, text: str) -> int:
+        if self.tokenizer is None:
+            return super().count_tokens(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _build_payload(self, user_prompt: str, system_prompt: Optional[str], stream: bool) -> dict:
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
@@ -26,14 +73,101 @@ class OllamaChatModel(BaseLLMModel):
         payload = {
             "model": self.model_name,
             "messages": messages,
-            "stream": False
+            "stream": stream
         }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if self.options:
+            payload["options"] = self.options
+        return payload
+
+    def generate(self, user_prompt: str, system_prompt: Optional[str] = None) -> str:
+        payload = self._build_payload(user_prompt, system_prompt, stream=False)
 
         try:
-            response = requests.post(self.chat_url, json=payload)
+            response = self.session.post(self.chat_url, json=payload, timeout=self.timeout)
             response.raise_for_status()
             content = response.json().get("message", {}).get("content", "").strip()
             return content.strip('"')
         except requests.exceptions.RequestException as e:
             print(f"Lỗi khi giao tiếp với Ollama Chat API: {e}")
-            return f"Lỗi: Không thể nhận phản hồi từ model {self.model_name}."
\ No newline at end of file
+            return f"Lỗi: Không thể nhận phản hồi từ model {self.model_name}."
+
+    def generate_stream(self, user_prompt: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        """Trả về từng phần nội dung ngay khi Ollama sinh ra (NDJSON stream của /api/chat)."""
+        payload = self._build_payload(user_prompt, system_prompt, stream=True)
+
+        try:
+            with self.session.post(self.chat_url, json=payload, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        yield token
+                    if chunk.get("done"):
+                        break
+        except requests.exceptions.RequestException as e:
+            print(f"Lỗi khi giao tiếp với Ollama Chat API: {e}")
+            yield f"Lỗi: Không thể nhận phản hồi từ model {self.model_name}."
+
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._async_session
+        if session is None or session.closed or self._async_loop is not loop:
+            # Loop cũ vẫn chạy ở thread khác: hủy closer để nó đóng session trên chính loop đó
+            if session is not None and not session.closed and self._async_loop.is_running():
+                self._async_loop.call_soon_threadsafe(self._async_closer.cancel)
+            self._async_loop = loop
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._async_closer = loop.create_task(close_on_loop_exit(self._async_session))
+        return self._async_session
+
+    async def agenerate(self, user_prompt: str, system_prompt: Optional[str] = None) -> str:
+        payload = self._build_payload(user_prompt, system_prompt, stream=False)
+
+        try:
+            async with self._get_async_session().post(self.chat_url, json=payload) as response:
+                response.raise_for_status()
+                data = await response.json()
+            content = data.get("message", {}).get("content", "").strip()
+            return content.strip('"')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Lỗi khi giao tiếp với Ollama Chat API: {e}")
+            return f"Lỗi: Không thể nhận phản hồi từ model {self.model_name}."
+
+    async def agenerate_stream(self, user_prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        """Bản async của generate_stream (NDJSON stream của /api/chat qua aiohttp)."""
+        payload = self._build_payload(user_prompt, system_prompt, stream=True)
+
+        try:
+            async with self._get_async_session().post(self.chat_url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        yield token
+                    if chunk.get("done"):
+                        break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Lỗi khi giao tiếp với Ollama Chat API: {e}")
+            yield f"Lỗi: Không thể nhận phản hồi từ model {self.model_name}."
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+        if self._async_closer is not None:
+            self._async_closer.cancel()
+        self._async_session = None
+        self._async_closer = None
@@ -0,0 +1,69 @@
+from typing import List, Optional
+import os
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from transformers import AutoTokenizer
+from ..base_models import BaseReranker
+
+
+class OnnxReranker(BaseReranker):
+    """
+    Cross-encoder (BGE / Jina) chạy bằng ONNX Runtime trên CPU.
+    Lần đầu sẽ export model HF sang ONNX rồi lượng tử hóa động int8, các lần sau tải lại từ `onnx_dir`.
+    """
+    tensor_type = "np"
+
+    def __init__(self, model_name: str = "BAAI/bge-reranker-v2-m3", onnx_dir: Optional[str] = None,
+                 quantize: bool = True, intra_op_threads: int = 0, inter_op_threads: int = 0, **kwargs):
+        super().__init__(model_name=model_name, **kwargs)
+        self.onnx_dir = onnx_dir or os.path.join("onnx_models", model_name.replace("/", "__"))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+
+        fp32_path = os.path.join(self.onnx_dir, "model.onnx")
+        int8_path = os.path.join(self.onnx_dir, "model.int8.onnx")
+        if not os.path.exists(fp32_path):
+            self._export(fp32_path)
+        if quantize and not os.path.exists(int8_path):
+            print(f"Đang lượng tử hóa int8 '{fp32_path}'...")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        model_path = int8_path if quantize else fp32_path
+
+        # 0 => để ONNX Runtime tự chọn số thread
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        print(f"Loaded OnnxReranker ({model_name}) từ '{model_path}'")
+
+    def _export(self, path: str):
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        print(f"Đang export '{self.model_name}' sang ONNX tại '{path}'...")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name, trust_remote_code=True)
+        model.eval()
+
+        sample = self.tokenizer(["query"], ["document"], return_tensors="pt")
+        input_names = list(sample.keys())
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (dict(sample),),
+                path,
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                dynamo=False,
+            )
+
+    def _score_batch(self, batch) -> List[float]:
+        inputs = {name: batch[name].astype(np.int64) for name in self.input_names}
+        logits = self.session.run(None, inputs)[0]
+        return logits.reshape(-1).astype(np.float32).tolist()
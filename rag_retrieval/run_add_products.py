@@ -1,55 +1,71 @@
 from rag_retrieval.db.weaviate_db import WeaviateManager
 from datetime import datetime, timezone
-import os, asyncio
+from rag_retrieval.config.settings import Settings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set
+from weaviate.util import generate_uuid5
+import os, asyncio, argparse, hashlib, queue, threading, time
+import requests
 from dotenv import load_dotenv
-from rag_retrieval.goldenverba.load_data import load_files
+from rag_retrieval.goldenverba.load_data import iter_load_files
 from weaviate.classes.config import Property, DataType
 from goldenverba.components.chunking.MarkdownChunker import MarkdownChunker
 from goldenverba.components.document import Document
-import requests  # dùng cho Ollama summary API
 from model.wrapper.llm_ollama import OllamaChatModel
+from model.wrapper.embedder_ollama import OllamaEmbedder
 
-
-def get_embedding_ollama(text: str, model_name: str = "nomic-embed-text"):
-    """
-    Gọi API của Ollama để tạo vector embedding cho một đoạn text.
-    """
-    try:
-        # Giả sử Ollama đang chạy tại địa chỉ này
-        response = requests.post(
-            "http://10.1.1.237:11434/api/embeddings",
-            json={"model": model_name, "prompt": text},
-        )
-        response.raise_for_status()
-        return response.json()["embedding"]
-    except Exception as e:
-        print(f"❌ Lỗi khi tạo embedding cho text: {e}")
-        return []
-
+# Báo hiệu giai đoạn trước đã xong cho các worker đọc hàng đợi
+_DONE = object()
 
 
 # ==============================================================================
 # GOM FILE CHÍNH VÀ FILE KEYWORD
 # ==============================================================================
-def merge_files(products_data):
-    md_files = [f for f in products_data if f["ext"] == ".md"]
-    merged = []
+# Trường của bản ghi đã gộp -> hậu tố của file đi kèm (keyword, abstract, metadata ...)
+DEFAULT_COMPANION_SUFFIXES = {"kw_text": "_kw.md"}
 
-    for f in md_files:
-        fname = f["filename"].lower()
-        if fname.endswith("_kw.md"):
-            continue  # bỏ file keyword, sẽ gán vào file chính
 
-        # tìm file keyword tương ứng
-        base = fname.replace(".md", "")
-        kw_file = next((k for k in md_files if k["filename"].lower() == f"{base}_kw.md"), None)
+def parse_companion_suffixes(spec: str) -> Dict[str, str]:
+    """"kw_text=_kw.md,abstract_text=_abstract.md" -> {"kw_text": "_kw.md", "abstract_text": "_abstract.md"}"""
+    pairs = [p.split("=", 1) for p in spec.split(",") if "=" in p]
+    return {field.strip(): suffix.strip().lower() for field, suffix in pairs} or dict(DEFAULT_COMPANION_SUFFIXES)
 
-        merged.append({
-            "filename": f["filename"],
-            "text": f["text"],
-            "kw_text": kw_file["text"] if kw_file else "",
-        })
-    return merged
+
+def merge_files(products_data, companion_suffixes: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Gộp mỗi file .md chính với các file đi kèm cùng tên gốc (mặc định "<tên>_kw.md" -> "kw_text").
+    Dùng index theo tên gốc nên tuyến tính theo số file; nhận và trả về dạng stream: một file chính được
+    trả về ngay khi đã đủ mọi file đi kèm, chỉ các nhóm chưa đủ mới phải giữ trong bộ nhớ.
+    File chính thiếu file đi kèm được trả về ở cuối với trường tương ứng rỗng; file đi kèm không có file chính bị bỏ.
+    """
+    suffixes = companion_suffixes or DEFAULT_COMPANION_SUFFIXES
+    pending: Dict[str, Dict[str, Any]] = {}
+
+    def merged(group):
+        return {
+            "filename": group["main"]["filename"],
+            "text": group["main"]["text"],
+            **{field: group.get(field, "") for field in suffixes},
+        }
+
+    for f in products_data:
+        if f["ext"] != ".md":
+            continue
+        fname = f["filename"].lower()
+        field = next((fld for fld, suffix in suffixes.items() if fname.endswith(suffix)), None)
+        if field is not None:
+            base = fname[: -len(suffixes[field])]
+            value = f["text"]
+        else:
+            base, field, value = fname[: -len(".md")], "main", f
+        group = pending.setdefault(base, {})
+        group[field] = value
+        if "main" in group and all(fld in group for fld in suffixes):
+            yield merged(pending.pop(base))
+
+    for group in pending.values():
+        if "main" in group:
+            yield merged(group)
 
 # ==============================================================================
 # CHUNK + EMBEDDING FULL TEXT + SUMMARY + KW
@@ -101,73 +117,324 @@ def merge_files(products_data):
 #                 print(f"   ❌ Lỗi chunk {idx+1}: {e}")
 # run_add_products.py
 
-async def chunk_and_add(manager, merged_files):
-    collection_name = "Papers"
-    print(f"Sẽ thêm {len(merged_files)} file vào collection '{collection_name}'\n")
-    llm = OllamaChatModel(model_name="llama3.2:3b") # Giữ lại để tạo summary
-    
-    for item in merged_files:
-        title = item["filename"]
-        text = item["text"]
-        kw_text = item["kw_text"]
+def summarize_text_ollama(text: str, llm, max_chars: int = 6000) -> str:
+    """Sinh abstract ngắn cho cả file (chỉ gửi `max_chars` ký tự đầu để prompt không vượt context)."""
+    prompt = (
+        "Tóm tắt ngắn gọn nội dung tài liệu dưới đây trong 3-5 câu bằng tiếng Việt. "
+        "Chỉ trả về phần tóm tắt, không thêm lời dẫn.\n\n"
+        f"{text[:max_chars]}"
+    )
+    summary = llm.generate(prompt)
+    return "" if summary.startswith("Lỗi:") else summary
 
-        print(f"→ Đang xử lý file: {title}")
 
-        # Tạo Document để chunk (giữ nguyên)
-        document = Document(title=title, content=text, extension=".md", fileSize=0, labels=[], source="", meta={}, metadata="")
-        chunker = MarkdownChunker()
-        try:
-            chunks = await chunker.chunk(chunker.config, [document])
-        except TypeError:
-            chunks = await chunker.chunk([document])
-
-        # Sinh abstract bằng Ollama (giữ nguyên)
-        abstract = summarize_text_ollama(text, llm)
-
-        # Ghi từng chunk vào Weaviate
-        for idx, chunk in enumerate(document.chunks if hasattr(document, "chunks") and document.chunks else chunks):
-            chunk_text = getattr(chunk, "content", str(chunk))
-            
-            # 1. TẠO EMBEDDING TỪ PHÍA CLIENT
-            # Kết hợp title và nội dung chunk để embedding tốt hơn
-            text_to_embed = f"Tiêu đề: {title}\nNội dung: {chunk_text}"
-            embedding_vector = get_embedding_ollama(text_to_embed)
+def content_hash(*parts: str) -> str:
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
 
-            if not embedding_vector:
-                print(f"   ⚠️ Bỏ qua chunk {idx+1} vì không thể tạo embedding.")
-                continue
 
-            # 2. CHUẨN BỊ DỮ LIỆU
-            chunk_data = {
+def source_hash(item) -> str:
+    # Hash của file nguồn gồm cả các file đi kèm (keyword, abstract, ...)
+    companions = [item[k] for k in sorted(item) if k not in ("filename", "text")]
+    return content_hash(item["filename"], item["text"], *companions)
+
+
+class ThroughputReport:
+    """Đếm số chunk qua từng giai đoạn và in tốc độ (chunk/s) định kỳ."""
+
+    def __init__(self, interval_s: float = 5.0):
+        self.interval_s = interval_s
+        self.counts = {"files": 0, "chunked": 0, "embedded": 0, "written": 0, "updated": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._last_print = self._start
+
+    def add(self, stage: str, n: int = 1):
+        with self._lock:
+            self.counts[stage] += n
+            now = time.monotonic()
+            if now - self._last_print < self.interval_s:
+                return
+            self._last_print = now
+            line = self._line(now)
+        print(line)
+
+    def _line(self, now: float) -> str:
+        elapsed = max(now - self._start, 1e-9)
+        c = self.counts
+        return (f"   ⏱ {elapsed:.1f}s | file: {c['files']} | chunk: {c['chunked']} | embed: {c['embedded']} "
+                f"| ghi: {c['written']} ({c['written'] / elapsed:.1f} chunk/s) "
+                f"| cập nhật: {c['updated']} | lỗi: {c['failed']}")
+
+    def summary(self) -> str:
+        with self._lock:
+            return self._line(time.monotonic())
+
+
+def _chunk_file(item, llm, summarize: bool) -> List[Dict[str, Any]]:
+    title = item["filename"]
+    text = item["text"]
+    kw_text = item.get("kw_text", "")
+
+    # Tạo Document để chunk (giữ nguyên)
+    document = Document(title=title, content=text, extension=".md", fileSize=0, labels=[], source="", meta={}, metadata="")
+    chunker = MarkdownChunker()
+    # Mỗi worker là một thread riêng nên chạy chunker async trong event loop của chính nó
+    try:
+        chunks = asyncio.run(chunker.chunk(chunker.config, [document]))
+    except TypeError:
+        chunks = asyncio.run(chunker.chunk([document]))
+
+    # Dùng file abstract đi kèm nếu có, nếu không thì sinh abstract bằng Ollama
+    abstract = item.get("abstract_text") or (summarize_text_ollama(text, llm) if summarize else "")
+
+    created_date = datetime.now(timezone.utc).isoformat()
+    file_hash = source_hash(item)
+    occurrences = {}
+    records = []
+    for chunk in (document.chunks if hasattr(document, "chunks") and document.chunks else chunks):
+        chunk_text = getattr(chunk, "content", str(chunk))
+        chunk_hash = content_hash(title, chunk_text, kw_text)
+        # uuid cố định theo nội dung chunk => chunk không đổi giữa hai lần nạp giữ nguyên uuid (và vector)
+        occurrence = occurrences.get(chunk_hash, 0)
+        occurrences[chunk_hash] = occurrence + 1
+        records.append({
+            "uuid": generate_uuid5(f"{chunk_hash}:{occurrence}", title),
+            # Kết hợp title và nội dung chunk để embedding tốt hơn
+            "embed_text": f"Tiêu đề: {title}\nNội dung: {chunk_text}",
+            "properties": {
                 "title": title,
                 "abstract": abstract,
                 "text": chunk_text,
                 "keywords": [kw_text] if kw_text else [],
-                "created_date": datetime.now(timezone.utc).isoformat(),
-            }
+                "created_date": created_date,
+                "source_hash": file_hash,
+                "chunk_hash": chunk_hash,
+            },
+        })
+    return records
 
-            # 3. GỬI DỮ LIỆU KÈM VECTOR
+
+class SyncPlan:
+    """
+    So sánh hash file nguồn / chunk với dữ liệu đang có trong Weaviate, từng file một khi file được stream tới:
+    file thêm mới, thay đổi, không đổi, bị xóa; chunk cần embed, chỉ cần cập nhật, và uuid cần xóa.
+    Chỉ giữ tên file đã thấy, không giữ nội dung file hay chunk.
+    """
+
+    def __init__(self, existing: Dict[str, Dict[str, Any]]):
+        self.existing = existing
+        self.added: List[str] = []
+        self.changed: List[str] = []
+        self.removed: List[str] = []
+        self.unchanged = 0
+        self.embed_chunks = 0
+        self.update_chunks = 0
+        self.delete_uuids: List[str] = []
+        self._seen: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def is_unchanged(self, item) -> bool:
+        """Ghi nhận file; True nếu file nguồn (kể cả file đi kèm) không đổi nên không cần chunk lại."""
+        state = self.existing.get(item["filename"])
+        unchanged = state is not None and state["source_hashes"] == {source_hash(item)}
+        with self._lock:
+            self._seen.add(item["filename"])
+            if unchanged:
+                self.unchanged += 1
+        return unchanged
+
+    def diff(self, item, records: List[Dict[str, Any]]) -> Set[str]:
+        """Ghi nhận chunk của file thêm mới / thay đổi; trả về uuid đã có trong Weaviate (chỉ cần cập nhật)."""
+        state = self.existing.get(item["filename"])
+        new_uuids = {r["uuid"] for r in records}
+        old_uuids = set(state["uuids"]) if state is not None else set()
+        with self._lock:
+            (self.added if state is None else self.changed).append(item["filename"])
+            self.embed_chunks += len(new_uuids - old_uuids)
+            self.update_chunks += len(new_uuids & old_uuids)
+            self.delete_uuids.extend(sorted(old_uuids - new_uuids))
+        return new_uuids & old_uuids
+
+    def finish(self):
+        """Gọi sau khi hết stream: nguồn không còn file cục bộ thì xóa toàn bộ chunk của nó."""
+        for name, state in self.existing.items():
+            if name not in self._seen:
+                self.removed.append(name)
+                self.delete_uuids.extend(state["uuids"])
+
+
+def chunk_and_add(manager, merged_files, collection_name: str = "Papers",
+                  file_workers: int = 4, embed_workers: int = 2, embed_batch_size: int = 64,
+                  write_batch_size: int = 200, queue_size: int = 1000, summarize: bool = True,
+                  progress_interval_s: float = 5.0, sync: Optional[SyncPlan] = None) -> Dict[str, int]:
+    """
+    Nạp dữ liệu theo pipeline 3 giai đoạn nối bằng hàng đợi có giới hạn (giai đoạn sau chậm thì giai đoạn trước chờ):
+      1. `file_workers` thread chunk file + sinh abstract,
+      2. `embed_workers` thread gom `embed_batch_size` chunk cho mỗi lần gọi /api/embed,
+      3. một thread ghi Weaviate bằng insert_many theo lô `write_batch_size`.
+    Với `sync` (chế độ incremental) mỗi file được so với dữ liệu đang có ngay khi stream tới: file không đổi bị bỏ qua
+    trước khi chunk, chunk đã có sẵn trong Weaviate không embed lại mà chỉ cập nhật abstract và hash nguồn.
+    """
+    print(f"Bắt đầu thêm file vào collection '{collection_name}'\n")
+    # Cùng model với lúc truy vấn để embedding của chunk và câu hỏi nằm chung một không gian
+    llm = OllamaChatModel(model_name=Settings.CHAT_MODEL) # Giữ lại để tạo summary
+    embedder = OllamaEmbedder(model_name=Settings.EMBED_MODEL, batch_size=embed_batch_size, pool_size=embed_workers)
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    report = ThroughputReport(progress_interval_s)
+
+    def process_file(item):
+        if sync is not None and sync.is_unchanged(item):
+            return
+        print(f"→ Đang xử lý file: {item['filename']}")
+        try:
+            records = _chunk_file(item, llm, summarize)
+        except Exception as e:
+            print(f"   ⚠️ Bỏ qua file {item['filename']}: {e}")
+            return
+        known_uuids = sync.diff(item, records) if sync is not None else set()
+        for record in records:
+            if record["uuid"] not in known_uuids:
+                chunk_queue.put(record)
+                continue
+            props = record["properties"]
             try:
-                # Gọi hàm add đã được sửa đổi, truyền cả vector vào
-                manager.add(
-                    collection_name=collection_name, 
-                    properties=chunk_data, 
-                    vector=embedding_vector
-                )
-                print(f"   ✅ Chunk {idx+1} added with its own vector.")
+                manager.update_properties(collection_name, record["uuid"],
+                                          {"abstract": props["abstract"], "source_hash": props["source_hash"]})
+                report.add("updated")
             except Exception as e:
-                print(f"   ❌ Lỗi chunk {idx+1}: {e}")
+                print(f"   ❌ Lỗi cập nhật chunk {record['uuid']}: {e}")
+                report.add("failed")
+        report.add("files")
+        report.add("chunked", len(records))
+
+    def embed_batch(batch):
+        try:
+            vectors = embedder.embed_many([r["embed_text"] for r in batch])
+        except Exception as e:
+            print(f"   ⚠️ Bỏ qua {len(batch)} chunk vì không thể tạo embedding: {e}")
+            report.add("failed", len(batch))
+            return
+        for record, vector in zip(batch, vectors):
+            write_queue.put((record["properties"], vector, record["uuid"]))
+        report.add("embedded", len(batch))
+
+    def embed_worker():
+        batch = []
+        while True:
+            record = chunk_queue.get()
+            if record is _DONE:
+                break
+            batch.append(record)
+            if len(batch) >= embed_batch_size:
+                embed_batch(batch)
+                batch = []
+        if batch:
+            embed_batch(batch)
+
+    def write_batch(batch):
+        try:
+            failed = manager.add_many(collection_name, batch)
+        except Exception as e:
+            print(f"   ❌ Lỗi ghi {len(batch)} chunk: {e}")
+            failed = len(batch)
+        report.add("written", len(batch) - failed)
+        if failed:
+            report.add("failed", failed)
+
+    def write_worker():
+        batch = []
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= write_batch_size:
+                write_batch(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+
+    writer = threading.Thread(target=write_worker, name="ingest-writer")
+    embedders = [threading.Thread(target=embed_worker, name=f"ingest-embed-{i}") for i in range(embed_workers)]
+    writer.start()
+    for t in embedders:
+        t.start()
+
+    # merged_files có thể là generator: chỉ lấy file tiếp theo khi có chỗ, không đọc trước cả thư mục
+    slots = threading.BoundedSemaphore(2 * file_workers)
+
+    def process_and_release(item):
+        try:
+            process_file(item)
+        finally:
+            slots.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=file_workers, thread_name_prefix="ingest-file") as pool:
+            for item in merged_files:
+                slots.acquire()
+                pool.submit(process_and_release, item)
+    finally:
+        # Mỗi giai đoạn kết thúc (kể cả khi đọc file lỗi) thì báo cho giai đoạn sau, để các thread không chờ mãi
+        for _ in embedders:
+            chunk_queue.put(_DONE)
+        for t in embedders:
+            t.join()
+        write_queue.put(_DONE)
+        writer.join()
+
+    print(f"\nTổng kết:\n{report.summary()}")
+    return dict(report.counts)
+
+
+def plan_sync(manager, collection_name: str, merged_files) -> SyncPlan:
+    """Dry-run: chỉ chunk (không gọi LLM/embedding) từng file thay đổi để tính các thay đổi sẽ thực hiện."""
+    plan = SyncPlan(manager.source_index(collection_name))
+    for item in merged_files:
+        if not plan.is_unchanged(item):
+            plan.diff(item, _chunk_file(item, llm=None, summarize=False))
+    plan.finish()
+    return plan
+
+
+def print_sync_plan(plan: SyncPlan):
+    for label, names in (("Thêm mới", plan.added), ("Thay đổi", plan.changed), ("Bị xóa", plan.removed)):
+        print(f"   {label}: {len(names)} file" + (f" ({', '.join(names)})" if names else ""))
+    print(f"   Không đổi: {plan.unchanged} file")
+    print(f"   Chunk cần embed: {plan.embed_chunks} | chỉ cập nhật: {plan.update_chunks} "
+          f"| cần xóa: {len(plan.delete_uuids)}")
+
+def invalidate_answer_cache(collection_name: str):
+    """
+    Báo app xóa cache câu trả lời của collection vừa nạp (cần ADMIN_TOKEN giống app);
+    app không chạy hoặc không gọi được thì fingerprint sẽ phát hiện thay đổi sau.
+    """
+    if not Settings.ANSWER_CACHE_INVALIDATE_URL or not Settings.ADMIN_TOKEN:
+        return
+    try:
+        response = requests.post(Settings.ANSWER_CACHE_INVALIDATE_URL, json={"collection": collection_name},
+                                 headers={"X-Admin-Token": Settings.ADMIN_TOKEN}, timeout=5)
+        response.raise_for_status()
+        print(f"   🧹 Đã xóa {response.json().get('invalidated', 0)} câu trả lời trong cache.")
+    except requests.RequestException as e:
+        print(f"   ⚠️ Không xóa được cache câu trả lời ({Settings.ANSWER_CACHE_INVALIDATE_URL}): {e}")
 
 # ==============================================================================
 # MAIN
 # ==============================================================================
 if __name__ == "__main__":
     load_dotenv()
+    parser = argparse.ArgumentParser(description="Nạp dữ liệu sản phẩm vào Weaviate")
+    # incremental: chỉ embed/ghi chunk của file thay đổi và xóa chunk cũ; full: xóa và nạp lại toàn bộ collection
+    parser.add_argument("--mode", choices=["incremental", "full"], default=Settings.INGEST_MODE)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in các thay đổi sẽ thực hiện (chế độ incremental)")
+    args = parser.parse_args()
     print("--- Bắt đầu quá trình embedding full text ---")
 
     md_folder = "data"
-    products_data = load_files(md_folder)
-    merged_files = merge_files(products_data)
+    products_data = iter_load_files(md_folder, max_workers=Settings.LOAD_MAX_WORKERS or None)
+    merged_files = merge_files(products_data, parse_companion_suffixes(Settings.MERGE_COMPANION_SUFFIXES))
 
     try:
         with WeaviateManager(host="localhost") as manager:
@@ -178,12 +445,43 @@ if __name__ == "__main__":
                 Property(name="keywords", data_type=DataType.TEXT_ARRAY),
                 Property(name="content", data_type=DataType.TEXT),
                 Property(name="created_date", data_type=DataType.DATE),
+                Property(name="source_hash", data_type=DataType.TEXT),
+                Property(name="chunk_hash", data_type=DataType.TEXT),
             ]
-            print(f"[1/2] Tạo lại collection '{collection_name}' ...")
-            manager.create_collection(name=collection_name, properties=properties, force_recreate=True)
-            print(f"✅ Collection '{collection_name}' sẵn sàng.\n")
+            ingest_kwargs = dict(
+                file_workers=Settings.INGEST_FILE_WORKERS,
+                embed_workers=Settings.INGEST_EMBED_WORKERS,
+                embed_batch_size=Settings.INGEST_EMBED_BATCH_SIZE,
+                write_batch_size=Settings.INGEST_WRITE_BATCH_SIZE,
+                queue_size=Settings.INGEST_QUEUE_SIZE,
+                summarize=Settings.INGEST_SUMMARIZE
+            )
 
-            asyncio.run(chunk_and_add(manager, merged_files))
+            if args.mode == "full":
+                print(f"[1/2] Tạo lại collection '{collection_name}' ...")
+                manager.create_collection(name=collection_name, properties=properties, force_recreate=True)
+                print(f"✅ Collection '{collection_name}' sẵn sàng.\n")
+                chunk_and_add(manager, merged_files, collection_name, **ingest_kwargs)
+                invalidate_answer_cache(collection_name)
+            elif args.dry_run:
+                print(f"So sánh dữ liệu với collection '{collection_name}' ...")
+                print_sync_plan(plan_sync(manager, collection_name, merged_files))
+            else:
+                manager.create_collection(name=collection_name, properties=properties)
+                manager.ensure_properties(collection_name, properties)
+                print(f"[1/2] Đồng bộ các file thay đổi vào collection '{collection_name}' ...")
+                # Mỗi file được so sánh và nạp ngay khi đọc tới; nguồn bị xóa chỉ biết được sau khi hết stream
+                plan = SyncPlan(manager.source_index(collection_name))
+                counts = chunk_and_add(manager, merged_files, collection_name, sync=plan, **ingest_kwargs)
+                plan.finish()
+                print_sync_plan(plan)
+                deleted = 0
+                if plan.delete_uuids:
+                    print("[2/2] Xóa chunk cũ ...")
+                    deleted = manager.delete_many(collection_name, plan.delete_uuids)
+                    print(f"   🗑 Đã xóa {deleted} chunk cũ.")
+                if counts.get("written") or counts.get("updated") or deleted:
+                    invalidate_answer_cache(collection_name)
 
     except ConnectionError as ce:
         print("Lỗi kết nối Weaviate:", ce)
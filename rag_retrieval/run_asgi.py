@@ -0,0 +1,8 @@
+import uvicorn
+from application.asgi import create_asgi_app
+from rag_retrieval.config.settings import Settings
+
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    uvicorn.run("run_asgi:app", host="0.0.0.0", port=Settings.RAG_ASGI_PORT, workers=Settings.RAG_ASGI_WORKERS)
@@ -0,0 +1,94 @@
+"""
+So sánh reranker ONNX Runtime (int8) với reranker PyTorch: độ trễ và mức độ trùng khớp top-k.
+
+    python rag_retrieval/run_benchmark_reranker.py --torch-provider bge --model BAAI/bge-reranker-v2-m3
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+from rag_retrieval.model.model_factory import get_reranker
+
+
+DEFAULT_QUERIES = [
+    "Điều kiện vay vốn kinh doanh là gì?",
+    "Lãi suất thẻ tín dụng bao nhiêu?",
+    "Hồ sơ mở thẻ cần những giấy tờ gì?",
+]
+
+
+def load_documents(data_dir: str, min_chars: int = 50):
+    """Tách các file markdown thành đoạn văn để làm tập tài liệu rerank."""
+    documents = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            for block in f.read().split("\n\n"):
+                block = block.strip()
+                if len(block) >= min_chars:
+                    documents.append(block)
+    return documents
+
+
+def benchmark(reranker, queries, documents, top_k, runs):
+    latencies_ms, rankings = [], []
+    reranker.rerank(queries[0], documents, top_k=top_k)  # warm-up
+    for q in queries:
+        per_query = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            results = reranker.rerank(q, documents, top_k=top_k)
+            per_query.append((time.perf_counter() - start) * 1000)
+        latencies_ms.append(statistics.median(per_query))
+        rankings.append([idx for idx, _, _ in results])
+    return latencies_ms, rankings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="BAAI/bge-reranker-v2-m3")
+    parser.add_argument("--torch-provider", default="bge", choices=["bge", "jina"])
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(__file__), "data"))
+    parser.add_argument("--queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--onnx-dir", default=None)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    parser.add_argument("--inter-op-threads", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = load_documents(args.data_dir)
+    if not documents:
+        raise SystemExit(f"Không tìm thấy tài liệu trong '{args.data_dir}'.")
+    print(f"{len(documents)} tài liệu, {len(args.queries)} truy vấn, top_k={args.top_k}\n")
+
+    common = {"batch_size": args.batch_size, "max_length": args.max_length}
+    torch_reranker = get_reranker(args.torch_provider, args.model, **common)
+    onnx_reranker = get_reranker(
+        "onnx", args.model,
+        onnx_dir=args.onnx_dir,
+        quantize=not args.no_quantize,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        **common
+    )
+
+    torch_ms, torch_rank = benchmark(torch_reranker, args.queries, documents, args.top_k, args.runs)
+    onnx_ms, onnx_rank = benchmark(onnx_reranker, args.queries, documents, args.top_k, args.runs)
+
+    overlaps = [len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(torch_rank, onnx_rank)]
+    top1 = [bool(a and b and a[0] == b[0]) for a, b in zip(torch_rank, onnx_rank)]
+
+    print(f"{'backend':<10}{'p50 ms':>10}{'max ms':>10}")
+    print(f"{'torch':<10}{statistics.median(torch_ms):>10.1f}{max(torch_ms):>10.1f}")
+    print(f"{'onnx':<10}{statistics.median(onnx_ms):>10.1f}{max(onnx_ms):>10.1f}")
+    print(f"\nSpeedup p50: {statistics.median(torch_ms) / statistics.median(onnx_ms):.2f}x")
+    print(f"Top-{args.top_k} overlap trung bình: {statistics.mean(overlaps):.2%}")
+    print(f"Top-1 trùng khớp: {sum(top1)}/{len(top1)}")
+
+
+if __name__ == "__main__":
+    main()
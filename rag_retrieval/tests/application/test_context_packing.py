@@ -0,0 +1,71 @@
+from rag_retrieval.application.context_packing import pack_context, split_sentences
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def doc(title, content, score, **fields):
+    return {"title": title, "content": content, "reranker_score": score, **fields}
+
+
+def test_split_sentences():
+    """Tách câu sau dấu kết thúc câu và ở xuống dòng"""
+    assert split_sentences("Một. Hai? Ba!\nBốn… Năm") == ["Một.", "Hai?", "Ba!", "Bốn…", "Năm"]
+    assert split_sentences(None) == []
+
+
+def test_pack_context_orders_by_reranker_score():
+    """Không giới hạn token: mọi tài liệu được đưa vào theo điểm reranker giảm dần"""
+    docs = [
+        doc("Thấp", "Câu của tài liệu thấp.", 0.1),
+        doc("Cao", "Câu của tài liệu cao.", 0.9, keywords=["a", "b"], abstract="Tóm tắt ngắn"),
+    ]
+
+    context, stats = pack_context(docs, count_words)
+
+    assert context.index("Nguồn tài liệu 1: Cao") < context.index("Nguồn tài liệu 2: Thấp")
+    assert "Từ khóa: a, b\n" in context
+    assert "Tóm tắt: Tóm tắt ngắn\n" in context
+    assert stats["num_context_docs"] == 2
+    assert stats["num_context_truncated_docs"] == 0
+    assert stats["context_token_budget"] == 0
+    assert stats["context_tokens"] == count_words(context)
+
+
+def test_pack_context_drops_overlapping_sentences():
+    """Câu đã có ở chunk trước (chunk chồng lấn) bị bỏ, tài liệu chỉ còn câu trùng thì bị loại"""
+    docs = [
+        doc("Chunk 1", "Câu thứ nhất khá dài. Câu thứ hai cũng khá dài.", 0.9),
+        doc("Chunk 2", "Câu thứ hai cũng khá dài. Câu thứ ba mới hoàn toàn.", 0.8),
+        doc("Chunk 3", "Câu thứ nhất khá dài.", 0.7),
+    ]
+
+    context, stats = pack_context(docs, count_words)
+
+    assert context.count("Câu thứ hai cũng khá dài.") == 1
+    assert "Câu thứ ba mới hoàn toàn." in context
+    assert "Chunk 3" not in context
+    assert stats["num_context_docs"] == 2
+    assert stats["num_context_deduplicated_sentences"] == 2
+
+
+def test_pack_context_truncates_at_sentence_boundary():
+    """Hết ngân sách thì nội dung bị cắt ở ranh giới câu và không vượt max_tokens"""
+    docs = [doc("A", "Một hai ba bốn. Năm sáu bảy tám. Chín mười mười một mười hai.", 1.0)]
+
+    context, stats = pack_context(docs, count_words, max_tokens=16)
+
+    assert "Một hai ba bốn. Năm sáu bảy tám.\n" in context
+    assert "Chín" not in context
+    assert stats["num_context_truncated_docs"] == 1
+    assert stats["context_tokens"] <= 16
+
+
+def test_pack_context_budget_too_small():
+    """Không đủ chỗ cho tiêu đề nguồn thì bối cảnh rỗng"""
+    context, stats = pack_context([doc("A", "Nội dung.", 1.0)], count_words, max_tokens=3)
+
+    assert context == ""
+    assert stats["num_context_docs"] == 0
+    assert stats["context_tokens"] == 0
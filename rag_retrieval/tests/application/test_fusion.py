@@ -0,0 +1,89 @@
+import pytest
+from rag_retrieval.application.fusion import (
+    comb_max,
+    comb_mnz,
+    comb_sum,
+    fuse_rank_lists,
+    rrf,
+)
+
+
+def hit(doc_id, score, **properties):
+    return {"id": doc_id, "combined_score": score, "properties": properties}
+
+
+RANK_LISTS = [
+    [hit("a", 0.9, title="A"), hit("b", 0.5), hit("c", 0.1)],
+    [hit("b", 30.0, title="B"), hit("d", 20.0), hit("a", 10.0)],
+]
+
+
+def test_rrf_uses_ranks_only():
+    """RRF cộng 1/(k + rank) của mỗi danh sách, không phụ thuộc thang điểm"""
+    fused = rrf(RANK_LISTS, k=60)
+
+    assert fused["a"] == pytest.approx(1 / 61 + 1 / 63)
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused["c"] == pytest.approx(1 / 63)
+    assert fused["d"] == pytest.approx(1 / 62)
+
+
+def test_comb_sum_normalizes_each_list():
+    """CombSUM chuẩn hóa min-max từng danh sách rồi cộng"""
+    fused = comb_sum(RANK_LISTS)
+
+    assert fused["a"] == pytest.approx(1.0 + 0.0)
+    assert fused["b"] == pytest.approx(0.5 + 1.0)
+    assert fused["c"] == pytest.approx(0.0)
+    assert fused["d"] == pytest.approx(0.5)
+
+
+def test_comb_sum_equal_scores_and_empty_lists():
+    """Danh sách có điểm bằng nhau được chuẩn hóa thành 1, danh sách rỗng bị bỏ qua"""
+    fused = comb_sum([[hit("a", 0.3), hit("b", 0.3)], []])
+
+    assert fused == {"a": 1.0, "b": 1.0}
+
+
+def test_comb_mnz_multiplies_by_hit_count():
+    """CombMNZ nhân điểm CombSUM với số danh sách chứa tài liệu"""
+    fused = comb_mnz(RANK_LISTS)
+
+    assert fused["b"] == pytest.approx((0.5 + 1.0) * 2)
+    assert fused["d"] == pytest.approx(0.5)
+
+
+def test_comb_max_keeps_best_raw_score():
+    """max giữ combined_score gốc cao nhất của mỗi tài liệu"""
+    fused = comb_max(RANK_LISTS)
+
+    assert fused == {"a": 10.0, "b": 30.0, "c": 0.1, "d": 20.0}
+
+
+def test_fuse_rank_lists_sorts_and_truncates():
+    """Ứng viên được sắp theo điểm fuse giảm dần và cắt ở candidate_pool"""
+    candidates = fuse_rank_lists(RANK_LISTS, strategy="combsum", candidate_pool=2)
+
+    assert [c["id"] for c in candidates] == ["b", "a"]
+    assert candidates[0]["combined_score"] == pytest.approx(1.5)
+
+
+def test_fuse_rank_lists_keeps_first_properties():
+    """properties của tài liệu lấy từ lần xuất hiện đầu tiên"""
+    candidates = {c["id"]: c for c in fuse_rank_lists(RANK_LISTS, strategy="RRF")}
+
+    assert candidates["a"]["properties"] == {"title": "A"}
+    assert candidates["b"]["properties"] == {}
+
+
+def test_fuse_rank_lists_rrf_k():
+    """rrf_k được truyền vào RRF"""
+    candidates = fuse_rank_lists([[hit("a", 1.0)]], strategy="rrf", rrf_k=10)
+
+    assert candidates[0]["combined_score"] == pytest.approx(1 / 11)
+
+
+def test_fuse_rank_lists_unknown_strategy():
+    """Chiến lược không hỗ trợ báo ValueError"""
+    with pytest.raises(ValueError):
+        fuse_rank_lists(RANK_LISTS, strategy="borda")
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+from rag_retrieval.model import score_cache
+from rag_retrieval.model.score_cache import RerankScoreCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Thời điểm last_used cố định, tăng dần"""
+    now = iter(range(1, 1000))
+    monkeypatch.setattr(score_cache.time, "time", lambda: float(next(now)))
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Điểm đã ghi được đọc lại từ SQLite khi cache trong bộ nhớ trống"""
+    path = str(tmp_path / "scores.sqlite")
+    cache = RerankScoreCache(10, path)
+    cache.put_many([("a", 0.5), ("b", 0.25)])
+    cache.close()
+
+    cache = RerankScoreCache(10, path)
+    assert cache.get_many(["a", "b", "c"]) == {"a": 0.5, "b": 0.25}
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.close()
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path, clock):
+    """Vượt max_disk_entries thì xóa các điểm lâu không dùng nhất xuống còn 90%"""
+    path = str(tmp_path / "scores.sqlite")
+    cache = RerankScoreCache(1, path, max_disk_entries=10)
+    for i in range(10):
+        cache.put_many([(str(i), float(i))])
+    # Chỉ còn "9" trong bộ nhớ, "0" được đọc lại từ đĩa nên thành mới dùng gần đây
+    assert cache.get_many(["0"]) == {"0": 0.0}
+    cache.put_many([("10", 10.0), ("10", 10.0)])
+
+    assert cache._disk_entries == 9
+    remaining = {key for (key,) in sqlite3.connect(path).execute("SELECT key FROM rerank_scores")}
+    assert remaining == {"0", "3", "4", "5", "6", "7", "8", "9", "10"}
+    cache.close()
+
+
+def test_disk_tier_upgrades_old_schema(tmp_path):
+    """File cache cũ (chưa có last_used) vẫn dùng được"""
+    path = str(tmp_path / "scores.sqlite")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE rerank_scores (key TEXT PRIMARY KEY, score REAL)")
+    db.execute("INSERT INTO rerank_scores VALUES ('a', 0.5)")
+    db.commit()
+    db.close()
+
+    cache = RerankScoreCache(10, path, max_disk_entries=10)
+    cache.put_many([("b", 0.25)])
+
+    assert cache._disk_entries == 2
+    assert cache.get_many(["a"]) == {"a": 0.5}
+    cache.close()
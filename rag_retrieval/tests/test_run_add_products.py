@@ -0,0 +1,189 @@
+import pytest
+import run_add_products
+from run_add_products import SyncPlan, chunk_and_add, merge_files, parse_companion_suffixes, plan_sync, source_hash
+
+
+class FakeManager:
+    def __init__(self, index):
+        self.index = index
+        self.added = []
+        self.updated = []
+
+    def source_index(self, collection_name):
+        return self.index
+
+    def add_many(self, collection_name, batch):
+        self.added.extend(uuid for _, _, uuid in batch)
+        return 0
+
+    def update_properties(self, collection_name, uuid, properties):
+        self.updated.append(uuid)
+
+
+class FakeEmbedder:
+    def __init__(self, **kwargs):
+        pass
+
+    def embed_many(self, texts):
+        return [[0.0] for _ in texts]
+
+
+# Tên các file đã được chunk
+chunked = []
+
+
+def fake_chunk_file(item, llm, summarize):
+    # Mỗi đoạn văn là một chunk, uuid cố định theo nội dung như _chunk_file
+    chunked.append(item["filename"])
+    return [
+        {"uuid": f"{item['filename']}/{part}", "embed_text": part,
+         "properties": {"abstract": "", "source_hash": source_hash(item)}}
+        for part in item["text"].split("\n\n")
+    ]
+
+
+@pytest.fixture(autouse=True)
+def paragraph_chunker(monkeypatch):
+    chunked.clear()
+    monkeypatch.setattr(run_add_products, "_chunk_file", fake_chunk_file)
+    monkeypatch.setattr(run_add_products, "OllamaChatModel", lambda **kwargs: None)
+    monkeypatch.setattr(run_add_products, "OllamaEmbedder", FakeEmbedder)
+
+
+def product(filename, text, kw_text=""):
+    return {"filename": filename, "text": text, "kw_text": kw_text}
+
+
+SAME = product("same.md", "A\n\nB")
+EDITED = product("edited.md", "giữ\n\nmới", kw_text="kw")
+NEW = product("new.md", "X\n\nY\n\nZ")
+
+
+def existing_index():
+    return {
+        "same.md": {"source_hashes": {source_hash(SAME)}, "uuids": ["same.md/A", "same.md/B"]},
+        "edited.md": {"source_hashes": {"cũ"}, "uuids": ["edited.md/giữ", "edited.md/cũ"]},
+        "gone.md": {"source_hashes": {"h"}, "uuids": ["gone.md/1", "gone.md/2"]},
+    }
+
+
+def test_plan_sync_classifies_files():
+    """File thêm mới / thay đổi / không đổi / bị xóa và các uuid cần embed, cập nhật, xóa"""
+    plan = plan_sync(FakeManager(existing_index()), "Papers", iter([SAME, EDITED, NEW]))
+
+    assert plan.added == ["new.md"]
+    assert plan.changed == ["edited.md"]
+    assert plan.unchanged == 1
+    assert plan.removed == ["gone.md"]
+    assert plan.embed_chunks == 1 + 3
+    assert plan.update_chunks == 1
+    assert plan.delete_uuids == ["edited.md/cũ", "gone.md/1", "gone.md/2"]
+    assert chunked == ["edited.md", "new.md"]
+
+
+def test_sync_chunks_each_changed_file_once():
+    """Incremental: file được so sánh khi stream tới, chỉ file thay đổi được chunk (một lần) rồi embed/ghi"""
+    manager = FakeManager(existing_index())
+    plan = SyncPlan(manager.index)
+
+    counts = chunk_and_add(manager, iter([SAME, EDITED, NEW]), sync=plan, file_workers=1, embed_workers=1,
+                           summarize=False, progress_interval_s=3600)
+    plan.finish()
+
+    assert sorted(chunked) == ["edited.md", "new.md"]
+    assert sorted(manager.added) == ["edited.md/mới", "new.md/X", "new.md/Y", "new.md/Z"]
+    assert manager.updated == ["edited.md/giữ"]
+    assert counts["files"] == 2
+    assert plan.removed == ["gone.md"]
+    assert sorted(plan.delete_uuids) == ["edited.md/cũ", "gone.md/1", "gone.md/2"]
+
+
+def test_plan_sync_companion_change_marks_file_changed():
+    """Chỉ file keyword đi kèm thay đổi cũng làm file thay đổi, chunk giữ uuid thì chỉ cập nhật"""
+    old = product("a.md", "A", kw_text="cũ")
+    manager = FakeManager({"a.md": {"source_hashes": {source_hash(old)}, "uuids": ["a.md/A"]}})
+
+    plan = plan_sync(manager, "Papers", [product("a.md", "A", kw_text="mới")])
+
+    assert plan.changed == ["a.md"]
+    assert plan.embed_chunks == 0
+    assert plan.update_chunks == 1
+    assert plan.delete_uuids == []
+
+
+def test_plan_sync_mixed_source_hashes_is_changed():
+    """Chunk của một file mang nhiều hash nguồn (lần nạp trước bị dở dang) thì file được nạp lại"""
+    item = product("a.md", "A")
+    manager = FakeManager({"a.md": {"source_hashes": {source_hash(item), "cũ"}, "uuids": ["a.md/A"]}})
+
+    plan = plan_sync(manager, "Papers", [item])
+
+    assert plan.changed == ["a.md"]
+    assert plan.unchanged == 0
+
+
+def test_plan_sync_empty_collection():
+    """Collection rỗng: mọi file đều là thêm mới"""
+    plan = plan_sync(FakeManager({}), "Papers", [product("a.md", "A\n\nB")])
+
+    assert plan.added == ["a.md"]
+    assert plan.embed_chunks == 2
+    assert plan.delete_uuids == []
+
+
+def loaded(filename, text=""):
+    return {"filename": filename, "ext": "." + filename.rsplit(".", 1)[-1].lower(), "text": text}
+
+
+def test_merge_files_streams_complete_groups():
+    """File chính được trả về ngay khi đủ file đi kèm, không đọc trước phần còn lại"""
+    consumed = []
+
+    def files():
+        for f in [loaded("a.md", "A"), loaded("a_kw.md", "kw A"), loaded("b.md", "B"), loaded("b_kw.md", "kw B")]:
+            consumed.append(f["filename"])
+            yield f
+
+    merged = merge_files(files())
+
+    assert next(merged) == {"filename": "a.md", "text": "A", "kw_text": "kw A"}
+    assert consumed == ["a.md", "a_kw.md"]
+    assert list(merged) == [{"filename": "b.md", "text": "B", "kw_text": "kw B"}]
+
+
+def test_merge_files_companion_before_main():
+    """File đi kèm đến trước file chính, tên file không phân biệt hoa thường"""
+    merged = list(merge_files([loaded("Paper_KW.md", "kw"), loaded("Paper.MD", "nội dung")]))
+
+    assert merged == [{"filename": "Paper.MD", "text": "nội dung", "kw_text": "kw"}]
+
+
+def test_merge_files_incomplete_groups():
+    """File chính thiếu file đi kèm được trả về cuối cùng, file đi kèm mồ côi và file không phải .md bị bỏ"""
+    merged = list(merge_files([
+        loaded("a.md", "A"),
+        loaded("orphan_kw.md", "kw"),
+        loaded("notes.txt", "txt"),
+        loaded("b.md", "B"),
+        loaded("b_kw.md", "kw B"),
+    ]))
+
+    assert merged == [
+        {"filename": "b.md", "text": "B", "kw_text": "kw B"},
+        {"filename": "a.md", "text": "A", "kw_text": ""},
+    ]
+
+
+def test_merge_files_multiple_companions():
+    """Nhóm chỉ hoàn chỉnh khi có đủ mọi loại file đi kèm"""
+    suffixes = parse_companion_suffixes("kw_text=_kw.md, abstract_text=_Abstract.md")
+    merged = merge_files(iter([loaded("a.md", "A"), loaded("a_kw.md", "kw"), loaded("a_abstract.md", "abs")]), suffixes)
+
+    assert suffixes == {"kw_text": "_kw.md", "abstract_text": "_abstract.md"}
+    assert list(merged) == [{"filename": "a.md", "text": "A", "kw_text": "kw", "abstract_text": "abs"}]
+
+
+def test_parse_companion_suffixes_default():
+    """Cấu hình rỗng hoặc sai định dạng thì dùng hậu tố mặc định"""
+    assert parse_companion_suffixes("") == {"kw_text": "_kw.md"}
+    assert parse_companion_suffixes("kw_text") == {"kw_text": "_kw.md"}